@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from metrics import REGISTRY
+from update_processor import hand_off_update
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "timetable_admission_active",
+    "Heavy jobs currently holding a concurrency slot"
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "timetable_admission_queued",
+    "Heavy jobs waiting for a concurrency slot"
+)
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "timetable_admission_wait_seconds",
+    "Time heavy jobs spent queued before starting"
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "timetable_admission_rejected_total",
+    "Jobs rejected because the user's queue was full"
+)
+ADMISSION_SUPERSEDED = REGISTRY.counter(
+    "timetable_admission_superseded_total",
+    "Jobs cancelled because the same user sent a newer one"
+)
+
+Handler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]
+
+
+class _Ticket:
+    def __init__(self, user_id: int, kind: str):
+        self.user_id = user_id
+        self.kind = kind
+        self.task = asyncio.current_task()
+        self.granted = asyncio.Event()
+        self.superseded = False
+        self.created = time.perf_counter()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 8, max_queue_per_user: int = 3):
+        """
+        Admit heavy handler work (OCR, LLM, embedding) under a global concurrency
+        limit, with one job at a time per user and fair ordering between users
+
+        Args:
+            max_concurrent (int): Jobs allowed to run at once across all users
+            max_queue_per_user (int): Jobs a single user may have queued or running
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue_per_user = max(1, max_queue_per_user)
+
+        self._active = 0
+        # Only the head of each user's queue waits here, so a busy user cannot starve others
+        self._ready: Deque[_Ticket] = deque()
+        self._user_queues: Dict[int, Deque[_Ticket]] = {}
+        # Set when a user's queue empties, for updates waiting their turn behind it
+        self._idle: Dict[int, asyncio.Event] = {}
+
+    def queue_position(self, ticket: _Ticket) -> int:
+        """
+        1-based position of a waiting job, counting jobs ahead of it across all users
+        """
+        if ticket in self._ready:
+            return self._ready.index(ticket) + 1
+        user_queue = self._user_queues.get(ticket.user_id, deque())
+        ahead_in_user = list(user_queue).index(ticket) if ticket in user_queue else 0
+        return len(self._ready) + ahead_in_user
+
+    def pending_for_user(self, user_id: int) -> int:
+        return len(self._user_queues.get(user_id, ()))
+
+    def _submit(self, ticket: _Ticket) -> None:
+        user_queue = self._user_queues.setdefault(ticket.user_id, deque())
+        user_queue.append(ticket)
+        if len(user_queue) == 1:
+            self._ready.append(ticket)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrent and self._ready:
+            ticket = self._ready.popleft()
+            self._active += 1
+            ticket.granted.set()
+        self._update_gauges()
+
+    def _finish(self, ticket: _Ticket) -> None:
+        if ticket.granted.is_set():
+            self._active -= 1
+        elif ticket in self._ready:
+            self._ready.remove(ticket)
+
+        user_queue = self._user_queues.get(ticket.user_id)
+        if user_queue is not None:
+            was_head = bool(user_queue) and user_queue[0] is ticket
+            if ticket in user_queue:
+                user_queue.remove(ticket)
+            if not user_queue:
+                del self._user_queues[ticket.user_id]
+                idle = self._idle.pop(ticket.user_id, None)
+                if idle is not None:
+                    idle.set()
+            elif was_head:
+                self._ready.append(user_queue[0])
+
+        self._dispatch()
+
+    def _supersede(self, user_id: int, kind: str) -> None:
+        for ticket in list(self._user_queues.get(user_id, ())):
+            if ticket.kind == kind and not ticket.superseded and ticket.task is not None:
+                ticket.superseded = True
+                ticket.task.cancel()
+                ADMISSION_SUPERSEDED.inc(kind=kind)
+
+    def _update_gauges(self) -> None:
+        ADMISSION_ACTIVE.set(self._active)
+        ADMISSION_QUEUED.set(sum(len(q) for q in self._user_queues.values()) - self._active)
+
+    async def run(self, handler: Handler, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                  kind: str, supersede: bool = False) -> None:
+        """
+        Run a handler once admitted
+
+        Args:
+            handler (Handler): Handler coroutine function
+            update (Update): Incoming update
+            context (ContextTypes.DEFAULT_TYPE): Handler context
+            kind (str): Job kind, e.g. "upload" or "query"
+            supersede (bool): Cancel the same user's earlier jobs of this kind
+        """
+        user_id = update.effective_user.id
+
+        if supersede:
+            self._supersede(user_id, kind)
+        elif self.pending_for_user(user_id) >= self.max_queue_per_user:
+            ADMISSION_REJECTED.inc(kind=kind)
+            await update.effective_message.reply_text(
+                "You already have requests in progress. Please wait for them to finish."
+            )
+            return
+
+        ticket = _Ticket(user_id, kind)
+        self._submit(ticket)
+        # The user's queue keeps this job in order from here, so their next update
+        # can come in (and supersede this one) while it waits or runs
+        hand_off_update()
+        try:
+            if not ticket.granted.is_set():
+                position = self.queue_position(ticket)
+                await update.effective_message.reply_text(
+                    f"⏳ The bot is busy, you're #{position} in the queue. I'll start as soon as a slot frees up."
+                )
+                await ticket.granted.wait()
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - ticket.created, kind=kind)
+
+            await handler(update, context)
+
+        except asyncio.CancelledError:
+            if not ticket.superseded:
+                raise
+            logger.info(f"Cancelled {kind} for user {user_id}: superseded by a newer one")
+        finally:
+            self._finish(ticket)
+
+    def wrap(self, handler: Handler, kind: str, supersede: bool = False) -> Handler:
+        """
+        Wrap a handler so every call goes through admission control
+        """
+        async def admitted(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            await self.run(handler, update, context, kind, supersede)
+
+        admitted.__name__ = getattr(handler, "__name__", "admitted")
+        return admitted
+
+    async def wait_for_user(self, user_id: int) -> None:
+        """Wait until none of the user's jobs are queued or running."""
+        while self.pending_for_user(user_id):
+            await self._idle.setdefault(user_id, asyncio.Event()).wait()
+
+    def ordered(self, handler: Handler) -> Handler:
+        """
+        Wrap a light handler so it runs after the user's queued heavy jobs
+
+        Admitted jobs hand the user's turn on once queued; without this a
+        /delete sent after a photo could run first and the photo would then
+        store the timetable again. No concurrency slot is taken.
+        """
+        async def in_order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            if update.effective_user is not None:
+                await self.wait_for_user(update.effective_user.id)
+            await handler(update, context)
+
+        in_order.__name__ = getattr(handler, "__name__", "in_order")
+        return in_order
@@ -0,0 +1,406 @@
+"""
+Micro-benchmarks for TimetableEmbeddingStore.
+
+Builds a store with synthetic timetables, growing it through each user
+count in --users, and at every checkpoint measures write latency, query and
+day-lookup latency, retrieval accuracy on a small labeled query set, memory
+and on-disk size. Encoder throughput is measured once per batch size.
+
+Vector writes go through the write-behind queue as deployed
+(VECTOR_FLUSH_INTERVAL_MS); pass several intervals to compare modes, with 0
+for synchronous writes.
+
+    python bench_embeddings.py --users 1000,10000 --json bench.json
+    python bench_embeddings.py --users 1000 --baseline bench.json
+    python bench_embeddings.py --users 1000 --flush-interval-ms 0,200
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from loadtest import percentile
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+SUBJECTS = [
+    ("DSA", "Data Structures and Algorithms"),
+    ("OS", "Operating Systems"),
+    ("DBMS", "Database Management Systems"),
+    ("CN", "Computer Networks"),
+    ("MATHS", "Discrete Mathematics"),
+    ("TOC", "Theory of Computation"),
+    ("SE", "Software Engineering"),
+    ("AI", "Artificial Intelligence"),
+    ("ML", "Machine Learning"),
+    ("COA", "Computer Organization and Architecture"),
+    ("ECO", "Engineering Economics"),
+    ("PHY", "Engineering Physics"),
+]
+
+SLOTS = ["9:00-9:55", "10:00-10:55", "11:00-11:55", "12:00-12:55", "2:00-2:55", "3:00-3:55"]
+
+# Queries with the metadata a correct top result must carry. Subjects are
+# filled in per user from their own timetable so every query has an answer.
+LABELED_QUERIES = [
+    {"query": "What classes do I have on {day}?", "expect": ["day"]},
+    {"query": "{day} schedule", "expect": ["day"]},
+    {"query": "When is my {subject} class?", "expect": ["subject"]},
+    {"query": "When do I have {full_name}?", "expect": ["subject"]},
+    {"query": "Do I have {subject} on {day}?", "expect": ["day", "subject"]},
+    {"query": "What time is {full_name} on {day}?", "expect": ["day", "subject"]},
+    {"query": "Where is the {subject} lab?", "expect": ["subject", "type"]},
+    {"query": "Which labs do I have on {day}?", "expect": ["day", "type"]},
+]
+
+
+def make_section(rng: random.Random) -> Dict:
+    """One section's timetable; users in the same section share it, like real students."""
+    timetable = {}
+    for day in DAYS:
+        periods = []
+        for slot in rng.sample(SLOTS, rng.randint(2, 5) if day != "Saturday" else rng.randint(0, 2)):
+            subject, full_name = rng.choice(SUBJECTS)
+            is_lab = rng.random() < 0.2
+            periods.append({
+                "time": slot,
+                "subject": f"{subject} Lab" if is_lab else subject,
+                "full_name": f"{full_name} Lab" if is_lab else full_name,
+                "type": "Lab" if is_lab else "Theory",
+                "room": f"L{rng.randint(1, 9)}" if is_lab else f"NC{rng.randint(10, 40)}",
+            })
+        timetable[day] = sorted(periods, key=lambda period: SLOTS.index(period["time"]))
+    return timetable
+
+
+def labeled_queries_for(timetable: Dict, rng: random.Random) -> List[Dict]:
+    """Instantiate the labeled query templates against one user's timetable."""
+    periods = [(day, period) for day, day_periods in timetable.items() for period in day_periods]
+    if not periods:
+        return []
+
+    queries = []
+    for template in LABELED_QUERIES:
+        candidates = periods
+        if "type" in template["expect"]:
+            candidates = [(day, period) for day, period in periods if period["type"] == "Lab"]
+            if not candidates:
+                continue
+        day, period = rng.choice(candidates)
+        expect = {"day": day, "subject": period["subject"], "type": period["type"]}
+        queries.append({
+            "query": template["query"].format(day=day, subject=period["subject"], full_name=period["full_name"]),
+            "expect": {field: expect[field] for field in template["expect"]},
+        })
+    return queries
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples) if samples else 0.0,
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "max": max(samples) if samples else 0.0,
+    }
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def disk_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+def bench_encode(model_name: str, batch_sizes: List[int], texts: List[str]) -> List[Dict]:
+    from compute_pool import ComputePool
+
+    results = []
+    for batch_size in batch_sizes:
+        pool = ComputePool(model_name, workers=0, batch_size=batch_size)
+        pool.encode(texts[:batch_size])  # warm up
+        start = time.perf_counter()
+        pool.encode(texts)
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        results.append({
+            "batch_size": batch_size,
+            "texts": len(texts),
+            "seconds": elapsed,
+            "texts_per_second": len(texts) / elapsed if elapsed else 0.0,
+        })
+        print(f"encode batch={batch_size:<4} {results[-1]['texts_per_second']:>9.1f} texts/s")
+    return results
+
+
+def score_results(results: List[Dict], expect: Dict, k: int) -> Optional[int]:
+    """1-based rank of the first result whose metadata matches, within the top k."""
+    for rank, result in enumerate(results[:k], start=1):
+        metadata = result.get("metadata") or {}
+        if all(str(metadata.get(field, "")).lower() == str(value).lower() for field, value in expect.items()):
+            return rank
+    return None
+
+
+class EmbeddingBenchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.sections = [make_section(self.rng) for _ in range(max(1, args.sections))]
+        self.user_sections: Dict[int, int] = {}
+
+    def run(self) -> Dict:
+        from embeddings import EMBEDDING_MODEL_NAME, period_document
+
+        workdir = tempfile.mkdtemp(prefix="bench-embeddings-")
+        report = {
+            "model": EMBEDDING_MODEL_NAME,
+            "seed": self.args.seed,
+            "sections": len(self.sections),
+            "embedding_cache": self.args.embedding_cache,
+            "flush_batch": self.args.flush_batch,
+            "encode": [],
+            "checkpoints": [],
+        }
+
+        try:
+            sample_texts = [
+                period_document(day, period)
+                for section in self.sections for day, periods in section.items() for period in periods
+            ]
+            sample_texts = (sample_texts * (self.args.encode_texts // max(1, len(sample_texts)) + 1))[:self.args.encode_texts]
+            report["encode"] = bench_encode(EMBEDDING_MODEL_NAME, self.args.batch_sizes, sample_texts)
+
+            for flush_interval_ms in self.args.flush_interval_ms:
+                report["checkpoints"] += self.run_mode(os.path.join(workdir, f"flush-{flush_interval_ms}"), flush_interval_ms)
+        finally:
+            if not self.args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+            else:
+                print(f"Kept benchmark data in {workdir}")
+
+        return report
+
+    def run_mode(self, workdir: str, flush_interval_ms: int) -> List[Dict]:
+        """
+        Grow a fresh store through each user count with one vector write mode
+
+        With a flush interval, writes only queue (as uploads do in production);
+        the time to commit what a checkpoint queued is reported as flush.
+        """
+        from embeddings import EMBEDDING_MODEL_NAME, TimetableEmbeddingStore
+        from embedding_cache import EmbeddingCache
+
+        # Same users and queries in every mode
+        self.rng = random.Random(self.args.seed)
+        self.user_sections = {}
+        os.makedirs(workdir, exist_ok=True)
+
+        cache = None
+        if self.args.embedding_cache:
+            cache = EmbeddingCache(os.path.join(workdir, "embedding_cache.sqlite3"), EMBEDDING_MODEL_NAME)
+        store = TimetableEmbeddingStore(
+            os.path.join(workdir, "chroma"),
+            embedding_cache=cache,
+            flush_interval=flush_interval_ms / 1000,
+            flush_batch=self.args.flush_batch
+        )
+
+        checkpoints = []
+        try:
+            for target in sorted(self.args.users):
+                write_latencies = self.grow(store, target)
+                checkpoint = {"flush_interval_ms": flush_interval_ms, "users": target}
+                start = time.perf_counter()
+                if store.write_queue is not None:
+                    store.write_queue.flush(force=True)
+                checkpoint["flush_seconds"] = time.perf_counter() - start
+                checkpoint["documents"] = store.collection.count()
+                checkpoint["write"] = latency_stats(write_latencies)
+                checkpoint.update(self.measure_queries(store))
+                checkpoint["rss_mb"] = rss_mb()
+                checkpoint["peak_rss_mb"] = peak_rss_mb()
+                checkpoint["disk_mb"] = disk_mb(workdir)
+                checkpoints.append(checkpoint)
+                print_checkpoint(checkpoint)
+        finally:
+            store.close()
+        return checkpoints
+
+    def grow(self, store, target: int) -> List[float]:
+        """Add users until the store holds `target`, timing each create_embeddings call."""
+        latencies = []
+        start_user = len(self.user_sections)
+        for user_id in range(start_user + 1, target + 1):
+            section = self.rng.randrange(len(self.sections))
+            self.user_sections[user_id] = section
+            start = time.perf_counter()
+            store.create_embeddings(self.sections[section], user_id)
+            latencies.append(time.perf_counter() - start)
+            done = user_id - start_user
+            if done % max(1, (target - start_user) // 10) == 0:
+                print(f"  stored {user_id}/{target} users", flush=True)
+        return latencies
+
+    def measure_queries(self, store) -> Dict:
+        query_latencies = []
+        day_latencies = []
+        ranks = []
+        users = self.rng.sample(sorted(self.user_sections), min(self.args.query_users, len(self.user_sections)))
+
+        for user_id in users:
+            timetable = self.sections[self.user_sections[user_id]]
+            for item in labeled_queries_for(timetable, self.rng):
+                start = time.perf_counter()
+                results = store.query_timetable(item["query"], n_results=self.args.top_k, user_id=user_id)
+                query_latencies.append(time.perf_counter() - start)
+                ranks.append(score_results(results, item["expect"], self.args.top_k))
+
+            day = self.rng.choice(DAYS)
+            start = time.perf_counter()
+            store.get_day_schedule(day, user_id)
+            day_latencies.append(time.perf_counter() - start)
+
+        scored = len(ranks) or 1
+        return {
+            "query": latency_stats(query_latencies),
+            "day_schedule": latency_stats(day_latencies),
+            "accuracy": {
+                "queries": len(ranks),
+                "hit_at_1": sum(1 for rank in ranks if rank == 1) / scored,
+                f"hit_at_{self.args.top_k}": sum(1 for rank in ranks if rank) / scored,
+                "mrr": sum(1 / rank for rank in ranks if rank) / scored,
+            },
+        }
+
+
+def print_checkpoint(checkpoint: Dict) -> None:
+    accuracy = checkpoint["accuracy"]
+    # With --top-k 1 there is no separate hit@k to show
+    hit_k = next((key for key in accuracy if key.startswith("hit_at_") and key != "hit_at_1"), None)
+    hit_k_text = f"{hit_k.replace('_at_', '@')} {accuracy[hit_k]:.1%}  " if hit_k else ""
+    interval = checkpoint.get("flush_interval_ms", 0)
+    mode = f"write-behind every {interval} ms, flush {checkpoint['flush_seconds']:.2f}s" if interval else "synchronous writes"
+    print(f"\nUsers: {checkpoint['users']}  Documents: {checkpoint['documents']}  "
+          f"RSS: {checkpoint['rss_mb']:.0f} MB  Disk: {checkpoint['disk_mb']:.1f} MB  ({mode})")
+    print(f"{'operation':<14} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name in ("write", "query", "day_schedule"):
+        stats = checkpoint[name]
+        print(f"{name:<14} {stats['count']:>6} {stats['p50']:>8.4f} {stats['p95']:>8.4f} {stats['p99']:>8.4f}")
+    print(f"Accuracy over {accuracy['queries']} queries: hit@1 {accuracy['hit_at_1']:.1%}  "
+          f"{hit_k_text}MRR {accuracy['mrr']:.3f}")
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, tolerance: float, accuracy_tolerance: float) -> List[str]:
+    """
+    List latency, throughput and accuracy regressions beyond the tolerance
+    """
+    regressions = []
+    previous_encode = {row["batch_size"]: row for row in baseline.get("encode", [])}
+    for row in report["encode"]:
+        previous = previous_encode.get(row["batch_size"])
+        if previous and row["texts_per_second"] < previous["texts_per_second"] * (1 - tolerance):
+            regressions.append(f"encode batch={row['batch_size']}: {previous['texts_per_second']:.1f} -> "
+                               f"{row['texts_per_second']:.1f} texts/s")
+
+    # Reports from before write-behind was benchmarked only used synchronous writes
+    previous_checkpoints = {
+        (row.get("flush_interval_ms", 0), row["users"]): row for row in baseline.get("checkpoints", [])
+    }
+    for checkpoint in report["checkpoints"]:
+        previous = previous_checkpoints.get((checkpoint.get("flush_interval_ms", 0), checkpoint["users"]))
+        if not previous:
+            continue
+        for name in ("write", "query", "day_schedule"):
+            before, after = previous[name]["p95"], checkpoint[name]["p95"]
+            if before > 0 and after > before * (1 + tolerance):
+                regressions.append(f"{checkpoint['users']} users {name}: p95 {before:.4f}s -> {after:.4f}s")
+        for metric, value in checkpoint["accuracy"].items():
+            before = previous["accuracy"].get(metric)
+            if metric != "queries" and before is not None and value < before - accuracy_tolerance:
+                regressions.append(f"{checkpoint['users']} users {metric}: {before:.3f} -> {value:.3f}")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark TimetableEmbeddingStore encoding, writes and retrieval")
+    parser.add_argument("--users", type=lambda value: [int(part) for part in value.split(",")], default=[1000],
+                        help="Comma-separated user counts to measure at, e.g. 1000,10000,100000")
+    parser.add_argument("--sections", type=int, default=50, help="Distinct section timetables users are drawn from")
+    parser.add_argument("--batch-sizes", type=lambda value: [int(part) for part in value.split(",")],
+                        default=[1, 8, 32, 128], help="Encoder batch sizes to measure")
+    parser.add_argument("--encode-texts", type=int, default=2048, help="Texts encoded per batch size")
+    parser.add_argument("--query-users", type=int, default=100, help="Users sampled for query latency and accuracy")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query, also the hit@k cutoff")
+    parser.add_argument("--embedding-cache", action="store_true", help="Store through the persistent embedding cache")
+    parser.add_argument("--flush-interval-ms", type=lambda value: [int(part) for part in value.split(",")], default=None,
+                        help="Comma-separated vector write modes to measure, 0 for synchronous; "
+                             "defaults to VECTOR_FLUSH_INTERVAL_MS, as deployed")
+    parser.add_argument("--flush-batch", type=int, default=None, help="Write-behind batch size, defaults to VECTOR_FLUSH_BATCH")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark store directory")
+    parser.add_argument("--json", dest="json_path", help="Write the report as JSON to this path")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed latency / throughput regression vs baseline")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.02, help="Allowed absolute drop in hit rate / MRR")
+    args = parser.parse_args(argv)
+
+    from config import BotConfig
+
+    config = BotConfig.from_env()
+    if args.flush_interval_ms is None:
+        args.flush_interval_ms = [config.vector_flush_interval_ms]
+    if args.flush_batch is None:
+        args.flush_batch = config.vector_flush_batch
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = EmbeddingBenchmark(args).run()
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance, args.accuracy_tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Offline bulk ingest: prewarm the caches for a whole institution's timetables.
+
+Runs every image or PDF under a directory through the same extraction,
+structuring and embedding path as a live upload, so the extraction,
+structuring and embedding caches already hold the results when students send
+the same sheets as files. Photos sent through Telegram are recompressed and
+miss these caches, so only document and PDF uploads benefit. Progress is
+journaled, so an interrupted run picks up where it stopped.
+
+    python bulk_ingest.py ./timetables --concurrency 8
+    python bulk_ingest.py ./timetables --journal ingest.jsonl --json report.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set
+
+from metrics import CACHE_REQUESTS
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+PDF_SUFFIX = ".pdf"
+
+
+class IngestJournal:
+    def __init__(self, path: str):
+        """
+        Append-only JSONL record of ingested files, keyed by content hash so a
+        renamed or moved file is still recognised as done
+
+        Args:
+            path (str): Journal file, created on first write
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.done: Set[str] = set()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by an interrupted run
+                    if entry.get("status") == "done":
+                        self.done.add(entry["sha256"])
+            with open(path, "rb+") as f:
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")  # don't glue the next entry onto a cut-off line
+
+    def record(self, entry: Dict) -> None:
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            if entry.get("status") == "done":
+                self.done.add(entry["sha256"])
+
+
+def find_files(directory: str) -> List[str]:
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.lower().endswith(IMAGE_SUFFIXES + (PDF_SUFFIX,)):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+    stats: Dict[str, Dict[str, float]] = {}
+    for labels, value in CACHE_REQUESTS.samples().items():
+        labels = dict(labels)
+        counts = stats.setdefault(labels.get("cache", ""), {"hit": 0, "miss": 0})
+        counts[labels.get("result", "miss")] = counts.get(labels.get("result", "miss"), 0) + value
+    for counts in stats.values():
+        total = counts["hit"] + counts["miss"]
+        counts["hit_rate"] = counts["hit"] / total if total else 0.0
+    return stats
+
+
+class BulkIngester:
+    def __init__(self, config, llama_api_key: str, groq_api_key: str, journal: IngestJournal,
+                 max_pages: int = 20):
+        """
+        Build the pipeline pieces a live bot uses, minus Telegram and the vector store
+
+        Args:
+            config (BotConfig): Model names, cache paths and compute pool settings
+            llama_api_key (str): LlamaParse API key
+            groq_api_key (str): Groq API key
+            journal (IngestJournal): Where finished files are recorded
+            max_pages (int): PDF pages beyond this are ignored, as in live uploads
+        """
+        from compute_pool import ComputePool
+        from embedding_cache import EmbeddingCache
+        from embeddings import EMBEDDING_MODEL_NAME
+        from llm import TimetableProcessor
+        from model_router import ModelRouter
+        from result_cache import ResultCache
+        from text_extraction import TextExtractor
+
+        if not config.result_cache_path or not config.embedding_cache_path:
+            raise ValueError("RESULT_CACHE_PATH and EMBEDDING_CACHE_PATH must be set, there is nothing to prewarm otherwise")
+
+        self.journal = journal
+        self.max_pages = max_pages
+        self.compute_pool = ComputePool(
+            EMBEDDING_MODEL_NAME,
+            workers=config.compute_workers,
+            batch_size=config.encode_batch_size,
+            batch_wait_ms=config.encode_batch_wait_ms
+        )
+        self.embedding_cache = EmbeddingCache(
+            config.embedding_cache_path, EMBEDDING_MODEL_NAME, config.embedding_cache_max_entries
+        )
+        self.text_extractor = TextExtractor(
+            llama_api_key, config.llama_base_url, self.compute_pool,
+            ResultCache(config.result_cache_path, "extraction", config.result_cache_max_entries)
+        )
+        self.timetable_processor = TimetableProcessor(
+            groq_api_key, ModelRouter(groq_api_key, config),
+            ResultCache(config.result_cache_path, "structuring", config.result_cache_max_entries)
+        )
+
+    def ingest_file(self, path: str) -> Dict:
+        """
+        Extract, structure and embed one file
+
+        Returns:
+            Dict: Journal entry with status done, skipped or failed
+        """
+        from embeddings import encode_with_cache, timetable_documents
+
+        start = time.perf_counter()
+        entry = {"file": path, "sha256": None}
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            entry["sha256"] = hashlib.sha256(data).hexdigest()
+
+            if entry["sha256"] in self.journal.done:
+                entry["status"] = "skipped"
+                return entry
+
+            if path.lower().endswith(PDF_SUFFIX):
+                pages = self.text_extractor.split_pdf_pages(data, self.max_pages)
+                texts = [
+                    self.text_extractor.extract_from_bytes(page, PDF_SUFFIX, self.text_extractor.pdf_page_key(data, i))
+                    for i, page in enumerate(pages)
+                ]
+            else:
+                texts = [self.text_extractor.extract_from_telegram_photo(data)]
+
+            timetables = [self.timetable_processor.process_timetable(text) for text in texts if text]
+            timetable = self.timetable_processor.merge_timetables(timetables)
+            documents = timetable_documents(timetable)
+            if documents:
+                encode_with_cache(self.compute_pool, self.embedding_cache, documents)
+
+            entry.update({
+                "status": "done" if documents else "failed",
+                "pages": len(texts),
+                "periods": len(documents),
+            })
+            if not documents:
+                entry["error"] = "no timetable found"
+        except Exception as e:
+            entry.update({"status": "failed", "error": str(e)})
+
+        entry["seconds"] = round(time.perf_counter() - start, 3)
+        # Failures are journaled too, but only done files are skipped on the next run
+        self.journal.record(entry)
+        return entry
+
+    def run(self, files: List[str], concurrency: int) -> Dict:
+        totals = {"files": len(files), "done": 0, "skipped": 0, "failed": 0, "pages": 0, "periods": 0}
+        failures = []
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ingest") as executor:
+            futures = [executor.submit(self.ingest_file, path) for path in files]
+            for i, future in enumerate(as_completed(futures), start=1):
+                entry = future.result()
+                totals[entry["status"]] += 1
+                totals["pages"] += entry.get("pages", 0)
+                totals["periods"] += entry.get("periods", 0)
+                if entry["status"] == "failed":
+                    failures.append({"file": entry["file"], "error": entry.get("error", "")})
+                print(f"[{i}/{len(files)}] {entry['status']:<7} {entry['file']}")
+
+        elapsed = time.perf_counter() - start
+        processed = totals["done"] + totals["failed"]
+        self.compute_pool.shutdown()
+        return {
+            **totals,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(processed / elapsed, 3) if elapsed else 0.0,
+            "pages_per_second": round(totals["pages"] / elapsed, 3) if elapsed else 0.0,
+            "concurrency": concurrency,
+            "caches": cache_stats(),
+            "failures": failures,
+        }
+
+
+def print_report(report: Dict) -> None:
+    print(
+        f"\n{report['done']} done, {report['skipped']} skipped, {report['failed']} failed "
+        f"of {report['files']} files in {report['elapsed_seconds']:.1f}s"
+    )
+    print(
+        f"{report['pages']} pages, {report['periods']} periods, "
+        f"{report['files_per_second']:.2f} files/s, {report['pages_per_second']:.2f} pages/s"
+    )
+    for name, counts in sorted(report["caches"].items()):
+        print(f"  {name:<12} {int(counts['hit'])} hits, {int(counts['miss'])} misses ({counts['hit_rate']:.0%})")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prewarm extraction, structuring and embedding caches from a directory of timetables")
+    parser.add_argument("directory", help="Directory searched recursively for images and PDFs")
+    parser.add_argument("--concurrency", type=int, default=4, help="Files processed at once")
+    parser.add_argument("--journal", default="./ingest_journal.jsonl", help="Progress file; done files are skipped on rerun")
+    parser.add_argument("--max-pages", type=int, default=None, help="PDF pages per file, defaults to MAX_DOCUMENT_PAGES")
+    parser.add_argument("--json", dest="json_path", help="Write the report as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    from config import BotConfig
+
+    llama_api_key = os.getenv("LLAMA_CLOUD_API_KEY")
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not llama_api_key or not groq_api_key:
+        print("Error: LLAMA_CLOUD_API_KEY and GROQ_API_KEY must be set")
+        return 2
+
+    files = find_files(args.directory)
+    if not files:
+        print(f"No images or PDFs found under {args.directory}")
+        return 1
+
+    config = BotConfig.from_env()
+    journal = IngestJournal(args.journal)
+    print(f"Ingesting {len(files)} files ({len(journal.done)} already done) with concurrency {args.concurrency}")
+
+    ingester = BulkIngester(
+        config, llama_api_key, groq_api_key, journal,
+        args.max_pages if args.max_pages is not None else config.max_document_pages
+    )
+    report = ingester.run(files, args.concurrency)
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
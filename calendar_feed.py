@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pytz
+
+from http_server import AsyncHTTPServer, HTTPRequest, HTTPResponse
+from metrics import REGISTRY, record_cache
+
+logger = logging.getLogger(__name__)
+
+FEED_REQUESTS = REGISTRY.counter(
+    "timetable_calendar_requests_total",
+    "Calendar feed requests by HTTP status"
+)
+FEED_RENDERS = REGISTRY.counter(
+    "timetable_calendar_renders_total",
+    "Calendar feeds rendered, by reason (upload, miss, stale)"
+)
+
+DAY_CODES = {
+    "Monday": "MO",
+    "Tuesday": "TU",
+    "Wednesday": "WE",
+    "Thursday": "TH",
+    "Friday": "FR",
+    "Saturday": "SA",
+}
+
+_TIME = re.compile(r"(\d{1,2})(?:[:.](\d{2}))?\s*([AaPp][Mm])?")
+
+
+def _parse_clock(match: re.Match) -> Tuple[int, int, Optional[str]]:
+    hour = int(match.group(1))
+    minute = int(match.group(2) or 0)
+    meridiem = match.group(3).upper() if match.group(3) else None
+    return hour, minute, meridiem
+
+
+def _to_24h(hour: int, meridiem: Optional[str]) -> int:
+    if meridiem == "PM" and hour < 12:
+        return hour + 12
+    if meridiem == "AM" and hour == 12:
+        return 0
+    # College slots without AM/PM: 1:00-7:59 are afternoon classes
+    if meridiem is None and 1 <= hour < 8:
+        return hour + 12
+    return hour
+
+
+def parse_period_time(time_text: str) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """
+    Parse a timetable slot like "9:00-9:55" or "2:00 PM - 3:00 PM"
+
+    Returns:
+        Optional[Tuple]: ((start_hour, start_minute), (end_hour, end_minute)), or None
+    """
+    matches = list(_TIME.finditer(str(time_text or "")))
+    if len(matches) < 2:
+        return None
+
+    start_hour, start_minute, start_meridiem = _parse_clock(matches[0])
+    end_hour, end_minute, end_meridiem = _parse_clock(matches[1])
+    # "10:00-11:00 AM" style ranges put the meridiem only on the end
+    start_meridiem = start_meridiem or end_meridiem
+
+    start = (_to_24h(start_hour, start_meridiem), start_minute)
+    end = (_to_24h(end_hour, end_meridiem), end_minute)
+    if not (0 <= start[0] < 24 and 0 <= end[0] < 24 and start[1] < 60 and end[1] < 60) or end <= start:
+        return None
+    return start, end
+
+
+def _escape(text: str) -> str:
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    # RFC 5545 limits content lines to 75 octets; continuation lines start with a space
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1  # don't split a multi-byte character
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts)
+
+
+def timetable_etag(timetable: Dict) -> str:
+    """Strong ETag derived from the timetable content, stable across restarts."""
+    digest = hashlib.sha256(json.dumps(timetable, sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def render_ics(timetable: Dict, user_id: int, timezone, now: Optional[datetime] = None) -> bytes:
+    """
+    Render a stored timetable as an iCalendar feed of weekly recurring events
+
+    Args:
+        timetable (Dict): Structured timetable keyed by day
+        user_id (int): Owner, used for stable event UIDs
+        timezone: pytz timezone the class times are in
+        now (datetime): Render time, defaults to the current time
+
+    Returns:
+        bytes: text/calendar body
+    """
+    now = now or datetime.now(timezone)
+    week_start = (now - timedelta(days=now.weekday())).date()
+    tz_name = timezone.zone
+    offset = now.utcoffset() or timedelta(0)
+    sign = "-" if offset < timedelta(0) else "+"
+    minutes = abs(int(offset.total_seconds())) // 60
+    tz_offset = f"{sign}{minutes // 60:02d}{minutes % 60:02d}"
+    stamp = now.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    lines: List[str] = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//AutoCalendar//Timetable Bot//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:My Timetable",
+        f"X-WR-TIMEZONE:{tz_name}",
+        "BEGIN:VTIMEZONE",
+        f"TZID:{tz_name}",
+        "BEGIN:STANDARD",
+        "DTSTART:19700101T000000",
+        f"TZOFFSETFROM:{tz_offset}",
+        f"TZOFFSETTO:{tz_offset}",
+        "END:STANDARD",
+        "END:VTIMEZONE",
+    ]
+
+    for day, code in DAY_CODES.items():
+        date = week_start + timedelta(days=list(DAY_CODES).index(day))
+        for position, period in enumerate(timetable.get(day) or []):
+            slot = parse_period_time(period.get("time", ""))
+            if slot is None:
+                continue
+            (start_hour, start_minute), (end_hour, end_minute) = slot
+
+            summary = period.get("subject") or "Class"
+            details = [value for value in (period.get("full_name"), period.get("type")) if value]
+
+            lines.extend([
+                "BEGIN:VEVENT",
+                f"UID:{user_id}-{code}-{position}@autocalendar",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART;TZID={tz_name}:{date:%Y%m%d}T{start_hour:02d}{start_minute:02d}00",
+                f"DTEND;TZID={tz_name}:{date:%Y%m%d}T{end_hour:02d}{end_minute:02d}00",
+                f"RRULE:FREQ=WEEKLY;BYDAY={code}",
+                f"SUMMARY:{_escape(summary)}",
+            ])
+            if details:
+                lines.append(f"DESCRIPTION:{_escape(' - '.join(details))}")
+            if period.get("room"):
+                lines.append(f"LOCATION:{_escape(period['room'])}")
+            lines.append("END:VEVENT")
+
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode("utf-8")
+
+
+def feed_token(secret: str, user_id: int) -> str:
+    """Per-user feed token; knowing it is what authorizes reading the feed."""
+    return hmac.new(secret.encode(), f"calendar:{user_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+class CalendarFeedCache:
+    def __init__(self, load_timetable: Callable[[int], Optional[Dict]], timezone, max_entries: int = 1000,
+                 load_version: Optional[Callable[[int], Optional[float]]] = None):
+        """
+        Pre-rendered ICS feeds, replaced on upload and dropped on delete
+
+        Args:
+            load_timetable (Callable): Returns a user's stored timetable, or None
+            timezone: pytz timezone the class times are in
+            max_entries (int): Feeds kept; the least recently used are re-rendered on their next fetch
+            load_version (Callable): Returns when the user's stored timetable last
+                changed, or None if it is gone. Given when other processes can
+                change timetables: a feed is then re-rendered once it is behind
+                the store, not only when this process saw the upload.
+        """
+        self.load_timetable = load_timetable
+        self.load_version = load_version
+        self.timezone = timezone
+        self.max_entries = max(1, max_entries)
+        # user_id -> (etag, body, version of the stored timetable it was rendered from)
+        self._feeds: "OrderedDict[int, Tuple[str, bytes, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _version(self, user_id: int) -> Optional[float]:
+        return self.load_version(user_id) if self.load_version is not None else None
+
+    def _put(self, user_id: int, entry: Tuple[str, bytes, Optional[float]]) -> None:
+        with self._lock:
+            self._feeds[user_id] = entry
+            self._feeds.move_to_end(user_id)
+            while len(self._feeds) > self.max_entries:
+                self._feeds.popitem(last=False)
+
+    def update(self, user_id: int, timetable: Dict) -> str:
+        """
+        Render and cache a user's feed; call after the timetable is stored
+
+        Returns:
+            str: The feed's ETag
+        """
+        etag = timetable_etag(timetable)
+        self._put(user_id, (etag, render_ics(timetable, user_id, self.timezone), self._version(user_id)))
+        FEED_RENDERS.inc(reason="upload")
+        return etag
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._feeds.pop(user_id, None)
+
+    def get(self, user_id: int) -> Optional[Tuple[str, bytes]]:
+        """
+        Cached (etag, body) for a user, rendering once after a restart
+
+        Returns:
+            Optional[Tuple[str, bytes]]: None if the user has no timetable
+        """
+        version = self._version(user_id)
+        with self._lock:
+            entry = self._feeds.get(user_id)
+            # Another process re-uploaded or deleted the timetable since this render
+            stale = entry is not None and self.load_version is not None and entry[2] != version
+            if stale:
+                del self._feeds[user_id]
+                entry = None
+            elif entry is not None:
+                self._feeds.move_to_end(user_id)
+        record_cache("calendar", entry is not None)
+        if entry is not None:
+            return entry[0], entry[1]
+
+        timetable = self.load_timetable(user_id)
+        if not timetable:
+            return None
+        etag = timetable_etag(timetable)
+        body = render_ics(timetable, user_id, self.timezone)
+        self._put(user_id, (etag, body, version))
+        FEED_RENDERS.inc(reason="stale" if stale else "miss")
+        return etag, body
+
+    def __len__(self) -> int:
+        return len(self._feeds)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class CalendarFeedServer:
+    PATH = "/calendar/"
+
+    def __init__(self, cache: CalendarFeedCache, secret: str):
+        """
+        Serve per-user ICS feeds at /calendar/<user_id>.ics?token=<token>
+
+        Args:
+            cache (CalendarFeedCache): Pre-rendered feeds
+            secret (str): Key for per-user feed tokens
+        """
+        self.cache = cache
+        self.secret = secret
+
+    def mount(self, server: AsyncHTTPServer) -> None:
+        server.add_route("GET", self.PATH, self.handle_feed, prefix=True)
+
+    def feed_path(self, user_id: int) -> str:
+        return f"{self.PATH}{user_id}.ics?token={feed_token(self.secret, user_id)}"
+
+    def _respond(self, status: int, body: bytes = b"", **kwargs) -> HTTPResponse:
+        FEED_REQUESTS.inc(status=str(status))
+        return HTTPResponse(status, body, **kwargs)
+
+    async def handle_feed(self, request: HTTPRequest) -> HTTPResponse:
+        name = request.path[len(self.PATH):]
+        if not name.endswith(".ics") or not name[:-4].isdigit():
+            return self._respond(404)
+        user_id = int(name[:-4])
+
+        token = request.query.get("token", "")
+        if not hmac.compare_digest(token.encode(), feed_token(self.secret, user_id).encode()):
+            return self._respond(403)
+
+        # A miss reads the store and renders, which shouldn't stall other requests
+        entry = await asyncio.to_thread(self.cache.get, user_id)
+        if entry is None:
+            return self._respond(404)
+        etag, body = entry
+
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            return self._respond(304, headers=headers)
+        return self._respond(200, body, content_type="text/calendar; charset=utf-8", headers=headers)
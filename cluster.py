@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import signal
+from typing import Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from config import BotConfig
+from profiling import install_log_filter
+from webhook import WebhookServer, resolve_secret, webhook_url
+
+logger = logging.getLogger(__name__)
+
+REMINDER_LEASE = "reminder-scheduler"
+
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    """
+    Stable worker index for a user, the same in every process and on every host
+    """
+    if not user_id or workers <= 1:
+        return 0
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % workers
+
+
+def update_user_id(update: Update) -> Optional[int]:
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+def worker_main(index: int, updates: multiprocessing.Queue, telegram_token: str,
+                llama_api_key: str, groq_api_key: str, config: BotConfig) -> None:
+    """
+    Entry point of one worker process: a full TimetableBot fed from the supervisor
+    """
+    from main import TimetableBot
+
+    logging.basicConfig(
+        format=f'%(asctime)s - worker{index} - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
+        level=logging.INFO,
+        force=True  # importing main already configured the root logger
+    )
+    install_log_filter()
+
+    # Users are pinned to workers, so each worker keeps its own vector index
+    config.chroma_path = f"{config.chroma_path.rstrip('/')}/worker-{index}"
+    config.metrics_port = config.metrics_port + 1 + index if config.metrics_port else 0
+    config.calendar_port = config.calendar_port + 1 + index if config.calendar_port else 0
+
+    bot = TimetableBot(telegram_token, llama_api_key, groq_api_key, config=config)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when to stop
+    asyncio.run(bot.run_worker(updates))
+
+
+class ClusterSupervisor:
+    def __init__(self, telegram_token: str, llama_api_key: str, groq_api_key: str, config: BotConfig):
+        """
+        Receive updates once and route them to worker processes by hashing user_id.
+
+        State lives in the shared store and exactly one worker, the holder of the
+        reminder lease, runs the scheduler. Several supervisors (e.g. one per host
+        behind a load balancer in webhook mode) can share the same store.
+
+        Args:
+            telegram_token (str): Bot token
+            llama_api_key (str): LlamaParse API key
+            groq_api_key (str): Groq API key
+            config (BotConfig): Shared configuration; config.workers sets the process count
+        """
+        self.telegram_token = telegram_token
+        self.llama_api_key = llama_api_key
+        self.groq_api_key = groq_api_key
+        self.config = config
+        self.workers = max(1, config.workers)
+
+        self._context = multiprocessing.get_context("spawn")
+        self.queues: List[multiprocessing.Queue] = []
+        self.processes: List[multiprocessing.Process] = []
+        self.routed: Dict[int, int] = {}
+
+    def start_workers(self) -> None:
+        for index in range(self.workers):
+            queue = self._context.Queue()
+            process = self._context.Process(
+                target=worker_main,
+                args=(index, queue, self.telegram_token, self.llama_api_key, self.groq_api_key, self.config),
+                name=f"timetable-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self.queues.append(queue)
+            self.processes.append(process)
+        logger.info(f"Started {self.workers} worker processes")
+
+    def stop_workers(self) -> None:
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+    def route(self, update: Update) -> int:
+        index = shard_for(update_user_id(update), self.workers)
+        self.queues[index].put(update.to_dict())
+        self.routed[index] = self.routed.get(index, 0) + 1
+        return index
+
+    async def _forward(self, application: Application, stop_event: asyncio.Event) -> None:
+        while not stop_event.is_set():
+            try:
+                update = await asyncio.wait_for(application.update_queue.get(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            self.route(update)
+
+    async def _serve(self) -> None:
+        # A handler-less application is only used to receive updates, never to process them
+        application = Application.builder().token(self.telegram_token).build()
+        await application.initialize()
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+        server = None
+        if self.config.bot_mode == "webhook" and self.config.webhook_url:
+            secret = resolve_secret(self.config.webhook_secret)
+            url = webhook_url(self.config.webhook_url, self.config.webhook_path)
+            server = WebhookServer(application, self.config.webhook_listen, self.config.webhook_port,
+                                   self.config.webhook_path, secret, is_running=lambda: not stop_event.is_set())
+            try:
+                await server.start()
+                await application.bot.set_webhook(
+                    url=url,
+                    secret_token=secret,
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=True
+                )
+            except Exception as e:
+                # Same fallback as the single-process bot: keep serving, over polling
+                logger.error(f"Could not set up webhook at {url}, falling back to polling: {str(e)}")
+                await server.stop()
+                server = None
+
+        if server is None:
+            await application.updater.start_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
+
+        try:
+            await self._forward(application, stop_event)
+        finally:
+            if server is not None:
+                await server.stop()
+            if application.updater.running:
+                await application.updater.stop()
+            await application.shutdown()
+
+    def run(self) -> None:
+        self.start_workers()
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.stop_workers()
+            logger.info(f"Routed updates per worker: {self.routed}")
@@ -0,0 +1,200 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+from metrics import REGISTRY
+
+ENCODE_BATCH_SIZE = REGISTRY.histogram(
+    "timetable_encode_batch_size",
+    "Texts per encoder call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+ENCODE_SECONDS = REGISTRY.histogram(
+    "timetable_encode_seconds",
+    "Wall time of encoder calls, including process-pool transfer"
+)
+
+# Loaded once per pool worker by _init_worker, or lazily in-process when there is no pool
+_model = None
+_model_name = None
+
+
+def _init_worker(model_name: str) -> None:
+    global _model, _model_name
+    from sentence_transformers import SentenceTransformer
+    _model = SentenceTransformer(model_name)
+    _model_name = model_name
+
+
+def _encode(texts: List[str], batch_size: int) -> Tuple[bytes, Tuple[int, int]]:
+    import numpy as np
+    vectors = _model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    # Raw float32 bytes pickle far smaller and faster than nested Python lists
+    return vectors.tobytes(), vectors.shape
+
+
+def _normalize_image(photo_bytes: bytes) -> bytes:
+    from PIL import Image
+    image = Image.open(BytesIO(photo_bytes))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+class _EncodeBatcher:
+    def __init__(self, pool: "ComputePool", max_batch: int, max_wait: float, max_in_flight: int = 1):
+        """
+        Coalesce single-text encode requests from concurrent callers into batches,
+        keeping up to max_in_flight batches encoding at once (one per pool worker)
+        """
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_in_flight = max(1, max_in_flight)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._senders = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="encode-batch")
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._senders.shutdown(wait=True)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            # Wait for a free worker before collecting; requests arriving meanwhile
+            # end up in this batch instead of queueing behind it
+            self._slots.acquire()
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._senders.submit(self._send, batch)
+
+            if stopping:
+                return
+
+    def _send(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            vectors = self.pool.encode([text for text, _ in batch])
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        finally:
+            self._slots.release()
+
+
+class ComputePool:
+    def __init__(self, model_name: str, workers: int = 0, batch_size: int = 32, batch_wait_ms: int = 5):
+        """
+        Run CPU-bound embedding and image work outside the bot's process
+
+        Args:
+            model_name (str): Sentence-transformer model loaded once per worker
+            workers (int): Worker processes; 0 runs everything in-process
+            batch_size (int): Encoder batch size, and the cap for coalesced single queries
+            batch_wait_ms (int): How long a single query waits for others to share its batch
+        """
+        self.model_name = model_name
+        self.workers = max(0, workers)
+        self.batch_size = max(1, batch_size)
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._local_lock = threading.Lock()
+        if self.workers:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_name,),
+            )
+        else:
+            self._ensure_local_model()
+
+        # The in-process model is used from one batch at a time; a pool takes one per worker
+        self._batcher = _EncodeBatcher(self, self.batch_size, batch_wait_ms / 1000.0, max(1, self.workers))
+
+    def _ensure_local_model(self) -> None:
+        with self._local_lock:
+            if _model is None or _model_name != self.model_name:
+                _init_worker(self.model_name)
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """
+        Encode a batch of texts
+
+        Args:
+            texts (List[str]): Texts to encode
+
+        Returns:
+            List[List[float]]: One embedding per text
+        """
+        if not texts:
+            return []
+        import numpy as np
+
+        ENCODE_BATCH_SIZE.observe(len(texts))
+        with ENCODE_SECONDS.time(mode="pool" if self._executor else "local"):
+            if self._executor is not None:
+                data, shape = self._executor.submit(_encode, list(texts), self.batch_size).result()
+            else:
+                self._ensure_local_model()
+                data, shape = _encode(list(texts), self.batch_size)
+
+        return np.frombuffer(data, dtype=np.float32).reshape(shape).tolist()
+
+    def encode_one(self, text: str) -> List[float]:
+        """
+        Encode a single text, batched together with concurrent callers
+        """
+        return self._batcher.submit(text).result()
+
+    def normalize_image(self, photo_bytes: bytes) -> bytes:
+        """
+        Decode an uploaded photo and re-encode it as RGB JPEG
+
+        Returns:
+            bytes: JPEG bytes ready for OCR upload
+        """
+        if self._executor is not None:
+            return self._executor.submit(_normalize_image, photo_bytes).result()
+        return _normalize_image(photo_bytes)
+
+    def shutdown(self) -> None:
+        self._batcher.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
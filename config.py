@@ -0,0 +1,249 @@
+import os
+from typing import Dict, FrozenSet, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Warning: {name}={value!r} is not an integer, using {default}")
+        return default
+
+
+def _env_ids(name: str) -> FrozenSet[int]:
+    ids = set()
+    for part in (os.getenv(name) or "").replace(";", ",").split(","):
+        part = part.strip()
+        if part.lstrip("-").isdigit():
+            ids.add(int(part))
+    return frozenset(ids)
+
+
+class BotConfig:
+    def __init__(
+        self,
+        small_model: str = "llama-3.1-8b-instant",
+        large_model: str = "llama-3.3-70b-versatile",
+        simple_query_max_chars: int = 120,
+        simple_context_max_chars: int = 1500,
+        simple_ocr_max_chars: int = 2500,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int = 0,
+        admin_user_ids: FrozenSet[int] = frozenset(),
+        chroma_path: str = "./chroma_db",
+        groq_base_url: Optional[str] = None,
+        llama_base_url: Optional[str] = None,
+        max_concurrent_jobs: int = 8,
+        max_queue_per_user: int = 3,
+        max_concurrent_updates: int = 16,
+        bot_mode: str = "polling",
+        webhook_url: Optional[str] = None,
+        webhook_listen: str = "0.0.0.0",
+        webhook_port: int = 8443,
+        webhook_path: str = "/telegram",
+        webhook_secret: Optional[str] = None,
+        workers: int = 1,
+        state_store_path: str = "./bot_state.sqlite3",
+        lease_ttl: int = 30,
+        compute_workers: int = 0,
+        encode_batch_size: int = 32,
+        encode_batch_wait_ms: int = 5,
+        max_parallel_pages: int = 8,
+        max_document_pages: int = 20,
+        album_wait_ms: int = 1500,
+        calendar_host: str = "127.0.0.1",
+        calendar_port: int = 0,
+        calendar_base_url: Optional[str] = None,
+        calendar_secret: Optional[str] = None,
+        calendar_cache_entries: int = 1000,
+        alert_lead_minutes: int = 10,
+        alert_send_rate: int = 25,
+        embedding_cache_path: str = "./embedding_cache.sqlite3",
+        embedding_cache_max_entries: int = 200000,
+        result_cache_path: str = "./result_cache.sqlite3",
+        result_cache_max_entries: int = 100000,
+        session_max_entries: int = 10000,
+        session_max_bytes: int = 0,
+        session_idle_seconds: int = 3600,
+        pipelined_structuring: bool = True,
+        profile_dir: str = "./profiles",
+        profile_threshold_ms: int = 10000,
+        profile_sample_ms: int = 10,
+        profile_max_traces: int = 200,
+        vector_flush_interval_ms: int = 200,
+        vector_flush_batch: int = 500,
+    ):
+        """
+        Central place for tunable bot settings
+
+        Args:
+            small_model (str): Groq model used for simple queries and clean OCR text
+            large_model (str): Groq model used for hard queries, messy OCR text and retries
+            simple_query_max_chars (int): Longest query still routed to the small model
+            simple_context_max_chars (int): Largest retrieval context still routed to the small model
+            simple_ocr_max_chars (int): Longest extracted text still structured by the small model
+            metrics_host (str): Address for the Prometheus /metrics endpoint
+            metrics_port (int): Port for the /metrics endpoint, 0 disables it
+            admin_user_ids (FrozenSet[int]): Telegram user IDs allowed to run admin commands
+            chroma_path (str): Directory for the persistent ChromaDB store
+            groq_base_url (str): Override for the Groq API endpoint (e.g. a local stand-in)
+            llama_base_url (str): Override for the LlamaParse API endpoint
+            max_concurrent_jobs (int): Uploads and queries allowed to run at once across all users
+            max_queue_per_user (int): Uploads and queries one user may have queued or running
+            max_concurrent_updates (int): Updates the application processes at once, one per user at a time
+            bot_mode (str): "polling" or "webhook"; webhook falls back to polling if it cannot be set up
+            webhook_url (str): Public base URL Telegram delivers updates to
+            webhook_listen (str): Local address for the webhook server
+            webhook_port (int): Local port for the webhook server
+            webhook_path (str): URL path for webhook deliveries
+            webhook_secret (str): Secret token Telegram sends with every delivery, generated if not set
+            workers (int): Worker processes; above 1, updates are sharded by user_id and state is shared
+            state_store_path (str): Shared state database used in multi-worker mode
+            lease_ttl (int): Seconds a worker holds the reminder-scheduler lease without renewing
+            compute_workers (int): Processes for embedding and image work; 0 keeps it in-process
+            encode_batch_size (int): Encoder batch size and cap for coalesced query encodes
+            encode_batch_wait_ms (int): How long a query encode waits to share a batch
+            max_parallel_pages (int): Pages of one upload extracted and structured at once
+            max_document_pages (int): Pages read from an uploaded PDF
+            album_wait_ms (int): How long to wait for the rest of an album after its first photo
+            calendar_host (str): Address for the ICS feed endpoint
+            calendar_port (int): Port for the ICS feed endpoint, 0 disables it
+            calendar_base_url (str): Public URL feed links are built from, defaults to host:port
+            calendar_secret (str): Key for per-user feed tokens, derived from the bot token if unset
+            calendar_cache_entries (int): Rendered feeds kept in memory, least recently fetched dropped first
+            alert_lead_minutes (int): Default minutes before class for /alerts
+            alert_send_rate (int): Alerts sent per second at most, kept under Telegram's flood limit
+            embedding_cache_path (str): Shared embedding cache file, empty disables the cache
+            embedding_cache_max_entries (int): Vectors kept before least recently used are evicted
+            result_cache_path (str): Extracted text and structured timetable cache file, empty disables it
+            result_cache_max_entries (int): Results of each kind kept before least recently used are evicted
+            session_max_entries (int): Users per state mapping kept in memory, 0 for no cap
+            session_max_bytes (int): Approximate memory per state mapping, 0 for no cap
+            session_idle_seconds (int): Idle users are spilled to disk after this, 0 never
+            pipelined_structuring (bool): Stream photo structuring, previewing and encoding each day as it completes
+            profile_dir (str): Directory for request traces
+            profile_threshold_ms (int): Uploads and queries slower than this are traced, 0 disables
+            profile_sample_ms (int): Stack sampling interval while requests are in flight
+            profile_max_traces (int): Trace files kept before the oldest are deleted
+            vector_flush_interval_ms (int): Milliseconds between batched vector store writes, 0 writes synchronously
+            vector_flush_batch (int): Queued documents that trigger an early vector store flush
+        """
+        self.small_model = small_model
+        self.large_model = large_model
+        self.simple_query_max_chars = simple_query_max_chars
+        self.simple_context_max_chars = simple_context_max_chars
+        self.simple_ocr_max_chars = simple_ocr_max_chars
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.admin_user_ids = frozenset(admin_user_ids)
+        self.chroma_path = chroma_path
+        self.groq_base_url = groq_base_url
+        self.llama_base_url = llama_base_url
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_queue_per_user = max_queue_per_user
+        self.max_concurrent_updates = max_concurrent_updates
+        self.bot_mode = bot_mode
+        self.webhook_url = webhook_url
+        self.webhook_listen = webhook_listen
+        self.webhook_port = webhook_port
+        self.webhook_path = webhook_path
+        self.webhook_secret = webhook_secret
+        self.workers = workers
+        self.state_store_path = state_store_path
+        self.lease_ttl = lease_ttl
+        self.compute_workers = compute_workers
+        self.encode_batch_size = encode_batch_size
+        self.encode_batch_wait_ms = encode_batch_wait_ms
+        self.max_parallel_pages = max_parallel_pages
+        self.max_document_pages = max_document_pages
+        self.album_wait_ms = album_wait_ms
+        self.calendar_host = calendar_host
+        self.calendar_port = calendar_port
+        self.calendar_base_url = calendar_base_url
+        self.calendar_secret = calendar_secret
+        self.calendar_cache_entries = calendar_cache_entries
+        self.alert_lead_minutes = alert_lead_minutes
+        self.alert_send_rate = alert_send_rate
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache_max_entries = embedding_cache_max_entries
+        self.result_cache_path = result_cache_path
+        self.result_cache_max_entries = result_cache_max_entries
+        self.session_max_entries = session_max_entries
+        self.session_max_bytes = session_max_bytes
+        self.session_idle_seconds = session_idle_seconds
+        self.pipelined_structuring = pipelined_structuring
+        self.profile_dir = profile_dir
+        self.profile_threshold_ms = profile_threshold_ms
+        self.profile_sample_ms = profile_sample_ms
+        self.profile_max_traces = profile_max_traces
+        self.vector_flush_interval_ms = vector_flush_interval_ms
+        self.vector_flush_batch = vector_flush_batch
+
+    @property
+    def models(self) -> Dict[str, str]:
+        return {"small": self.small_model, "large": self.large_model}
+
+    @classmethod
+    def from_env(cls, defaults: Optional["BotConfig"] = None) -> "BotConfig":
+        """
+        Build a config from environment variables, falling back to defaults
+
+        Returns:
+            BotConfig: Loaded configuration
+        """
+        base = defaults or cls()
+        return cls(
+            small_model=os.getenv("GROQ_SMALL_MODEL", base.small_model),
+            large_model=os.getenv("GROQ_LARGE_MODEL", base.large_model),
+            simple_query_max_chars=_env_int("ROUTER_SIMPLE_QUERY_MAX_CHARS", base.simple_query_max_chars),
+            simple_context_max_chars=_env_int("ROUTER_SIMPLE_CONTEXT_MAX_CHARS", base.simple_context_max_chars),
+            simple_ocr_max_chars=_env_int("ROUTER_SIMPLE_OCR_MAX_CHARS", base.simple_ocr_max_chars),
+            metrics_host=os.getenv("METRICS_HOST", base.metrics_host),
+            metrics_port=_env_int("METRICS_PORT", base.metrics_port),
+            admin_user_ids=_env_ids("ADMIN_USER_IDS") or base.admin_user_ids,
+            chroma_path=os.getenv("CHROMA_PATH", base.chroma_path),
+            groq_base_url=os.getenv("GROQ_BASE_URL", base.groq_base_url),
+            llama_base_url=os.getenv("LLAMA_CLOUD_BASE_URL", base.llama_base_url),
+            max_concurrent_jobs=_env_int("MAX_CONCURRENT_JOBS", base.max_concurrent_jobs),
+            max_queue_per_user=_env_int("MAX_QUEUE_PER_USER", base.max_queue_per_user),
+            max_concurrent_updates=_env_int("MAX_CONCURRENT_UPDATES", base.max_concurrent_updates),
+            bot_mode=os.getenv("BOT_MODE", base.bot_mode).strip().lower(),
+            webhook_url=os.getenv("WEBHOOK_URL", base.webhook_url),
+            webhook_listen=os.getenv("WEBHOOK_LISTEN", base.webhook_listen),
+            webhook_port=_env_int("WEBHOOK_PORT", base.webhook_port),
+            webhook_path=os.getenv("WEBHOOK_PATH", base.webhook_path),
+            webhook_secret=os.getenv("WEBHOOK_SECRET", base.webhook_secret),
+            workers=_env_int("WORKERS", base.workers),
+            state_store_path=os.getenv("STATE_STORE_PATH", base.state_store_path),
+            lease_ttl=_env_int("LEASE_TTL", base.lease_ttl),
+            compute_workers=_env_int("COMPUTE_WORKERS", base.compute_workers),
+            encode_batch_size=_env_int("ENCODE_BATCH_SIZE", base.encode_batch_size),
+            encode_batch_wait_ms=_env_int("ENCODE_BATCH_WAIT_MS", base.encode_batch_wait_ms),
+            max_parallel_pages=_env_int("MAX_PARALLEL_PAGES", base.max_parallel_pages),
+            max_document_pages=_env_int("MAX_DOCUMENT_PAGES", base.max_document_pages),
+            album_wait_ms=_env_int("ALBUM_WAIT_MS", base.album_wait_ms),
+            calendar_host=os.getenv("CALENDAR_HOST", base.calendar_host),
+            calendar_port=_env_int("CALENDAR_PORT", base.calendar_port),
+            calendar_base_url=os.getenv("CALENDAR_BASE_URL", base.calendar_base_url),
+            calendar_secret=os.getenv("CALENDAR_SECRET", base.calendar_secret),
+            calendar_cache_entries=_env_int("CALENDAR_CACHE_ENTRIES", base.calendar_cache_entries),
+            alert_lead_minutes=_env_int("ALERT_LEAD_MINUTES", base.alert_lead_minutes),
+            alert_send_rate=_env_int("ALERT_SEND_RATE", base.alert_send_rate),
+            embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH", base.embedding_cache_path),
+            embedding_cache_max_entries=_env_int("EMBEDDING_CACHE_MAX_ENTRIES", base.embedding_cache_max_entries),
+            result_cache_path=os.getenv("RESULT_CACHE_PATH", base.result_cache_path),
+            result_cache_max_entries=_env_int("RESULT_CACHE_MAX_ENTRIES", base.result_cache_max_entries),
+            session_max_entries=_env_int("SESSION_MAX_ENTRIES", base.session_max_entries),
+            session_max_bytes=_env_int("SESSION_MAX_BYTES", base.session_max_bytes),
+            session_idle_seconds=_env_int("SESSION_IDLE_SECONDS", base.session_idle_seconds),
+            pipelined_structuring=_env_int("PIPELINED_STRUCTURING", int(base.pipelined_structuring)) != 0,
+            profile_dir=os.getenv("PROFILE_DIR", base.profile_dir),
+            profile_threshold_ms=_env_int("PROFILE_THRESHOLD_MS", base.profile_threshold_ms),
+            profile_sample_ms=_env_int("PROFILE_SAMPLE_MS", base.profile_sample_ms),
+            profile_max_traces=_env_int("PROFILE_MAX_TRACES", base.profile_max_traces),
+            vector_flush_interval_ms=_env_int("VECTOR_FLUSH_INTERVAL_MS", base.vector_flush_interval_ms),
+            vector_flush_batch=_env_int("VECTOR_FLUSH_BATCH", base.vector_flush_batch),
+        )
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Sequence
+
+from metrics import REGISTRY, record_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored vector format changes
+CACHE_FORMAT = "v1"
+
+EMBEDDING_CACHE_ENTRIES = REGISTRY.gauge(
+    "timetable_embedding_cache_entries",
+    "Vectors held in the persistent embedding cache"
+)
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model_name: str, max_entries: int = 200000):
+        """
+        Persistent, content-addressed embedding cache shared by all users and workers.
+
+        Students in the same section produce identical period documents, so
+        vectors are keyed by a hash of the model name and the text, not by user.
+
+        Args:
+            path (str): SQLite file holding the vectors
+            model_name (str): Encoder name, part of every key so a model change misses
+            max_entries (int): Least recently used vectors are evicted beyond this
+        """
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max(1, max_entries)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        EMBEDDING_CACHE_ENTRIES.set(self._count)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{CACHE_FORMAT}\0{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: Sequence[str]) -> Dict[str, List[float]]:
+        """
+        Look up cached vectors
+
+        Args:
+            texts (Sequence[str]): Texts to look up
+
+        Returns:
+            Dict[str, List[float]]: Vectors for the texts that were cached
+        """
+        keys = {self.key(text): text for text in texts}
+        found: Dict[str, List[float]] = {}
+        conn = self._conn()
+
+        key_list = list(keys)
+        for start in range(0, len(key_list), 500):  # stay under SQLite's variable limit
+            chunk = key_list[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[keys[key]] = vector.tolist()
+
+        if found:
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, self.key(text)) for text in found]
+            )
+
+        for text in texts:
+            record_cache("embedding", text in found)
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]) -> None:
+        """
+        Store freshly encoded vectors, evicting the least recently used beyond max_entries
+        """
+        if not vectors:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(self.key(text), array("f", vector).tobytes(), now) for text, vector in vectors.items()]
+        )
+
+        self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._count > self.max_entries:
+            # Evict down to 90% so we don't pay for an eviction on every insert
+            excess = self._count - int(self.max_entries * 0.9)
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self._count -= excess
+        EMBEDDING_CACHE_ENTRIES.set(self._count)
+
+    def __len__(self) -> int:
+        return self._count
@@ -1,17 +1,74 @@
 import chromadb
-from sentence_transformers import SentenceTransformer
 import json
 from typing import Dict, List, Optional
 from datetime import datetime
 import uuid
 
+from metrics import stage_timer
+from compute_pool import ComputePool
+from embedding_cache import EmbeddingCache
+from profiling import traced
+from singleflight import SingleFlight
+from write_behind import VectorWriteQueue, distance, normalize_metadata
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+
+def period_document(day: str, period: Dict) -> str:
+    """Text embedded for one period; bulk ingest builds the same text to prewarm the cache."""
+    doc_text = f"Day: {day}, Time: {period.get('time', '')}, "
+    doc_text += f"Subject: {period.get('subject', '')}, "
+    doc_text += f"Full Name: {period.get('full_name', '')}, "
+    doc_text += f"Type: {period.get('type', '')}"
+    return doc_text
+
+
+def timetable_documents(timetable_data: Dict) -> List[str]:
+    return [
+        period_document(day, period)
+        for day, periods in timetable_data.items() if periods
+        for period in periods
+    ]
+
+
+def encode_with_cache(compute_pool: ComputePool, embedding_cache: Optional[EmbeddingCache],
+                      documents: List[str]) -> List[List[float]]:
+    """
+    Encode documents, only sending embedding cache misses to the encoder
+    
+    Args:
+        compute_pool (ComputePool): Where encoding runs
+        embedding_cache (EmbeddingCache): Shared vectors, or None to always encode
+        documents (List[str]): Document texts
+        
+    Returns:
+        List[List[float]]: One embedding per document, in order
+    """
+    if embedding_cache is None:
+        return compute_pool.encode(documents)
+    
+    vectors = embedding_cache.get_many(documents)
+    misses = list(dict.fromkeys(doc for doc in documents if doc not in vectors))
+    if misses:
+        encoded = dict(zip(misses, compute_pool.encode(misses)))
+        embedding_cache.put_many(encoded)
+        vectors.update(encoded)
+    
+    return [vectors[doc] for doc in documents]
+
 class TimetableEmbeddingStore:
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db", compute_pool: Optional[ComputePool] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None, flush_interval: float = 0,
+                 flush_batch: int = 500):
         """
         Initialize ChromaDB for storing timetable embeddings
         
         Args:
             persist_directory (str): Directory to persist the database
+            compute_pool (ComputePool): Where encoding runs; in-process if not given
+            embedding_cache (EmbeddingCache): Shared vectors for document texts seen before
+            flush_interval (float): Seconds between write-behind flushes, 0 writes synchronously
+            flush_batch (int): Queued documents that trigger an early flush
         """
         # Initialize ChromaDB client with persistence
         try:
@@ -21,8 +78,9 @@ class TimetableEmbeddingStore:
             # Fallback to in-memory client
             self.client = chromadb.Client()
         
-        # Initialize sentence transformer for embeddings
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Initialize sentence transformer for embeddings (loaded once per pool worker)
+        self.compute_pool = compute_pool or ComputePool(EMBEDDING_MODEL_NAME)
+        self.embedding_cache = embedding_cache
         
         # Get or create collection
         try:
@@ -41,13 +99,22 @@ class TimetableEmbeddingStore:
                 name="timetable_data",
                 metadata={"description": "Student timetable information"}
             )
+        
+        # Uploads only queue their writes; one thread batches them into the collection
+        self.write_queue = None
+        if flush_interval > 0:
+            self.write_queue = VectorWriteQueue(lambda: self.collection, flush_interval, flush_batch)
     
-    def create_embeddings(self, timetable_data: Dict) -> None:
+    @traced("store.create")
+    def create_embeddings(self, timetable_data: Dict, user_id: Optional[int] = None,
+                          encoded: Optional[Dict[str, List[float]]] = None) -> None:
         """
         Create and store embeddings for timetable data
         
         Args:
             timetable_data (Dict): Structured timetable data
+            user_id (int): Owner of the timetable, stored so queries can be scoped per user
+            encoded (Dict): Embeddings already computed, keyed by document text
         """
         documents = []
         metadatas = []
@@ -60,12 +127,7 @@ class TimetableEmbeddingStore:
             
             for period in periods:
                 # Create a document text for embedding
-                doc_text = f"Day: {day}, Time: {period.get('time', '')}, "
-                doc_text += f"Subject: {period.get('subject', '')}, "
-                doc_text += f"Full Name: {period.get('full_name', '')}, "
-                doc_text += f"Type: {period.get('type', '')}"
-                
-                documents.append(doc_text)
+                documents.append(period_document(day, period))
                 
                 # Create metadata
                 metadata = {
@@ -77,6 +139,8 @@ class TimetableEmbeddingStore:
                     "room": period.get('room', ''),
                     "timestamp": datetime.now().isoformat()
                 }
+                if user_id is not None:
+                    metadata["user_id"] = user_id
                 metadatas.append(metadata)
                 
                 # Generate unique ID
@@ -84,95 +148,196 @@ class TimetableEmbeddingStore:
         
         if documents:
             # Generate embeddings
-            embeddings = self.embedding_model.encode(documents).tolist()
+            embeddings = self.encode_documents(documents, encoded)
             
             # Store in ChromaDB
-            self.collection.add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            if self.write_queue is not None:
+                self.write_queue.add(user_id, ids, embeddings, documents, metadatas)
+            else:
+                self.collection.add(
+                    embeddings=embeddings,
+                    documents=documents,
+                    metadatas=[normalize_metadata(metadata) for metadata in metadatas],
+                    ids=ids
+                )
             
             print(f"Successfully stored {len(documents)} timetable entries")
         else:
             print("No valid timetable data to store")
     
-    def query_timetable(self, query: str, n_results: int = 10) -> List[Dict]:
+    @traced("store.encode")
+    def encode_documents(self, documents: List[str],
+                         encoded: Optional[Dict[str, List[float]]] = None) -> List[List[float]]:
+        """
+        Encode period documents, only sending cache misses to the encoder
+        
+        Args:
+            documents (List[str]): Document texts
+            encoded (Dict): Embeddings already computed, keyed by document text
+            
+        Returns:
+            List[List[float]]: One embedding per document, in order
+        """
+        encoded = dict(encoded or {})
+        missing = [doc for doc in documents if doc not in encoded]
+        if missing:
+            encoded.update(zip(missing, encode_with_cache(self.compute_pool, self.embedding_cache, missing)))
+        return [encoded[doc] for doc in documents]
+    
+    def replace_timetable(self, timetable_data: Dict, user_id: int,
+                          encoded: Optional[Dict[str, List[float]]] = None) -> None:
+        """
+        Swap a user's stored timetable for a new one: delete plus add
+        
+        Encoding happens before the old rows are touched, so a failure there
+        leaves them in place; with the write queue the swap is one pending change.
+        
+        Args:
+            timetable_data (Dict): Structured timetable data
+            user_id (int): Owner of the timetable
+            encoded (Dict): Embeddings already computed, keyed by document text
+        """
+        documents = timetable_documents(timetable_data)
+        encoded = dict(zip(documents, self.encode_documents(documents, encoded)))
+        self.clear_timetable(user_id)
+        self.create_embeddings(timetable_data, user_id, encoded)
+    
+    @traced("store.query")
+    def query_timetable(self, query: str, n_results: int = 10, user_id: Optional[int] = None) -> List[Dict]:
         """
         Query the timetable database
         
         Args:
             query (str): Query string (e.g., "tomorrow classes", "Monday schedule")
             n_results (int): Number of results to return
+            user_id (int): Only search this user's timetable
             
         Returns:
             List[Dict]: Query results with metadata
         """
         try:
             # Generate embedding for query
-            query_embedding = self.embedding_model.encode([query]).tolist()[0]
+            query_embedding = self.compute_pool.encode_one(query)
+            pending = self._pending_for(user_id)
             
             # Query ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
-            )
+            query_kwargs = {}
+            if user_id is not None:
+                query_kwargs["where"] = {"user_id": user_id}
+            
+            results = {'documents': None}
+            if pending is None or not pending.cleared:
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    **query_kwargs
+                )
             
             # Format results
             formatted_results = []
             if results['documents']:
                 for i in range(len(results['documents'][0])):
                     result = {
+                        'id': results['ids'][0][i],
                         'document': results['documents'][0][i],
                         'metadata': results['metadatas'][0][i],
                         'distance': results['distances'][0][i] if results['distances'] else None
                     }
                     formatted_results.append(result)
             
+            if pending is not None and pending.ids:
+                # The user's own writes still in the queue, ranked the way Chroma would
+                space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+                seen = {result['id'] for result in formatted_results}
+                for i, doc_id in enumerate(pending.ids):
+                    if doc_id not in seen:
+                        formatted_results.append({
+                            'id': doc_id,
+                            'document': pending.documents[i],
+                            'metadata': pending.metadatas[i],
+                            'distance': distance(query_embedding, pending.embeddings[i], space)
+                        })
+                formatted_results.sort(key=lambda result: result['distance'])
+                formatted_results = formatted_results[:n_results]
+            
             return formatted_results
         
         except Exception as e:
             print(f"Error querying timetable: {str(e)}")
             return []
     
-    def get_day_schedule(self, day: str) -> List[Dict]:
+    @traced("store.day_schedule")
+    def get_day_schedule(self, day: str, user_id: Optional[int] = None) -> List[Dict]:
         """
         Get all classes for a specific day
         
         Args:
             day (str): Day of the week (e.g., "Monday", "Tuesday")
+            user_id (int): Only return this user's classes
             
         Returns:
             List[Dict]: All classes for the specified day
         """
         try:
+            pending = self._pending_for(user_id)
+            
             # Query using where filter for specific day
-            results = self.collection.get(
-                where={"day": day}
-            )
+            where = {"day": day}
+            if user_id is not None:
+                where = {"$and": [{"day": day}, {"user_id": user_id}]}
+            
+            results = {'documents': None}
+            if pending is None or not pending.cleared:
+                results = self.collection.get(
+                    where=where
+                )
             
             # Format results
             formatted_results = []
             if results['documents']:
                 for i in range(len(results['documents'])):
                     result = {
+                        'id': results['ids'][i],
                         'document': results['documents'][i],
                         'metadata': results['metadatas'][i]
                     }
                     formatted_results.append(result)
             
+            if pending is not None:
+                seen = {result['id'] for result in formatted_results}
+                for i, doc_id in enumerate(pending.ids):
+                    if doc_id not in seen and pending.metadatas[i].get('day') == day:
+                        formatted_results.append({
+                            'id': doc_id,
+                            'document': pending.documents[i],
+                            'metadata': pending.metadatas[i]
+                        })
+            
             return formatted_results
         
         except Exception as e:
             print(f"Error getting day schedule: {str(e)}")
             return []
     
-    def clear_timetable(self) -> None:
+    @traced("store.clear")
+    def clear_timetable(self, user_id: Optional[int] = None) -> None:
         """
-        Clear all timetable data from the database
+        Clear timetable data from the database
+        
+        Args:
+            user_id (int): Only clear this user's entries; clears everything if not given
         """
         try:
+            if user_id is not None:
+                if self.write_queue is not None:
+                    self.write_queue.delete_user(user_id)
+                else:
+                    self.collection.delete(where={"user_id": user_id})
+                return
+            
+            if self.write_queue is not None:
+                self.write_queue.discard()
+            
             # Delete the collection
             self.client.delete_collection(name="timetable_data")
             
@@ -187,6 +352,17 @@ class TimetableEmbeddingStore:
         except Exception as e:
             print(f"Error clearing timetable: {str(e)}")
     
+    def _pending_for(self, user_id: Optional[int]):
+        # Only per-user reads see queued writes; unscoped reads are eventually consistent
+        if self.write_queue is None or user_id is None:
+            return None
+        return self.write_queue.pending_for(user_id)
+    
+    def close(self) -> None:
+        """Write out queued writes and stop the writer thread, on shutdown."""
+        if self.write_queue is not None:
+            self.write_queue.close()
+    
     def get_collection_count(self) -> int:
         """
         Get total number of stored entries
@@ -201,36 +377,45 @@ class TimetableEmbeddingStore:
             return 0
 
 class TimetableQueryProcessor:
-    def __init__(self, groq_api_key: str, embedding_store: TimetableEmbeddingStore):
+    def __init__(self, groq_api_key: str, embedding_store: TimetableEmbeddingStore, router=None):
         """
         Initialize query processor with LLM and embedding store
         
         Args:
             groq_api_key (str): Groq API key
             embedding_store (TimetableEmbeddingStore): Embedding store instance
+            router (ModelRouter): Shared model router, created if not given
         """
-        from langchain_groq import ChatGroq
-        from langchain.schema import HumanMessage, SystemMessage
+        from model_router import ModelRouter
         
-        self.llm = ChatGroq(
-            groq_api_key=groq_api_key,
-            model_name="llama-3.3-70b-versatile",
-            temperature=0.1
-        )
+        self.router = router or ModelRouter(groq_api_key)
         self.embedding_store = embedding_store
+        # A user re-sending the same question before the answer arrives gets it once
+        self.inflight = SingleFlight("query")
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split()).rstrip("?!. ")
     
-    def process_query(self, query: str) -> str:
+    @traced("query.answer")
+    def process_query(self, query: str, user_id: Optional[int] = None) -> str:
         """
         Process user query and return formatted response
         
         Args:
             query (str): User query about timetable
+            user_id (int): Restrict retrieval to this user's timetable
             
         Returns:
             str: Formatted response
         """
+        return self.inflight.do((user_id, self.normalize_query(query)), lambda: self._answer_query(query, user_id))
+    
+    def _answer_query(self, query: str, user_id: Optional[int]) -> str:
+        
         # Query the embedding store
-        results = self.embedding_store.query_timetable(query, n_results=5)
+        with stage_timer("query", "retrieval"):
+            results = self.embedding_store.query_timetable(query, n_results=5, user_id=user_id)
         
         if not results:
             return "No relevant timetable information found for your query."
@@ -263,8 +448,9 @@ Please provide a clear, organized response to the user's query based on the time
                 HumanMessage(content=human_prompt)
             ]
             
-            response = self.llm(messages)
-            return response.content
+            tier = self.router.choose_query_tier(query, context)
+            with stage_timer("query", "llm"):
+                return self.router.invoke_validated(messages, tier, lambda content: bool(content.strip()))
         
         except Exception as e:
             print(f"Error processing query: {str(e)}")
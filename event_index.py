@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from calendar_feed import DAY_CODES, parse_period_time
+from metrics import REGISTRY
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+# Longest lead /alerts accepts; an alert minute further back has no class still ahead
+MAX_ALERT_LEAD_MINUTES = 120
+
+ALERT_EVENTS = REGISTRY.gauge(
+    "timetable_alert_events",
+    "Pre-class alerts held in the weekly event index"
+)
+ALERTS_SENT = REGISTRY.counter(
+    "timetable_alerts_sent_total",
+    "Pre-class alerts delivered"
+)
+ALERTS_RATE_LIMITED = REGISTRY.counter(
+    "timetable_alerts_rate_limited_total",
+    "Alert sends Telegram asked to retry later (RetryAfter)"
+)
+ALERT_TICK_EVENTS = REGISTRY.histogram(
+    "timetable_alert_tick_events",
+    "Alerts due per scheduler tick",
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+)
+
+
+def minute_of_week(moment: datetime) -> int:
+    """Minutes since Monday 00:00 in the moment's own timezone."""
+    return moment.weekday() * 1440 + moment.hour * 60 + moment.minute
+
+
+class WeeklyEventIndex:
+    def __init__(self):
+        """
+        Every opted-in user's classes bucketed by the minute of the week their
+        alert fires, so a tick only looks at the bucket for the current minute
+        """
+        self._lock = threading.Lock()
+        self._buckets: Dict[int, Dict[int, List[Dict]]] = {}
+        self._user_minutes: Dict[int, Set[int]] = {}
+        self._size = 0
+
+    def set_user(self, user_id: int, timetable: Dict, lead_minutes: int) -> int:
+        """
+        Replace a user's alerts with the classes in their timetable
+
+        Args:
+            user_id (int): Telegram user ID
+            timetable (Dict): Structured timetable keyed by day
+            lead_minutes (int): How long before each class the alert fires
+
+        Returns:
+            int: Number of alerts indexed for the user
+        """
+        entries: Dict[int, List[Dict]] = {}
+        for day_index, day in enumerate(DAY_CODES):
+            for period in (timetable or {}).get(day) or []:
+                slot = parse_period_time(period.get("time", ""))
+                if slot is None:
+                    continue
+                (hour, minute), _ = slot
+                fires_at = (day_index * 1440 + hour * 60 + minute - lead_minutes) % MINUTES_PER_WEEK
+                entries.setdefault(fires_at, []).append({
+                    "day": day,
+                    "start": f"{hour:02d}:{minute:02d}",
+                    "lead_minutes": lead_minutes,
+                    "subject": period.get("subject") or "Class",
+                    "full_name": period.get("full_name", ""),
+                    "room": period.get("room", ""),
+                })
+
+        with self._lock:
+            self._remove_locked(user_id)
+            for fires_at, events in entries.items():
+                self._buckets.setdefault(fires_at, {})[user_id] = events
+                self._size += len(events)
+            if entries:
+                self._user_minutes[user_id] = set(entries)
+            ALERT_EVENTS.set(self._size)
+        return sum(len(events) for events in entries.values())
+
+    def remove_user(self, user_id: int) -> None:
+        with self._lock:
+            self._remove_locked(user_id)
+            ALERT_EVENTS.set(self._size)
+
+    def _remove_locked(self, user_id: int) -> None:
+        for fires_at in self._user_minutes.pop(user_id, ()):
+            bucket = self._buckets.get(fires_at)
+            if bucket is None:
+                continue
+            self._size -= len(bucket.pop(user_id, ()))
+            if not bucket:
+                del self._buckets[fires_at]
+
+    def due(self, minute: int, now: Optional[int] = None) -> List[Tuple[int, Dict]]:
+        """
+        Alerts that fire at a minute of the week
+
+        Args:
+            minute (int): Minute of the week the alerts fire at
+            now (int): Current minute of the week, when catching up on a missed
+                minute; only classes that haven't started are returned, with
+                lead_minutes set to the time actually left
+
+        Returns:
+            List[Tuple[int, Dict]]: (user_id, event) pairs
+        """
+        late = (now - minute) % MINUTES_PER_WEEK if now is not None else 0
+        with self._lock:
+            bucket = self._buckets.get(minute % MINUTES_PER_WEEK, {})
+            due = [(user_id, event) for user_id, events in bucket.items() for event in events]
+        if late:
+            due = [
+                (user_id, dict(event, lead_minutes=event["lead_minutes"] - late))
+                for user_id, event in due if event["lead_minutes"] > late
+            ]
+        ALERT_TICK_EVENTS.observe(len(due))
+        return due
+
+    def has_user(self, user_id: int) -> bool:
+        with self._lock:
+            return user_id in self._user_minutes
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class AlertClock:
+    def __init__(self, max_catch_up: int = MAX_ALERT_LEAD_MINUTES):
+        """
+        Hand out each minute of the week exactly once, catching up on minutes
+        a slow tick skipped. Only the last `max_catch_up` are replayed: alerts
+        from further back are for classes that have already started.
+        """
+        self.max_catch_up = max_catch_up
+        self._last: Optional[int] = None
+
+    def advance(self, now: datetime) -> List[int]:
+        current = minute_of_week(now)
+        if self._last is None:
+            self._last = current
+            return [current]
+
+        behind = (current - self._last) % MINUTES_PER_WEEK
+        self._last = current
+        # After a long stall (sleep, leader handover) older minutes only hold classes already under way
+        steps = min(behind, self.max_catch_up + 1)
+        return [(current - offset) % MINUTES_PER_WEEK for offset in reversed(range(steps))]
+
+
+class SendRateLimiter:
+    def __init__(self, rate: float):
+        """
+        Space out sends to stay under Telegram's bot-wide limit (~30 messages/s)
+
+        Args:
+            rate (float): Sends per second, 0 for no limit
+        """
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+    def pause(self, seconds: float) -> None:
+        """Hold every sender back, e.g. after Telegram answered RetryAfter."""
+        self._next = max(self._next, time.monotonic() + seconds)
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    204: "No Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPRequest:
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        split = urlsplit(target)
+        self.method = method
+        self.path = split.path
+        self.query = {key: values[-1] for key, values in parse_qs(split.query).items()}
+        self.headers = headers  # lower-cased names
+        self.body = body
+
+
+class HTTPResponse:
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = "text/plain; charset=utf-8",
+                 headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.headers = {"Content-Type": content_type}
+        if headers:
+            self.headers.update(headers)
+
+
+Handler = Callable[[HTTPRequest], Awaitable[HTTPResponse]]
+
+
+class AsyncHTTPServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Minimal asyncio HTTP/1.1 server for local endpoints (metrics, webhook, feeds)
+
+        Args:
+            host (str): Listen address
+            port (int): Listen port, 0 picks a free port
+        """
+        self.host = host
+        self.port = port
+        self._exact_routes: Dict[Tuple[str, str], Handler] = {}
+        self._prefix_routes: List[Tuple[str, str, Handler]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def add_route(self, method: str, path: str, handler: Handler, prefix: bool = False) -> None:
+        """
+        Register a handler for an exact path, or for every path under a prefix
+
+        Args:
+            method (str): HTTP method, e.g. "GET"
+            path (str): Path or path prefix
+            handler (Handler): Coroutine returning an HTTPResponse
+            prefix (bool): Match every path starting with `path`
+        """
+        if prefix:
+            self._prefix_routes.append((method.upper(), path, handler))
+            self._prefix_routes.sort(key=lambda route: len(route[1]), reverse=True)
+        else:
+            self._exact_routes[(method.upper(), path)] = handler
+
+    def _resolve(self, method: str, path: str) -> Tuple[Optional[Handler], bool]:
+        handler = self._exact_routes.get((method, path))
+        if handler:
+            return handler, True
+        known_path = any(route_path == path for _, route_path in self._exact_routes)
+        for route_method, route_prefix, route_handler in self._prefix_routes:
+            if path.startswith(route_prefix):
+                if route_method == method:
+                    return route_handler, True
+                known_path = True
+        return None, known_path
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            response = await self._read_and_dispatch(reader)
+        except Exception as e:
+            logger.error(f"HTTP handler error: {str(e)}")
+            response = HTTPResponse(500, b"internal error")
+
+        try:
+            await self._write_response(writer, response)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_and_dispatch(self, reader: asyncio.StreamReader) -> HTTPResponse:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return HTTPResponse(400, b"bad request")
+        if len(head) > MAX_HEADER_BYTES:
+            return HTTPResponse(400, b"headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return HTTPResponse(400, b"bad request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_BYTES:
+            return HTTPResponse(413, b"payload too large")
+        body = await reader.readexactly(length) if length else b""
+
+        request = HTTPRequest(method.upper(), target, headers, body)
+        handler, known_path = self._resolve(request.method, request.path)
+        if handler is None:
+            return HTTPResponse(405 if known_path else 404, b"")
+        return await handler(request)
+
+    async def _write_response(self, writer: asyncio.StreamWriter, response: HTTPResponse) -> None:
+        reason = REASONS.get(response.status, "")
+        head = [f"HTTP/1.1 {response.status} {reason}"]
+        headers = dict(response.headers)
+        headers["Content-Length"] = str(len(response.body))
+        headers["Connection"] = "close"
+        for name, value in headers.items():
+            head.append(f"{name}: {value}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body)
+        await writer.drain()
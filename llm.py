@@ -1,19 +1,114 @@
-from langchain_groq import ChatGroq
 from langchain.schema import HumanMessage, SystemMessage
 import json
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 import os
+import re
+
+from model_router import LARGE_TIER, SMALL_TIER, ModelRouter
+from profiling import trace_span, traced
+from result_cache import content_hash
+from singleflight import SingleFlight
+
+class DayStreamParser:
+    def __init__(self):
+        """
+        Incremental parser for a streamed JSON object of day -> list of periods.
+        
+        Tracks nesting and string state across chunks and returns each
+        top-level array as soon as its closing bracket arrives; complete is set
+        once the whole object has closed, so a truncated stream can be told apart.
+        """
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.key_start = None
+        self.last_key = None
+        self.value_start = None
+        self.complete = False
+    
+    def feed(self, piece: str) -> List[Tuple[str, List]]:
+        """
+        Add streamed text
+        
+        Returns:
+            List[Tuple[str, List]]: (day, periods) for every array completed by this piece
+        """
+        self.buffer += piece
+        completed = []
+        
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.key_start is not None:
+                        self.last_key = json.loads(self.buffer[self.key_start:self.pos + 1])
+                        self.key_start = None
+            elif ch == '"':
+                self.in_string = True
+                if self.depth == 1:
+                    self.key_start = self.pos
+            elif ch in "[{":
+                if self.depth == 1 and ch == "[":
+                    self.value_start = self.pos
+                self.depth += 1
+            elif ch in "]}":
+                self.depth -= 1
+                if self.depth == 0 and ch == "}":
+                    self.complete = True
+                if self.depth == 1 and ch == "]" and self.value_start is not None:
+                    try:
+                        completed.append((self.last_key, json.loads(self.buffer[self.value_start:self.pos + 1])))
+                    except json.JSONDecodeError as e:
+                        print(f"JSON parsing error in streamed day {self.last_key}: {str(e)}")
+                    self.value_start = None
+            
+            self.pos += 1
+        
+        return completed
+
 
 class TimetableProcessor:
-    def __init__(self, groq_api_key: str):
+    def __init__(self, groq_api_key: str, router: Optional[ModelRouter] = None, result_cache=None):
        
-        self.llm = ChatGroq(
-            groq_api_key=groq_api_key,
-            model_name="llama-3.3-70b-versatile",  # or "llama2-70b-4096"
-            temperature=0.1
-        )
+        self.router = router or ModelRouter(groq_api_key)
+        # Structured timetables keyed by the OCR text, so the same sheet is only structured once
+        self.result_cache = result_cache
+        # Keyed like the cache, so identical sheets structured at the same time share one LLM call
+        self.inflight = SingleFlight("structuring")
     
-    def structure_timetable(self, extracted_text: str) -> str:
+    def cache_key(self, extracted_text: str) -> str:
+        # OCR output of the same sheet varies in whitespace; model names are included so a model change misses
+        normalized = re.sub(r"\s+", " ", extracted_text).strip()
+        return content_hash("structure", normalized, json.dumps(self.router.models, sort_keys=True))
+    
+    def _cached(self, extracted_text: str) -> Optional[Dict]:
+        if self.result_cache is None:
+            return None
+        try:
+            cached = self.result_cache.get(self.cache_key(extracted_text))
+        except Exception as e:
+            print(f"Error reading structuring cache: {str(e)}")
+            return None
+        return cached if self.is_valid_timetable(cached) else None
+    
+    def _remember(self, extracted_text: str, structured_data: Dict) -> None:
+        # Only good results are kept, a failed structuring should be retried
+        if self.result_cache is None or not self.is_valid_timetable(structured_data):
+            return
+        try:
+            self.result_cache.set(self.cache_key(extracted_text), structured_data)
+        except Exception as e:
+            print(f"Error writing structuring cache: {str(e)}")
+    
+    def build_messages(self, extracted_text: str) -> List:
         
         system_prompt = """You are a timetable processing assistant. Your task is to analyze the extracted text from a college timetable image and structure it into a clean, organized format.
 
@@ -49,19 +144,119 @@ If you cannot clearly identify a schedule, return an empty JSON object {}."""
 
 Focus on Monday to Saturday only. Extract time slots, subjects, labs, and any room information available."""
 
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=human_prompt)
+        ]
+    
+    @traced("llm.structure")
+    def structure_timetable(self, extracted_text: str, tier: Optional[str] = None) -> str:
+        
         try:
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=human_prompt)
-            ]
+            messages = self.build_messages(extracted_text)
+            
+            if tier is None:
+                tier = self.router.choose_structuring_tier(extracted_text)
             
-            response = self.llm(messages)
-            return response.content
+            # Small model output that does not parse is retried on the large model
+            return self.router.invoke_validated(
+                messages,
+                tier,
+                lambda content: self.is_valid_timetable(self.validate_and_clean_json(content))
+            )
         
         except Exception as e:
             print(f"Error processing with LLM: {str(e)}")
             return "{}"
     
+    def stream_timetable(self, extracted_text: str, on_day: Optional[Callable[[str, List[Dict]], None]] = None,
+                         tier: Optional[str] = None) -> Dict:
+        """
+        Structure extracted text, reporting each day as soon as the model finishes it
+        
+        Days passed to on_day are only a preview. The returned timetable is the
+        one to store: it comes from a stream that closed and validated, or, when
+        a small-model stream was cut short or invalid, from the large model as in
+        process_timetable.
+        
+        Args:
+            extracted_text (str): Raw extracted text from image
+            on_day (Callable): Called with each day name and its periods as they arrive
+            tier (str): Model tier, chosen from the text if not given
+            
+        Returns:
+            Dict: Structured timetable data, {} if none was found
+        """
+        cached = self._cached(extracted_text)
+        if cached is None:
+            streamed = []
+            
+            def stream() -> Dict:
+                streamed.append(True)
+                return self._stream_uncoalesced(extracted_text, on_day, tier)
+            
+            cached = self.inflight.do(self.cache_key(extracted_text), stream)
+            if streamed:
+                return cached
+        
+        # Cached, or someone else structured this text; their days arrive all at once
+        if on_day is not None and self.is_valid_timetable(cached):
+            for day, periods in cached.items():
+                on_day(day, periods)
+        return cached
+    
+    def _stream_uncoalesced(self, extracted_text: str, on_day: Optional[Callable[[str, List[Dict]], None]],
+                            tier: Optional[str]) -> Dict:
+        
+        if tier is None:
+            tier = self.router.choose_structuring_tier(extracted_text)
+        
+        parser = DayStreamParser()
+        streamed = {}
+        try:
+            with trace_span("llm.stream"):
+                for piece in self.router.stream(self.build_messages(extracted_text), tier, json_mode=True):
+                    for day, periods in parser.feed(piece):
+                        if isinstance(periods, list) and all(isinstance(period, dict) for period in periods):
+                            streamed[day] = periods
+                            if on_day is not None:
+                                on_day(day, periods)
+        except Exception as e:
+            print(f"Streaming structuring failed: {str(e)}")
+        else:
+            if parser.complete and self.is_valid_timetable(streamed):
+                self._remember(extracted_text, streamed)
+                return streamed
+        
+        # A broken, truncated or invalid stream gets the validated path instead,
+        # escalating past the small model the way invoke_validated does
+        if tier == SMALL_TIER:
+            self.router.record_escalation(SMALL_TIER)
+            tier = LARGE_TIER
+        return self._process_uncoalesced(extracted_text, tier)
+    
+    def is_valid_timetable(self, timetable_data: Dict) -> bool:
+        """
+        Check that parsed data looks like a timetable: day names mapped to lists of periods
+        
+        Args:
+            timetable_data (Dict): Parsed LLM output
+            
+        Returns:
+            bool: True if the data has at least one day with a list of period dicts
+        """
+        if not isinstance(timetable_data, dict) or not timetable_data:
+            return False
+        
+        for periods in timetable_data.values():
+            if not isinstance(periods, list):
+                return False
+            if any(not isinstance(period, dict) for period in periods):
+                return False
+        
+        # {"Monday": [], ...} is what a model that found nothing tends to return
+        return any(periods for periods in timetable_data.values())
+    
     def validate_and_clean_json(self, llm_response: str) -> Dict:
         
         try:
@@ -93,14 +288,56 @@ Focus on Monday to Saturday only. Extract time slots, subjects, labs, and any ro
         Returns:
             Dict: Structured timetable data
         """
+        return self.inflight.do(self.cache_key(extracted_text), lambda: self._process_uncoalesced(extracted_text))
+    
+    def _process_uncoalesced(self, extracted_text: str, tier: Optional[str] = None) -> Dict:
+        
+        cached = self._cached(extracted_text)
+        if cached is not None:
+            return cached
+        
         # Get structured response from LLM
-        llm_response = self.structure_timetable(extracted_text)
+        llm_response = self.structure_timetable(extracted_text, tier)
         
         # Validate and clean the JSON
         structured_data = self.validate_and_clean_json(llm_response)
         
+        self._remember(extracted_text, structured_data)
         return structured_data
     
+    def merge_timetables(self, timetables: List[Dict]) -> Dict:
+        """
+        Merge structured timetables from several pages into one
+        
+        Args:
+            timetables (List[Dict]): Per-page structured timetables, in page order
+            
+        Returns:
+            Dict: Combined timetable with duplicate periods removed
+        """
+        merged = {}
+        seen = set()
+        
+        for timetable in timetables:
+            if not self.is_valid_timetable(timetable):
+                continue
+            
+            for day, periods in timetable.items():
+                day_periods = merged.setdefault(day, [])
+                for period in periods:
+                    # The same period often appears on overlapping pages or section sheets
+                    key = (
+                        day,
+                        str(period.get('time', '')).replace(' ', '').lower(),
+                        str(period.get('subject', '')).strip().lower()
+                    )
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    day_periods.append(period)
+        
+        return merged
+    
     def format_for_display(self, timetable_data: Dict) -> str:
         """
         Format timetable data for display in Telegram messages
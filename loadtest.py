@@ -0,0 +1,682 @@
+"""
+End-to-end load test for TimetableBot.
+
+Runs the real bot handlers against in-process stand-ins for the Telegram Bot
+API, the Groq chat endpoint and LlamaParse, each with its own latency
+distribution, and drives it with simulated users.
+
+    python loadtest.py --users 50 --duration 60 --groq-latency lognormal:0.6,0.4
+    python loadtest.py --users 20 --json results.json --baseline last.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from http_server import AsyncHTTPServer, HTTPRequest, HTTPResponse
+
+FAKE_TOKEN = "123456:LOADTEST"
+
+SAMPLE_TIMETABLE = {
+    "Monday": [
+        {"time": "9:00-9:55", "subject": "DSA", "full_name": "Data Structures and Algorithms", "type": "Theory", "room": "NC34"},
+        {"time": "10:00-10:55", "subject": "OS", "full_name": "Operating Systems", "type": "Theory", "room": "NC34"},
+        {"time": "2:00-4:00", "subject": "DSA Lab", "full_name": "Data Structures Lab", "type": "Lab", "room": "L2"},
+    ],
+    "Tuesday": [
+        {"time": "9:00-9:55", "subject": "DBMS", "full_name": "Database Management Systems", "type": "Theory", "room": "NC21"},
+        {"time": "11:00-11:55", "subject": "CN", "full_name": "Computer Networks", "type": "Theory", "room": "NC21"},
+    ],
+    "Wednesday": [
+        {"time": "9:00-9:55", "subject": "OS", "full_name": "Operating Systems", "type": "Theory", "room": "NC34"},
+        {"time": "10:00-12:00", "subject": "DBMS Lab", "full_name": "Database Lab", "type": "Lab", "room": "L4"},
+    ],
+    "Thursday": [
+        {"time": "9:00-9:55", "subject": "CN", "full_name": "Computer Networks", "type": "Theory", "room": "NC21"},
+        {"time": "10:00-10:55", "subject": "DSA", "full_name": "Data Structures and Algorithms", "type": "Theory", "room": "NC34"},
+    ],
+    "Friday": [
+        {"time": "9:00-9:55", "subject": "MATHS", "full_name": "Discrete Mathematics", "type": "Theory", "room": "NC12"},
+    ],
+    "Saturday": [],
+}
+
+SAMPLE_OCR_TEXT = "\n".join(
+    f"{day} {period['time']} {period['subject']} {period['room']}"
+    for day, periods in SAMPLE_TIMETABLE.items()
+    for period in periods
+)
+
+QUERIES = [
+    "What classes do I have on Monday?",
+    "When is my DSA lecture?",
+    "Do I have any free periods on Wednesday?",
+    "Which room is Computer Networks in?",
+    "What's my first class on Thursday?",
+    "How many labs do I have this week?",
+]
+
+
+class LatencyDistribution:
+    def __init__(self, spec: str):
+        """
+        Parse a latency spec in seconds
+
+        Args:
+            spec (str): "const:S", "uniform:LO,HI", "exp:MEAN" or "lognormal:MEDIAN,SIGMA"
+        """
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        values = [float(v) for v in params.split(",") if v.strip()]
+        self.kind = kind.strip().lower()
+
+        if self.kind == "const" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif self.kind == "uniform" and len(values) == 2:
+            self._sample = lambda: random.uniform(values[0], values[1])
+        elif self.kind == "exp" and len(values) == 1:
+            self._sample = lambda: random.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+        elif self.kind == "lognormal" and len(values) == 2:
+            self._sample = lambda: random.lognormvariate(math.log(values[0]), values[1])
+        else:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    def sample(self) -> float:
+        return max(0.0, self._sample())
+
+
+def make_png(width: int = 8, height: int = 8) -> bytes:
+    """Build a small white RGB PNG without any imaging dependency."""
+    raw = b"".join(b"\x00" + b"\xff\xff\xff" * width for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def _json_response(payload, status: int = 200) -> HTTPResponse:
+    return HTTPResponse(status, json.dumps(payload).encode("utf-8"), content_type="application/json")
+
+
+def _parse_form(request: HTTPRequest) -> Dict[str, str]:
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        return {k: v if isinstance(v, str) else json.dumps(v) for k, v in json.loads(request.body or b"{}").items()}
+    if content_type.startswith("multipart/form-data"):
+        fields = {}
+        for match in re.finditer(rb'name="([^"]+)"(?:; filename="[^"]*")?\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', request.body, re.S):
+            fields[match.group(1).decode()] = match.group(2).decode("utf-8", "replace")
+        return fields
+    return {key: values[-1] for key, values in parse_qs(request.body.decode("utf-8")).items()}
+
+
+class FakeTelegramAPI:
+    def __init__(self, latency: LatencyDistribution):
+        """
+        Stand-in for the Bot API methods the bot calls, recording every outgoing message per chat
+        """
+        self.latency = latency
+        self.photo = make_png()
+        self.messages: Dict[int, List[str]] = {}
+        self.requests = 0
+        self._message_id = 0
+        self._lock = threading.Lock()
+
+    def register(self, server: AsyncHTTPServer) -> None:
+        server.add_route("POST", f"/bot{FAKE_TOKEN}/", self.handle_method, prefix=True)
+        server.add_route("GET", f"/file/bot{FAKE_TOKEN}/", self.handle_file, prefix=True)
+
+    def chat_messages(self, chat_id: int) -> List[str]:
+        with self._lock:
+            return list(self.messages.get(chat_id, []))
+
+    def _message(self, chat_id: int, text: str) -> Dict:
+        with self._lock:
+            self._message_id += 1
+            self.messages.setdefault(chat_id, []).append(text)
+            message_id = self._message_id
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    async def handle_method(self, request: HTTPRequest) -> HTTPResponse:
+        self.requests += 1
+        await asyncio.sleep(self.latency.sample())
+
+        method = request.path.rsplit("/", 1)[-1]
+        params = _parse_form(request)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        elif method in ("sendMessage", "editMessageText", "sendDocument"):
+            chat_id = int(params.get("chat_id", 0))
+            result = self._message(chat_id, params.get("text") or params.get("caption") or f"<{method}>")
+        elif method == "getFile":
+            file_id = params.get("file_id", "photo")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.photo),
+                      "file_path": f"photos/{file_id}.png"}
+        elif method == "getUpdates":
+            await asyncio.sleep(float(params.get("timeout", 0) or 0))
+            result = []
+        else:
+            result = True
+
+        return _json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: HTTPRequest) -> HTTPResponse:
+        self.requests += 1
+        await asyncio.sleep(self.latency.sample())
+        return HTTPResponse(200, self.photo, content_type="image/png")
+
+
+class FakeGroqAPI:
+    def __init__(self, latency: LatencyDistribution):
+        """
+        Stand-in for the OpenAI-compatible Groq chat completions endpoint
+        """
+        self.latency = latency
+        self.requests = 0
+
+    def register(self, server: AsyncHTTPServer) -> None:
+        server.add_route("POST", "/openai/v1/chat/completions", self.handle_completion)
+
+    async def handle_completion(self, request: HTTPRequest) -> HTTPResponse:
+        self.requests += 1
+        await asyncio.sleep(self.latency.sample())
+
+        payload = json.loads(request.body or b"{}")
+        prompt = " ".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        if "timetable processing assistant" in prompt:
+            content = json.dumps(SAMPLE_TIMETABLE)
+        else:
+            content = "📅 You have DSA at 9:00-9:55 in NC34 and OS at 10:00-10:55."
+
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                 "total_tokens": (len(prompt) + len(content)) // 4}
+        if payload.get("stream"):
+            return self._stream_response(payload, content, usage)
+
+        return _json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream_response(self, payload: Dict, content: str, usage: Dict) -> HTTPResponse:
+        # Server-sent events in one body; enough for clients that parse the stream line by line
+        events = []
+        pieces = [content[i:i + 40] for i in range(0, len(content), 40)] or [""]
+        for index, piece in enumerate(pieces):
+            last = index == len(pieces) - 1
+            chunk = {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": "stop" if last else None}],
+            }
+            if last:
+                chunk["x_groq"] = {"usage": usage}
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return HTTPResponse(200, "".join(events).encode(), content_type="text/event-stream")
+
+
+class FakeLlamaParseAPI:
+    def __init__(self, latency: LatencyDistribution):
+        """
+        Stand-in for the LlamaParse upload / job status / result endpoints
+        """
+        self.latency = latency
+        self.requests = 0
+        self._jobs: Dict[str, float] = {}
+
+    def register(self, server: AsyncHTTPServer) -> None:
+        server.add_route("POST", "/api/parsing/upload", self.handle_upload)
+        server.add_route("GET", "/api/parsing/job/", self.handle_job, prefix=True)
+
+    async def handle_upload(self, request: HTTPRequest) -> HTTPResponse:
+        self.requests += 1
+        job_id = f"job-{self.requests}-{random.getrandbits(32):x}"
+        self._jobs[job_id] = time.monotonic() + self.latency.sample()
+        return _json_response({"id": job_id, "status": "PENDING"})
+
+    async def handle_job(self, request: HTTPRequest) -> HTTPResponse:
+        self.requests += 1
+        parts = request.path.split("/")
+        job_id = parts[4] if len(parts) > 4 else ""
+        ready_at = self._jobs.get(job_id)
+        if ready_at is None:
+            return _json_response({"detail": "job not found"}, status=404)
+
+        if "/result/" in request.path:
+            return _json_response({"text": SAMPLE_OCR_TEXT, "markdown": SAMPLE_OCR_TEXT,
+                                   "job_metadata": {"credits_used": 1, "job_pages": 1}})
+        status = "SUCCESS" if time.monotonic() >= ready_at else "PENDING"
+        return _json_response({"id": job_id, "status": status})
+
+
+class FakeServices:
+    def __init__(self, telegram_latency: str, groq_latency: str, llama_latency: str):
+        """
+        Run the fake APIs on their own event loop thread, so blocking calls made
+        by the bot can never deadlock against the servers they are waiting on
+        """
+        self.telegram = FakeTelegramAPI(LatencyDistribution(telegram_latency))
+        self.groq = FakeGroqAPI(LatencyDistribution(groq_latency))
+        self.llama = FakeLlamaParseAPI(LatencyDistribution(llama_latency))
+        self.server = AsyncHTTPServer("127.0.0.1", 0)
+        for service in (self.telegram, self.groq, self.llama):
+            service.register(self.server)
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.port}"
+
+    def start(self) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self._loop).result()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.01, threshold: float = 0.005):
+        """
+        Measure event-loop blocking as the overshoot of a periodic sleep
+
+        Args:
+            interval (float): Sleep interval in seconds
+            threshold (float): Overshoot counted as blocking
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked_seconds = 0.0
+        self.max_stall = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            overshoot = time.perf_counter() - start - self.interval
+            if overshoot > self.threshold:
+                self.blocked_seconds += overshoot
+                self.stalls += 1
+                self.max_stall = max(self.max_stall, overshoot)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_id = 0
+        self._message_id = 0
+
+    def _next_ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    def message(self, user_id: int, text: Optional[str] = None, photo: bool = False) -> Dict:
+        update_id, message_id = self._next_ids()
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+        }
+        if photo:
+            message["photo"] = [{"file_id": f"photo{user_id}", "file_unique_id": f"photo{user_id}",
+                                 "width": 8, "height": 8, "file_size": 100}]
+        else:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.services = FakeServices(args.telegram_latency, args.groq_latency, args.llama_latency)
+        self.factory = UpdateFactory()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.completed = 0
+        self.ordering_violations = 0
+        self.bot = None
+        self.app = None
+
+    def build_bot(self, workdir: str):
+        from telegram.ext import Application
+        from config import BotConfig
+        from main import TimetableBot
+
+        base = self.services.base_url
+        # Keep tuning settings from the environment, but never talk to real services
+        config = BotConfig.from_env()
+        # Every file the bot writes goes to the run's scratch directory: the real
+        # state store and caches stay untouched, and each run starts cold
+        config.chroma_path = os.path.join(workdir, "chroma")
+        config.state_store_path = os.path.join(workdir, "bot_state.sqlite3")
+        config.embedding_cache_path = os.path.join(workdir, "embedding_cache.sqlite3")
+        config.result_cache_path = os.path.join(workdir, "result_cache.sqlite3")
+        config.profile_dir = os.path.join(workdir, "profiles")
+        config.groq_base_url = base
+        config.llama_base_url = base
+        config.metrics_port = 0
+
+        self.bot = TimetableBot(FAKE_TOKEN, "llx-loadtest", "gsk-loadtest", config=config)
+        builder = (
+            Application.builder()
+            .token(FAKE_TOKEN)
+            .base_url(f"{base}/bot")
+            .base_file_url(f"{base}/file/bot")
+            .pool_timeout(30)
+        )
+        self.app = self.bot.build_application(builder)
+
+    async def send(self, command: str, data: Dict, user_id: int) -> None:
+        from telegram import Update
+
+        update = Update.de_json(data, self.app.bot)
+        seen = len(self.services.telegram.chat_messages(user_id))
+
+        start = time.perf_counter()
+        # Go through the update processor so the bot's real concurrency settings apply
+        await self.app.update_processor.process_update(update, self.app.process_update(update))
+        elapsed = time.perf_counter() - start
+
+        self.latencies.setdefault(command, []).append(elapsed)
+        self.completed += 1
+        replies = self.services.telegram.chat_messages(user_id)[seen:]
+        if any("error" in reply.lower() or reply.startswith("Sorry") for reply in replies):
+            self.errors[command] = self.errors.get(command, 0) + 1
+
+    async def send_back_to_back(self, user_id: int) -> None:
+        """
+        Send /upload and a photo without waiting in between, like a fast client.
+        If the photo is handled before /upload, the bot asks for /upload first,
+        which means the user's updates ran out of order.
+        """
+        seen = len(self.services.telegram.chat_messages(user_id))
+        # Tasks start in creation order, just like the application's own update tasks
+        await asyncio.gather(
+            self.send("upload", self.factory.message(user_id, "/upload"), user_id),
+            self.send("photo", self.factory.message(user_id, photo=True), user_id),
+        )
+        replies = self.services.telegram.chat_messages(user_id)[seen:]
+        if any("use /upload command first" in reply for reply in replies):
+            self.ordering_violations += 1
+
+    async def send_bystanders(self, user_ids: List[int]) -> List[float]:
+        """Have each user send one quick command at once, returning their latencies."""
+        async def one(user_id: int) -> float:
+            start = time.perf_counter()
+            await self.send("bystander", self.factory.message(user_id, "/tomorrow"), user_id)
+            return time.perf_counter() - start
+
+        return list(await asyncio.gather(*(one(user_id) for user_id in user_ids)))
+
+    async def check_burst_fairness(self, burst_user: int) -> Optional[Dict]:
+        """
+        Fire a burst of commands from one user, then measure other users' quick
+        commands while it is queued. A user's queued updates only wait for that
+        user's turn, so the others should be no slower than with no burst.
+        (/tomorrow rather than queries: admission caps a user's queued queries,
+        while commands hold their turn for the whole handler.)
+        """
+        workers = self.bot.config.max_concurrent_updates
+        if workers <= 1:
+            return None  # updates run one at a time anyway; nothing to compare
+
+        size = self.args.burst or 4 * workers
+        bystanders = [20_000 + i for i in range(self.args.bystanders)]
+        alone = await self.send_bystanders(bystanders)
+
+        burst = [
+            asyncio.ensure_future(self.send("burst", self.factory.message(burst_user, "/tomorrow"), burst_user))
+            for _ in range(size)
+        ]
+        await asyncio.sleep(0)  # the whole burst is queued before the others arrive
+        during = await self.send_bystanders(bystanders)
+        await asyncio.gather(*burst)
+
+        alone_p50, during_p50 = percentile(alone, 0.50), percentile(during, 0.50)
+        return {
+            "burst_updates": size,
+            "bystanders": len(bystanders),
+            "p50_alone": alone_p50,
+            "p50_during_burst": during_p50,
+            "delayed": during_p50 > alone_p50 + self.args.fairness_slack,
+        }
+
+    async def simulate_user(self, user_id: int, deadline: float) -> None:
+        await self.send("start", self.factory.message(user_id, "/start"), user_id)
+        await self.send_back_to_back(user_id)
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(random.uniform(0, self.args.think_time))
+            roll = random.random()
+            if roll < self.args.reupload_ratio:
+                await self.send_back_to_back(user_id)
+            elif roll < 0.8:
+                await self.send("query", self.factory.message(user_id, random.choice(QUERIES)), user_id)
+            elif roll < 0.9:
+                await self.send("tomorrow", self.factory.message(user_id, "/tomorrow"), user_id)
+            else:
+                await self.send("schedule", self.factory.message(user_id, "/schedule"), user_id)
+
+    async def run(self) -> Dict:
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        self.services.start()
+        monitor = LoopMonitor()
+        try:
+            self.build_bot(workdir)
+            await self.app.initialize()
+            await self.app.start()
+            monitor.start()
+
+            start = time.perf_counter()
+            deadline = time.monotonic() + self.args.duration
+            users = [self.simulate_user(10_000 + i, deadline) for i in range(self.args.users)]
+            await asyncio.gather(*users)
+            wall = time.perf_counter() - start
+            # After the timed run, so the burst doesn't skew throughput
+            fairness = await self.check_burst_fairness(10_000)
+
+            await monitor.stop()
+            await self.app.stop()
+            await self.app.shutdown()
+        finally:
+            self.services.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        return self.report(wall, monitor, fairness)
+
+    def report(self, wall: float, monitor: LoopMonitor, fairness: Optional[Dict] = None) -> Dict:
+        commands = {}
+        for command, values in sorted(self.latencies.items()):
+            commands[command] = {
+                "count": len(values),
+                "errors": self.errors.get(command, 0),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "max": max(values),
+            }
+        return {
+            "users": self.args.users,
+            "duration_seconds": wall,
+            "updates": self.completed,
+            "ordering_violations": self.ordering_violations,
+            "burst_fairness": fairness,
+            "throughput_updates_per_second": self.completed / wall if wall else 0.0,
+            "commands": commands,
+            "event_loop": {
+                "blocked_seconds": monitor.blocked_seconds,
+                "blocked_ratio": monitor.blocked_seconds / wall if wall else 0.0,
+                "max_stall_seconds": monitor.max_stall,
+                "stalls": monitor.stalls,
+            },
+            "fake_requests": {
+                "telegram": self.services.telegram.requests,
+                "groq": self.services.groq.requests,
+                "llamaparse": self.services.llama.requests,
+            },
+            "latency_specs": {
+                "telegram": self.args.telegram_latency,
+                "groq": self.args.groq_latency,
+                "llamaparse": self.args.llama_latency,
+            },
+        }
+
+
+def print_report(report: Dict) -> None:
+    print(f"\nUsers: {report['users']}  Updates: {report['updates']}  "
+          f"Wall: {report['duration_seconds']:.1f}s  "
+          f"Throughput: {report['throughput_updates_per_second']:.2f} updates/s")
+    print(f"{'command':<10} {'count':>6} {'errors':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for command, stats in report["commands"].items():
+        print(f"{command:<10} {stats['count']:>6} {stats['errors']:>6} {stats['p50']:>8.3f} "
+              f"{stats['p95']:>8.3f} {stats['p99']:>8.3f} {stats['max']:>8.3f}")
+    if report["ordering_violations"]:
+        print(f"Out-of-order updates: {report['ordering_violations']} users saw a photo handled before /upload")
+    fairness = report["burst_fairness"]
+    if fairness:
+        print(f"Burst of {fairness['burst_updates']} from one user: others' p50 "
+              f"{fairness['p50_alone']:.3f}s alone, {fairness['p50_during_burst']:.3f}s during"
+              f"{' (DELAYED)' if fairness['delayed'] else ''}")
+    loop = report["event_loop"]
+    print(f"Event loop blocked {loop['blocked_seconds']:.2f}s ({loop['blocked_ratio']:.1%}), "
+          f"max stall {loop['max_stall_seconds']:.3f}s over {loop['stalls']} stalls")
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    List per-command p95 regressions beyond the tolerance (e.g. 0.2 = 20% slower)
+    """
+    regressions = []
+    for command, stats in report["commands"].items():
+        previous = baseline.get("commands", {}).get(command)
+        if previous and previous["p95"] > 0 and stats["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append(f"{command}: p95 {previous['p95']:.3f}s -> {stats['p95']:.3f}s")
+    previous_throughput = baseline.get("throughput_updates_per_second", 0)
+    if previous_throughput and report["throughput_updates_per_second"] < previous_throughput * (1 - tolerance):
+        regressions.append(f"throughput: {previous_throughput:.2f} -> {report['throughput_updates_per_second']:.2f} updates/s")
+    return regressions
+
+
+def error_rate_failures(report: Dict, max_error_rate: float) -> List[str]:
+    """
+    List commands whose share of error replies is above the allowed rate
+    """
+    failing = []
+    for command, stats in report["commands"].items():
+        rate = stats["errors"] / stats["count"] if stats["count"] else 0.0
+        if stats["errors"] and rate > max_error_rate:
+            failing.append(f"{command}: {stats['errors']} of {stats['count']} updates ({rate:.1%})")
+    return failing
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test TimetableBot against local API stand-ins")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds each user keeps sending after setup")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Max random pause between a user's updates")
+    parser.add_argument("--reupload-ratio", type=float, default=0.05, help="Share of actions that re-upload a timetable")
+    parser.add_argument("--telegram-latency", default="lognormal:0.03,0.5", help="Fake Telegram API latency spec")
+    parser.add_argument("--groq-latency", default="lognormal:0.5,0.5", help="Fake Groq latency spec")
+    parser.add_argument("--llama-latency", default="lognormal:2.0,0.4", help="Fake LlamaParse job latency spec")
+    parser.add_argument("--burst", type=int, default=None, help="Updates in the one-user burst, defaults to four times MAX_CONCURRENT_UPDATES")
+    parser.add_argument("--bystanders", type=int, default=5, help="Other users measured during the burst")
+    parser.add_argument("--fairness-slack", type=float, default=0.25, help="Seconds the burst may add to other users' p50")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Share of a command's updates allowed to get an error reply")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    parser.add_argument("--json", dest="json_path", help="Write the report as JSON to this path")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 / throughput regression vs baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if report["ordering_violations"] or (report["burst_fairness"] or {}).get("delayed"):
+        return 1
+
+    failing = error_rate_failures(report, args.max_error_rate)
+    if failing:
+        print("\nError replies above --max-error-rate:")
+        for line in failing:
+            print(f"  - {line}")
+        return 1
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,48 +6,155 @@ from datetime import datetime, timedelta
 import pytz
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.error import RetryAfter
 import asyncio
 import os
+import signal
 import json
+import hashlib
 from io import BytesIO
 
+from config import BotConfig
 from text_extraction import TextExtractor
 from llm import TimetableProcessor
-from embeddings import TimetableEmbeddingStore, TimetableQueryProcessor
+from embeddings import TimetableEmbeddingStore, TimetableQueryProcessor, EMBEDDING_MODEL_NAME, timetable_documents
+from compute_pool import ComputePool
+from embedding_cache import EmbeddingCache
+from result_cache import ResultCache
+from singleflight import SINGLEFLIGHT_SAVED
+from write_behind import VECTOR_QUEUE_DEPTH, VECTOR_FLUSH_SECONDS
+from model_router import ModelRouter
+from metrics import REGISTRY, HANDLER_SECONDS, STAGE_SECONDS, CACHE_REQUESTS, REMINDER_LAG_SECONDS, stage_timer
+from http_server import AsyncHTTPServer, HTTPResponse
+from admission import AdmissionController
+from update_processor import UserOrderedUpdateProcessor
+from webhook import WebhookServer, resolve_secret, webhook_url
+from state_store import SQLiteStateStore, StoreMapping, LeaderElector
+from session_cache import SessionCache
+from cluster import ClusterSupervisor, REMINDER_LEASE
+from calendar_feed import CalendarFeedCache, CalendarFeedServer
+from event_index import WeeklyEventIndex, AlertClock, SendRateLimiter, ALERTS_SENT, ALERTS_RATE_LIMITED, minute_of_week
+from profiling import RequestProfiler, install_log_filter
 
 
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
     level=logging.INFO
 )
+install_log_filter()
 logger = logging.getLogger(__name__)
 
+# Bot API limit for files bots can download
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+
+class MediaGroupFilter(filters.MessageFilter):
+    """Messages that belong to an album."""
+    def filter(self, message) -> bool:
+        return message.media_group_id is not None
+
 class TimetableBot:
-    def __init__(self, telegram_token: str, llama_api_key: str, groq_api_key: str):
+    def __init__(self, telegram_token: str, llama_api_key: str, groq_api_key: str, config: BotConfig = None):
         
         self.telegram_token = telegram_token
         self.groq_api_key = groq_api_key
+        self.config = config or BotConfig()
         
         # Initialize classes
-        self.text_extractor = TextExtractor(llama_api_key)
-        self.timetable_processor = TimetableProcessor(groq_api_key)
-        self.embedding_store = TimetableEmbeddingStore()
-        self.query_processor = TimetableQueryProcessor(groq_api_key, self.embedding_store)
+        self.model_router = ModelRouter(groq_api_key, self.config)
+        self.compute_pool = ComputePool(
+            EMBEDDING_MODEL_NAME,
+            workers=self.config.compute_workers,
+            batch_size=self.config.encode_batch_size,
+            batch_wait_ms=self.config.encode_batch_wait_ms
+        )
+        extraction_cache = structuring_cache = None
+        if self.config.result_cache_path:
+            extraction_cache = ResultCache(self.config.result_cache_path, "extraction", self.config.result_cache_max_entries)
+            structuring_cache = ResultCache(self.config.result_cache_path, "structuring", self.config.result_cache_max_entries)
+        self.text_extractor = TextExtractor(llama_api_key, self.config.llama_base_url, self.compute_pool, extraction_cache)
+        self.timetable_processor = TimetableProcessor(groq_api_key, self.model_router, structuring_cache)
+        self.embedding_cache = None
+        if self.config.embedding_cache_path:
+            self.embedding_cache = EmbeddingCache(
+                self.config.embedding_cache_path, EMBEDDING_MODEL_NAME, self.config.embedding_cache_max_entries
+            )
+        self.embedding_store = TimetableEmbeddingStore(
+            self.config.chroma_path, self.compute_pool, self.embedding_cache,
+            flush_interval=self.config.vector_flush_interval_ms / 1000,
+            flush_batch=self.config.vector_flush_batch
+        )
+        self.query_processor = TimetableQueryProcessor(groq_api_key, self.embedding_store, self.model_router)
+        self.admission = AdmissionController(self.config.max_concurrent_jobs, self.config.max_queue_per_user)
+        self.media_groups = {}
         
         ## sytoring teh user things for details
-        self.user_states = {}  
-        self.user_reminders = {}  
-        self.user_timetables = {} 
+        # with several workers the state lives in a shared store instead of process memory;
+        # a single process keeps recently active users in memory and spills the rest to disk
+        self.state_store = SQLiteStateStore(self.config.state_store_path)
+        self.session_caches = []
+        if self.config.workers > 1:
+            self.user_states = StoreMapping(self.state_store, "states")
+            self.user_reminders = StoreMapping(self.state_store, "reminders")
+            self.user_timetables = StoreMapping(self.state_store, "timetables")
+            self.user_alerts = StoreMapping(self.state_store, "alerts")
+            self.profiled_users = StoreMapping(self.state_store, "profiled")  # shared so any worker's /profile applies
+        else:
+            self.user_states = self.session_cache("states")
+            self.user_reminders = self.session_cache("reminders")
+            self.user_timetables = self.session_cache("timetables")
+            self.user_alerts = self.session_cache("alerts")  # user_id -> minutes before class
+            self.profiled_users = {}
+        
+        self.profiler = RequestProfiler(
+            self.config.profile_dir,
+            threshold_seconds=self.config.profile_threshold_ms / 1000,
+            sample_interval=self.config.profile_sample_ms / 1000,
+            max_traces=self.config.profile_max_traces,
+            profiled_users=self.profiled_users
+        )
+        
+        # only the lease holder sends reminders when running as one of several workers
+        self.leader = None
+        self.scheduled_reminders = {}
+        
+        # pre-class alerts come from one shared index instead of a job per class
+        self.event_index = WeeklyEventIndex()
+        self.alert_clock = AlertClock()
+        self.alert_limiter = None
+        self.indexed_alerts = {}
+        self.alerts_synced_at = 0.0
         
         ##indian time zone
         self.timezone = pytz.timezone('Asia/Kolkata')
         
+        # ICS feeds are rendered on upload so calendar polls never re-render; with
+        # several workers, any of them may have handled the upload, so feeds are
+        # checked against the shared store
+        self.calendar_feeds = CalendarFeedCache(
+            self.user_timetables.get, self.timezone, self.config.calendar_cache_entries,
+            self.user_timetables.updated_at if self.config.workers > 1 else None
+        )
+        calendar_secret = self.config.calendar_secret or hashlib.sha256(f"calendar:{telegram_token}".encode()).hexdigest()
+        self.calendar_server = CalendarFeedServer(self.calendar_feeds, calendar_secret)
         
         self.app = None
+        self.metrics_server = None
+        self.feed_http_server = None
         
 
         self.scheduler_loop = None
     
+    def session_cache(self, namespace: str) -> SessionCache:
+        cache = SessionCache(
+            self.state_store, namespace,
+            max_entries=self.config.session_max_entries,
+            max_bytes=self.config.session_max_bytes,
+            idle_seconds=self.config.session_idle_seconds
+        )
+        self.session_caches.append(cache)
+        return cache
+    
     def get_current_time(self):
         return datetime.now(self.timezone)
     
@@ -65,6 +172,8 @@ class TimetableBot:
 /settime - Set reminder time
 /schedule - View your timetable
 /tomorrow - Get tomorrow's classes
+/calendar - Get a calendar feed link for your phone
+/alerts - Get a message before each class
 /delete - Delete all data and start fresh
 /help - Get help
 
@@ -82,6 +191,8 @@ Ready to begin!
 /settime - Set reminder time (format: "8:30 PM" or "20:30")
 /schedule - View your timetable
 /tomorrow - Get tomorrow's schedule
+/calendar - Subscribe to your timetable in a calendar app
+/alerts - Alerts before each class (e.g. "/alerts 15" or "/alerts off")
 /delete - Delete all data and start fresh
 
 **Usage:**
@@ -102,7 +213,7 @@ Ready to begin!
 📸 **Upload Your Timetable Image of your class**
 
 make sure taht it is clean and tidy
-Send as a photo, dont send other things!!
+Send it as a photo, an album of photos (one per page or section), or a PDF file!!
         """
         
         await update.message.reply_text(message, parse_mode='Markdown')
@@ -117,19 +228,26 @@ Send as a photo, dont send other things!!
         
         await update.message.reply_text("Image received! Extracting your image")
         
+        with HANDLER_SECONDS.time(handler="photo"):
+            await self._process_photo(update, context, user_id)
+    
+    async def _process_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
         try:
            
             photo = update.message.photo[-1]
             
             
-            photo_file = await context.bot.get_file(photo.file_id)
-            photo_bytes = BytesIO()
-            await photo_file.download_to_memory(photo_bytes)
-            photo_bytes = photo_bytes.getvalue()
+            with stage_timer("photo", "download"):
+                photo_file = await context.bot.get_file(photo.file_id)
+                photo_bytes = BytesIO()
+                await photo_file.download_to_memory(photo_bytes)
+                photo_bytes = photo_bytes.getvalue()
             
             
             await update.message.reply_text("🔍 Extracting ")
-            extracted_text = self.text_extractor.extract_from_telegram_photo(photo_bytes)
+            # Blocking pipeline stages run in worker threads so other users' updates keep flowing
+            with stage_timer("photo", "ocr"):
+                extracted_text = await asyncio.to_thread(self.text_extractor.extract_from_telegram_photo, photo_bytes)
             
             if not extracted_text:
                 await update.message.reply_text("Sorry, I couldn't extract text from the image. Please try with a clearer image.")
@@ -137,35 +255,248 @@ Send as a photo, dont send other things!!
             
             # Process with LLM
             await update.message.reply_text("Structuring your timetable...")
-            structured_data = self.timetable_processor.process_timetable(extracted_text)
+            if self.config.pipelined_structuring:
+                # days are previewed and encoded while the model is still writing the rest
+                with stage_timer("photo", "structure"):
+                    structured_data = await self._structure_pipelined(update, user_id, extracted_text)
+            else:
+                with stage_timer("photo", "structure"):
+                    structured_data = await asyncio.to_thread(self.timetable_processor.process_timetable, extracted_text)
             
             if not structured_data:
                 await update.message.reply_text("Sorry, I couldn't process your timetable. Please try with a clearer image.")
                 return
             
-            # Store in embedding database
-            await update.message.reply_text("just few seconds to goo, Something is cooking ")
-            self.embedding_store.clear_timetable()  # Clear previous data
-            self.embedding_store.create_embeddings(structured_data)
-            
-            
-            self.user_timetables[user_id] = structured_data
-            
-            # Format and send confirmation
-            formatted_schedule = self.timetable_processor.format_for_display(structured_data)
+            await self._save_and_confirm(update, user_id, structured_data, "photo",
+                                         stored=self.config.pipelined_structuring)
             
-            success_message = "**Timetable stored successfully!** \n\n"
-            success_message += "Here's your processed schedule:\n\n"
-            success_message += formatted_schedule
-            success_message += "\n\n**Next step:** Use /settime to set your daily reminder time!"
+        except Exception as e:
+            logger.error(f"Error processing photo: {str(e)}")
+            await update.message.reply_text("An error occurred while processing your image. Please try again.")
+    
+    async def _structure_pipelined(self, update: Update, user_id: int, extracted_text: str) -> dict:
+        """
+        Stream the structured timetable, updating a preview and encoding each day
+        as soon as the model closes that day's array. Nothing is stored until
+        the whole timetable has validated; the user's old rows are then swapped
+        out in one go, and stay untouched when structuring fails.
+        """
+        loop = asyncio.get_running_loop()
+        days = asyncio.Queue()
+        to_stage = asyncio.Queue()
+        encoded = {}
+        
+        def on_day(day, periods):
+            loop.call_soon_threadsafe(days.put_nowait, (day, periods))
+        
+        def produce():
+            try:
+                return self.timetable_processor.stream_timetable(extracted_text, on_day)
+            finally:
+                loop.call_soon_threadsafe(days.put_nowait, None)
+        
+        async def stage_days():
+            while (item := await to_stage.get()) is not None:
+                day, periods = item
+                try:
+                    documents = timetable_documents({day: periods})
+                    with stage_timer("photo", "encode"):
+                        vectors = await asyncio.to_thread(self.embedding_store.encode_documents, documents)
+                except Exception as e:
+                    # Staging is only a head start; the swap encodes whatever is missing
+                    logger.warning(f"Could not stage {day}: {str(e)}")
+                    continue
+                encoded.update(zip(documents, vectors))
+        
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        stager = asyncio.ensure_future(stage_days())
+        preview_data = {}
+        preview = None
+        
+        try:
+            while (item := await days.get()) is not None:
+                day, periods = item
+                preview_data[day] = periods
+                to_stage.put_nowait(item)
+                
+                text = "⏳ **Preview so far**\n\n" + self.timetable_processor.format_for_display(preview_data)
+                try:
+                    if preview is None:
+                        preview = await update.message.reply_text(text, parse_mode='Markdown')
+                    else:
+                        await preview.edit_text(text, parse_mode='Markdown')
+                except Exception as e:
+                    logger.warning(f"Could not update preview: {str(e)}")
             
+            structured_data = await producer
+        finally:
+            to_stage.put_nowait(None)
+            await stager
+        
+        if not self.timetable_processor.is_valid_timetable(structured_data):
+            return {}
+        
+        with stage_timer("photo", "store"):
+            await asyncio.to_thread(self.embedding_store.replace_timetable, structured_data, user_id, encoded)
+        return structured_data
+    
+    async def _save_and_confirm(self, update: Update, user_id: int, structured_data: dict, handler: str,
+                                stored: bool = False) -> None:
+        """Store a structured timetable for the user and send the confirmation."""
+        # Store in embedding database
+        if not stored:
+            await update.message.reply_text("just few seconds to goo, Something is cooking ")
+            with stage_timer(handler, "store"):
+                await asyncio.to_thread(self.store_user_timetable, user_id, structured_data)
+        
+        
+        self.user_timetables[user_id] = structured_data
+        self.calendar_feeds.update(user_id, structured_data)
+        if user_id in self.user_alerts:
+            self.index_user_alerts(user_id)
+        
+        # Format and send confirmation
+        formatted_schedule = self.timetable_processor.format_for_display(structured_data)
+        
+        success_message = "**Timetable stored successfully!** \n\n"
+        success_message += "Here's your processed schedule:\n\n"
+        success_message += formatted_schedule
+        success_message += "\n\n**Next step:** Use /settime to set your daily reminder time!"
+        
+        with stage_timer(handler, "reply"):
             await update.message.reply_text(success_message, parse_mode='Markdown')
+        
+        self.user_states[user_id] = "timetable_stored"
+    
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle a timetable sent as a PDF or image file."""
+        user_id = update.effective_user.id
+        
+        if self.user_states.get(user_id) != "waiting_for_image":
+            await update.message.reply_text("Please use /upload command first to upload your timetable.")
+            return
+        
+        document = update.message.document
+        if document.file_size and document.file_size > MAX_DOWNLOAD_BYTES:
+            await update.message.reply_text("That file is too large. Please send a file under 20 MB.")
+            return
+        
+        with HANDLER_SECONDS.time(handler="document"):
+            try:
+                with stage_timer("document", "download"):
+                    data = await self._download(context, document.file_id)
+                
+                is_pdf = document.mime_type == "application/pdf" or (document.file_name or "").lower().endswith(".pdf")
+                if is_pdf:
+                    pages = await asyncio.to_thread(self.text_extractor.split_pdf_pages, data, self.config.max_document_pages)
+                    extractors = [
+                        (lambda page=page, key=self.text_extractor.pdf_page_key(data, i):
+                            self.text_extractor.extract_from_bytes(page, ".pdf", key))
+                        for i, page in enumerate(pages)
+                    ]
+                else:
+                    extractors = [lambda: self.text_extractor.extract_from_telegram_photo(data)]
+                
+                await self._process_pages(update, user_id, extractors, "document")
             
-            self.user_states[user_id] = "timetable_stored"
+            except Exception as e:
+                logger.error(f"Error processing document: {str(e)}")
+                await update.message.reply_text("An error occurred while processing your file. Please try again.")
+    
+    async def handle_album_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Collect photos sent together as an album and process them as one timetable."""
+        user_id = update.effective_user.id
+        
+        if self.user_states.get(user_id) != "waiting_for_image":
+            await update.message.reply_text("Please use /upload command first to upload your timetable image.")
+            return
+        
+        group_id = update.message.media_group_id
+        group = self.media_groups.get(group_id)
+        if group is None:
+            # Telegram delivers album items as separate updates; wait briefly for the rest
+            group = self.media_groups[group_id] = {"updates": []}
+            context.application.create_task(self._flush_album(group_id, context), update=update)
+        group["updates"].append(update)
+    
+    async def _flush_album(self, group_id: str, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await asyncio.sleep(self.config.album_wait_ms / 1000)
+        group = self.media_groups.pop(group_id, None)
+        if not group:
+            return
+        
+        updates = sorted(group["updates"], key=lambda u: u.message.message_id)
+        first = updates[0]
+        
+        async def process(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            await self._process_album(update, context, updates)
+        
+        await self.admission.run(process, first, context, "upload", supersede=True)
+    
+    async def _process_album(self, update: Update, context: ContextTypes.DEFAULT_TYPE, updates: list) -> None:
+        user_id = update.effective_user.id
+        
+        with HANDLER_SECONDS.time(handler="album"):
+            try:
+                with stage_timer("album", "download"):
+                    photos = await asyncio.gather(*(
+                        self._download(context, item.message.photo[-1].file_id) for item in updates
+                    ))
+                
+                extractors = [
+                    (lambda photo=photo: self.text_extractor.extract_from_telegram_photo(photo))
+                    for photo in photos
+                ]
+                await self._process_pages(update, user_id, extractors, "album")
             
-        except Exception as e:
-            logger.error(f"Error processing photo: {str(e)}")
-            await update.message.reply_text("An error occurred while processing your image. Please try again.")
+            except Exception as e:
+                logger.error(f"Error processing album: {str(e)}")
+                await update.message.reply_text("An error occurred while processing your images. Please try again.")
+    
+    async def _download(self, context: ContextTypes.DEFAULT_TYPE, file_id: str) -> bytes:
+        telegram_file = await context.bot.get_file(file_id)
+        buffer = BytesIO()
+        await telegram_file.download_to_memory(buffer)
+        return buffer.getvalue()
+    
+    async def _process_pages(self, update: Update, user_id: int, extractors: list, handler: str) -> None:
+        """
+        Extract and structure every page concurrently, then merge them, so the
+        total time tracks the slowest page rather than the sum of all pages.
+        """
+        total = len(extractors)
+        progress = await update.message.reply_text(f"📄 Processing {total} page{'s' if total != 1 else ''}...")
+        semaphore = asyncio.Semaphore(self.config.max_parallel_pages)
+        completed = 0
+        
+        async def run_page(extract) -> dict:
+            nonlocal completed
+            async with semaphore:
+                with stage_timer(handler, "page"):
+                    text = await asyncio.to_thread(extract)
+                    data = {}
+                    if text:
+                        data = await asyncio.to_thread(self.timetable_processor.process_timetable, text)
+            
+            completed += 1
+            try:
+                await progress.edit_text(f"📄 {completed}/{total} pages processed")
+            except Exception:
+                pass  # progress is best effort; edits can fail if the message is unchanged
+            return data
+        
+        results = await asyncio.gather(*(run_page(extract) for extract in extractors))
+        structured_data = self.timetable_processor.merge_timetables(results)
+        
+        if not structured_data:
+            await update.message.reply_text("Sorry, I couldn't find a timetable in what you sent. Please try clearer pages.")
+            return
+        
+        await self._save_and_confirm(update, user_id, structured_data, handler)
+    
+    def store_user_timetable(self, user_id: int, structured_data: dict) -> None:
+        """Replace the user's embeddings with a freshly structured timetable."""
+        self.embedding_store.replace_timetable(structured_data, user_id)
     
     async def settime_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle set time command."""
@@ -279,8 +610,9 @@ Just type the time and send it!
         # Check if user has any data
         has_timetable = user_id in self.user_timetables
         has_reminder = user_id in self.user_reminders
+        has_alerts = user_id in self.user_alerts
         
-        if not has_timetable and not has_reminder:
+        if not has_timetable and not has_reminder and not has_alerts:
             await update.message.reply_text("No data found to delete. You can start fresh with /upload!")
             return
         
@@ -299,6 +631,8 @@ Just type the time and send it!
             delete_items.append("Your stored timetable")
         if has_reminder:
             delete_items.append("Your daily reminder settings")
+        if has_alerts:
+            delete_items.append("Your class alerts")
         
         items_text = "\n• ".join(delete_items)
         
@@ -340,6 +674,14 @@ Are you sure you want to proceed?
             if user_id in self.user_timetables:
                 del self.user_timetables[user_id]
                 deleted_items.append("Timetable data")
+            self.calendar_feeds.invalidate(user_id)
+            
+            # Turn off class alerts
+            if user_id in self.user_alerts:
+                del self.user_alerts[user_id]
+                deleted_items.append("Class alerts")
+            self.event_index.remove_user(user_id)
+            self.indexed_alerts.pop(user_id, None)
             
             # Clear user reminders
             if user_id in self.user_reminders:
@@ -347,13 +689,14 @@ Are you sure you want to proceed?
                 deleted_items.append(" Reminder settings")
                 # Clear scheduled reminders
                 schedule.clear(f'user_{user_id}')
+                self.scheduled_reminders.pop(user_id, None)
             
             # Clear user state
             if user_id in self.user_states:
                 del self.user_states[user_id]
             
-            # Clear embedding store (this affects all users - you might want to make this user-specific)
-            self.embedding_store.clear_timetable()
+            # Clear this user's entries from the embedding store
+            await asyncio.to_thread(self.embedding_store.clear_timetable, user_id)
             
             items_text = "\n• ".join(deleted_items) if deleted_items else "No data found"
             
@@ -396,12 +739,14 @@ Use /upload to add a new timetable.
         # Process as query
         await update.message.reply_text("wiat wait brooo, iam looking into your timetablu")
         
-        try:
-            response = self.query_processor.process_query(message_text)
-            await update.message.reply_text(response, parse_mode='Markdown')
-        except Exception as e:
-            logger.error(f"Error processing query: {str(e)}")
-            await update.message.reply_text("Sorry, I couldn't process your query. Please try again.")
+        with HANDLER_SECONDS.time(handler="query"):
+            try:
+                response = await asyncio.to_thread(self.query_processor.process_query, message_text, user_id)
+                with stage_timer("query", "reply"):
+                    await update.message.reply_text(response, parse_mode='Markdown')
+            except Exception as e:
+                logger.error(f"Error processing query: {str(e)}")
+                await update.message.reply_text("Sorry, I couldn't process your query. Please try again.")
     
     def get_tomorrow_schedule(self, user_id: int) -> str:
         """Get formatted schedule for tomorrow."""
@@ -440,22 +785,37 @@ Use /upload to add a new timetable.
         
         return message
     
+    def run_in_scheduler_loop(self, coro) -> None:
+        """Hand a coroutine from the scheduler thread to the scheduler's event loop."""
+        # The loop runs in its own thread, so slow sends never hold up the next tick
+        if self.scheduler_loop is None or self.scheduler_loop.is_closed():
+            self.scheduler_loop = asyncio.new_event_loop()
+            threading.Thread(target=self.scheduler_loop.run_forever, name="scheduler-loop", daemon=True).start()
+        
+        def log_failure(done) -> None:
+            if not done.cancelled() and done.exception() is not None:
+                logger.error(f"Scheduled send failed: {str(done.exception())}")
+        
+        asyncio.run_coroutine_threadsafe(coro, self.scheduler_loop).add_done_callback(log_failure)
+    
     def schedule_daily_reminder(self, user_id: int, reminder_time: str) -> None:
         """Schedule daily reminder for user."""
         def send_reminder():
-            # Create a new event loop for this thread if one doesn't exist
-            if self.scheduler_loop is None or self.scheduler_loop.is_closed():
-                self.scheduler_loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(self.scheduler_loop)
+            # schedule runs jobs in local time, so measure lag against the local wall clock
+            now = datetime.now()
+            hour, minute = map(int, reminder_time.split(':'))
+            lag = (now - now.replace(hour=hour, minute=minute, second=0, microsecond=0)).total_seconds()
+            REMINDER_LAG_SECONDS.observe(lag % 86400)
             
             # Schedule the coroutine in the event loop
-            self.scheduler_loop.run_until_complete(self.send_daily_reminder(user_id))
+            self.run_in_scheduler_loop(self.send_daily_reminder(user_id))
         
         # Clear existing schedule for this user if any
         schedule.clear(f'user_{user_id}')
         
         # Schedule new reminder
         schedule.every().day.at(reminder_time).do(send_reminder).tag(f'user_{user_id}')
+        self.scheduled_reminders[user_id] = reminder_time
         
         logger.info(f"Scheduled daily reminder for user {user_id} at {reminder_time} IST")
     
@@ -480,14 +840,300 @@ Use /upload to add a new timetable.
     def run_scheduler(self) -> None:
         """Run the scheduler in a separate thread."""
         logger.info("Scheduler thread started")
+        if self.leader is None:
+            # restore reminders and alerts persisted by a previous run
+            self.sync_reminders()
+            self.sync_alerts()
         while True:
             try:
+                if self.leader is not None:
+                    if not self.leader.is_leader:
+                        time.sleep(60)
+                        continue
+                    self.sync_reminders()
+                    self.sync_alerts()
                 schedule.run_pending()
-                time.sleep(60)  # Check every minute
+                self.send_due_alerts()
+                time.sleep(60 - datetime.now().second)  # Check at the start of every minute
             except Exception as e:
                 logger.error(f"Scheduler error: {str(e)}")
                 time.sleep(60)  # Continue after error
     
+    def sync_reminders(self) -> None:
+        """Align local schedule jobs with reminders set through any worker."""
+        desired = dict(self.user_reminders.items())
+        
+        for user_id, reminder_time in desired.items():
+            if self.scheduled_reminders.get(user_id) != reminder_time:
+                self.schedule_daily_reminder(user_id, reminder_time)
+        
+        for user_id in list(self.scheduled_reminders):
+            if user_id not in desired:
+                schedule.clear(f'user_{user_id}')
+                del self.scheduled_reminders[user_id]
+    
+    def index_user_alerts(self, user_id: int) -> int:
+        """Bring the user's entries in the event index in line with their alert setting."""
+        lead_minutes = self.user_alerts.get(user_id)
+        timetable = self.user_timetables.get(user_id)
+        
+        if lead_minutes is None or not timetable:
+            self.event_index.remove_user(user_id)
+            self.indexed_alerts.pop(user_id, None)
+            return 0
+        
+        self.indexed_alerts[user_id] = lead_minutes
+        return self.event_index.set_user(user_id, timetable, lead_minutes)
+    
+    def sync_alerts(self) -> None:
+        """Pick up alert settings and timetables changed through any worker."""
+        started = time.time()
+        desired = dict(self.user_alerts.items())
+        changed = {user_id for user_id, _ in self.user_timetables.changed_since(self.alerts_synced_at)}
+        
+        for user_id in list(self.indexed_alerts):
+            if user_id not in desired:
+                self.index_user_alerts(user_id)
+        
+        for user_id, lead_minutes in desired.items():
+            if self.indexed_alerts.get(user_id) != lead_minutes or user_id in changed:
+                self.index_user_alerts(user_id)
+        
+        self.alerts_synced_at = started
+    
+    def send_due_alerts(self) -> None:
+        """Queue the alerts due since the last tick; only the due buckets are touched."""
+        now = self.get_current_time()
+        current = minute_of_week(now)
+        due = []
+        for minute in self.alert_clock.advance(now):
+            # Missed minutes only keep the classes that haven't started yet
+            due.extend(self.event_index.due(minute, current))
+        
+        if due:
+            self.run_in_scheduler_loop(self.send_class_alerts(due))
+    
+    async def send_class_alerts(self, due: list) -> None:
+        # Created on first use so it belongs to the scheduler loop. A busy tick
+        # may still be sending when the next one queues its alerts; both share
+        # the limiter, so the send rate holds across them
+        if self.alert_limiter is None:
+            self.alert_limiter = SendRateLimiter(self.config.alert_send_rate)
+        await asyncio.gather(*(self.send_class_alert(user_id, event) for user_id, event in due))
+    
+    async def send_class_alert(self, user_id: int, event: dict, attempts: int = 3) -> None:
+        """Send one pre-class alert, paced by the alert rate limiter."""
+        try:
+            start = datetime.strptime(event['start'], '%H:%M').strftime('%I:%M %p')
+            message = f"⏰ **{event['subject']}** starts in {event['lead_minutes']} minutes ({start})"
+            if event.get('full_name'):
+                message += f"\n{event['full_name']}"
+            if event.get('room'):
+                message += f"\nRoom: {event['room']}"
+            
+            for attempt in range(attempts):
+                await self.alert_limiter.wait()
+                try:
+                    await self.app.bot.send_message(chat_id=user_id, text=message, parse_mode='Markdown')
+                    ALERTS_SENT.inc()
+                    return
+                except RetryAfter as e:
+                    # Flood limits are per bot, so every pending alert backs off
+                    ALERTS_RATE_LIMITED.inc()
+                    retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                    self.alert_limiter.pause(retry_after)
+            logger.error(f"Gave up on class alert to user {user_id} after {attempts} rate-limited attempts")
+        
+        except Exception as e:
+            logger.error(f"Error sending class alert to user {user_id}: {str(e)}")
+    
+    async def alerts_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Turn pre-class alerts on or off."""
+        user_id = update.effective_user.id
+        args = context.args or []
+        
+        if args and args[0].lower() == "off":
+            self.user_alerts.pop(user_id, None)
+            self.index_user_alerts(user_id)
+            await update.message.reply_text("🔕 Class alerts turned off.")
+            return
+        
+        if user_id not in self.user_timetables:
+            await update.message.reply_text("No timetable found. Please upload your timetable first using /upload command.")
+            return
+        
+        lead_minutes = self.config.alert_lead_minutes
+        if args:
+            if not args[0].isdigit() or not 1 <= int(args[0]) <= 120:
+                await update.message.reply_text("Usage: /alerts [minutes before class, 1-120] or /alerts off")
+                return
+            lead_minutes = int(args[0])
+        
+        self.user_alerts[user_id] = lead_minutes
+        count = self.index_user_alerts(user_id)
+        
+        message = f"🔔 **Class alerts on!** You'll get a message {lead_minutes} minutes before each class "
+        message += f"({count} classes a week).\n\nUse /alerts off to stop them."
+        await update.message.reply_text(message, parse_mode='Markdown')
+    
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.config.admin_user_ids
+    
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Show a latency and usage summary (admins only)."""
+        user_id = update.effective_user.id
+        
+        if not self.is_admin(user_id):
+            await update.message.reply_text("This command is only available to admins.")
+            return
+        
+        await update.message.reply_text(self.format_stats(), parse_mode='Markdown')
+    
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Turn request profiling on or off for one user (admins only)."""
+        user_id = update.effective_user.id
+        
+        if not self.is_admin(user_id):
+            await update.message.reply_text("This command is only available to admins.")
+            return
+        
+        args = context.args or []
+        if len(args) == 2 and args[0].isdigit() and args[1].lower() in ("on", "off"):
+            target = int(args[0])
+            if args[1].lower() == "on":
+                self.profiled_users[target] = True
+            else:
+                self.profiled_users.pop(target, None)
+            await update.message.reply_text(f"Profiling {args[1].lower()} for user {target}.")
+            return
+        
+        profiled = ", ".join(str(uid) for uid in sorted(self.profiled_users)) or "none"
+        threshold = self.config.profile_threshold_ms
+        message = "**Profiling**\n\n"
+        message += f"Slow request threshold: {f'{threshold} ms' if threshold else 'off'}\n"
+        message += f"Profiled users: {profiled}\n"
+        message += f"Traces in `{self.profiler.directory}`:\n"
+        for name in self.profiler.recent_traces():
+            message += f"• `{name}`\n"
+        message += "\nUsage: /profile <user\\_id> on|off"
+        await update.message.reply_text(message, parse_mode='Markdown')
+    
+    def format_stats(self) -> str:
+        """Summarize the metrics registry for the /stats command."""
+        message = "**Bot Stats**\n\n"
+        
+        message += "**Handlers** (count, p50 / p95 seconds)\n"
+        for labels in HANDLER_SECONDS.label_sets():
+            summary = HANDLER_SECONDS.summary(**labels)
+            message += f"• {labels['handler']}: {summary['count']}, {summary['p50']:.2f} / {summary['p95']:.2f}\n"
+        
+        message += "\n**Stages** (count, p50 / p95 seconds)\n"
+        for labels in STAGE_SECONDS.label_sets():
+            summary = STAGE_SECONDS.summary(**labels)
+            message += f"• {labels['handler']}.{labels['stage']}: {summary['count']}, {summary['p50']:.2f} / {summary['p95']:.2f}\n"
+        
+        message += "\n**LLM tiers** (calls, escalations, avg seconds, tokens)\n"
+        for tier, stats in self.model_router.get_stats().items():
+            avg = stats['latency_seconds_total'] / stats['calls'] if stats['calls'] else 0.0
+            tokens = stats['prompt_tokens'] + stats['completion_tokens']
+            message += f"• {tier} ({stats['model']}): {stats['calls']}, {stats['escalations']}, {avg:.2f}, {tokens}\n"
+        
+        cache_totals = {}
+        for labels, value in CACHE_REQUESTS.samples().items():
+            labels = dict(labels)
+            hits, total = cache_totals.get(labels['cache'], (0, 0))
+            cache_totals[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+        if cache_totals:
+            message += "\n**Caches** (hit rate)\n"
+            for cache, (hits, total) in sorted(cache_totals.items()):
+                message += f"• {cache}: {hits / total:.0%} of {int(total)}\n"
+        
+        saved = {dict(labels)['kind']: value for labels, value in SINGLEFLIGHT_SAVED.samples().items()}
+        if saved:
+            message += "\n**Coalesced calls saved**\n"
+            for kind, value in sorted(saved.items()):
+                message += f"• {kind}: {int(value)}\n"
+        
+        lag = REMINDER_LAG_SECONDS.summary()
+        if lag['count']:
+            message += f"\n**Reminder lag:** p50 {lag['p50']:.0f}s, p95 {lag['p95']:.0f}s over {lag['count']} reminders\n"
+        
+        message += f"\n**Users:** {len(self.user_timetables)} with timetables, {len(self.user_reminders)} with reminders"
+        if self.session_caches:
+            resident = [cache.resident_stats() for cache in self.session_caches]
+            entries = sum(stats['entries'] for stats in resident)
+            kib = sum(stats['bytes'] for stats in resident) / 1024
+            message += f"\n**Sessions in memory:** {entries} entries, ~{kib:.0f} KiB"
+        flush = VECTOR_FLUSH_SECONDS.summary()
+        if flush['count']:
+            message += (f"\n**Vector writes:** {int(VECTOR_QUEUE_DEPTH.get())} queued, "
+                        f"flush p95 {flush['p95']:.2f}s over {flush['count']} flushes")
+        return message
+    
+    async def _serve_metrics(self, request) -> HTTPResponse:
+        body = REGISTRY.render_prometheus().encode("utf-8")
+        return HTTPResponse(200, body, content_type="text/plain; version=0.0.4; charset=utf-8")
+    
+    async def calendar_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Send the user's personal calendar feed link."""
+        user_id = update.effective_user.id
+        
+        if user_id not in self.user_timetables:
+            await update.message.reply_text("No timetable found. Please upload your timetable first using /upload command.")
+            return
+        
+        base_url = self.calendar_base_url()
+        if base_url is None:
+            await update.message.reply_text("Calendar feeds are not enabled on this bot.")
+            return
+        
+        message = "📅 **Your calendar feed**\n\n"
+        message += "Subscribe to this link in Google Calendar, Apple Calendar or Outlook:\n"
+        message += f"`{base_url}{self.calendar_server.feed_path(user_id)}`\n\n"
+        message += "Keep it private, anyone with the link can see your timetable. It updates when you /upload again."
+        await update.message.reply_text(message, parse_mode='Markdown')
+    
+    def calendar_base_url(self):
+        if self.config.calendar_base_url:
+            return self.config.calendar_base_url.rstrip("/")
+        if self.feed_http_server is not None:
+            return f"http://{self.config.calendar_host}:{self.feed_http_server.port}"
+        return None
+    
+    async def post_init(self, application: Application) -> None:
+        """Start local HTTP endpoints inside the bot's event loop."""
+        if self.config.metrics_port:
+            self.metrics_server = AsyncHTTPServer(self.config.metrics_host, self.config.metrics_port)
+            self.metrics_server.add_route("GET", "/metrics", self._serve_metrics)
+            await self.metrics_server.start()
+            logger.info(f"Metrics available at http://{self.config.metrics_host}:{self.metrics_server.port}/metrics")
+        
+        if self.config.calendar_port:
+            same_listener = (
+                self.metrics_server is not None
+                and (self.config.calendar_host, self.config.calendar_port) == (self.config.metrics_host, self.config.metrics_port)
+            )
+            if same_listener:
+                self.feed_http_server = self.metrics_server
+            else:
+                self.feed_http_server = AsyncHTTPServer(self.config.calendar_host, self.config.calendar_port)
+            self.calendar_server.mount(self.feed_http_server)
+            if not same_listener:
+                await self.feed_http_server.start()
+            logger.info(f"Calendar feeds served on {self.config.calendar_host}:{self.feed_http_server.port}")
+    
+    async def post_shutdown(self, application: Application) -> None:
+        await asyncio.to_thread(self.embedding_store.close)
+        self.compute_pool.shutdown()
+        for cache in self.session_caches:
+            cache.flush()
+        if self.feed_http_server is not None and self.feed_http_server is not self.metrics_server:
+            await self.feed_http_server.stop()
+        self.feed_http_server = None
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+            self.metrics_server = None
+    
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Log errors and notify user."""
         logger.error(f'Update {update} caused error {context.error}')
@@ -497,34 +1143,71 @@ Use /upload to add a new timetable.
                 "Sorry, something went wrong. Please try again or contact support."
             )
     
-    def run(self) -> None:
-        """Start the bot."""
-        # Create application
-        self.app = Application.builder().token(self.telegram_token).build()
-        
-        # Add handlers
-        self.app.add_handler(CommandHandler("start", self.start))
-        self.app.add_handler(CommandHandler("help", self.help_command))
-        self.app.add_handler(CommandHandler("upload", self.upload_command))
-        self.app.add_handler(CommandHandler("settime", self.settime_command))
-        self.app.add_handler(CommandHandler("schedule", self.schedule_command))
-        self.app.add_handler(CommandHandler("tomorrow", self.tomorrow_command))
-        self.app.add_handler(CommandHandler("delete", self.delete_command))
-        self.app.add_handler(CommandHandler("reset", self.delete_command))  # Alias for delete
-        self.app.add_handler(CommandHandler("clear", self.clear_command))
+    def build_application(self, builder=None) -> Application:
+        """Create the Application and register all handlers."""
+        if builder is None:
+            builder = Application.builder().token(self.telegram_token)
+        
+        if self.config.max_concurrent_updates > 1:
+            # Users are processed in parallel, each user's updates still in order
+            builder = builder.concurrent_updates(UserOrderedUpdateProcessor(self.config.max_concurrent_updates))
+        
+        self.app = (
+            builder
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
+        
+        # Add handlers; commands wait for the user's queued uploads and queries,
+        # so they see the same order the user sent them in
+        ordered = self.admission.ordered
+        self.app.add_handler(CommandHandler("start", ordered(self.start)))
+        self.app.add_handler(CommandHandler("help", ordered(self.help_command)))
+        self.app.add_handler(CommandHandler("upload", ordered(self.upload_command)))
+        self.app.add_handler(CommandHandler("settime", ordered(self.settime_command)))
+        self.app.add_handler(CommandHandler("schedule", ordered(self.schedule_command)))
+        self.app.add_handler(CommandHandler("tomorrow", ordered(self.tomorrow_command)))
+        self.app.add_handler(CommandHandler("delete", ordered(self.delete_command)))
+        self.app.add_handler(CommandHandler("reset", ordered(self.delete_command)))  # Alias for delete
+        self.app.add_handler(CommandHandler("clear", ordered(self.clear_command)))
+        self.app.add_handler(CommandHandler("stats", ordered(self.stats_command)))
+        self.app.add_handler(CommandHandler("profile", ordered(self.profile_command)))
+        self.app.add_handler(CommandHandler("calendar", ordered(self.calendar_command)))
+        self.app.add_handler(CommandHandler("alerts", ordered(self.alerts_command)))
         
         # Callback query handler for delete confirmations
-        self.app.add_handler(CallbackQueryHandler(self.handle_delete_callback))
+        self.app.add_handler(CallbackQueryHandler(ordered(self.handle_delete_callback)))
         
         # Photo handler
-        self.app.add_handler(MessageHandler(filters.PHOTO, self.handle_photo))
+        # Album photos are collected first, then admitted together as one upload
+        self.app.add_handler(MessageHandler(filters.PHOTO & MediaGroupFilter(), self.handle_album_photo))
+        
+        # Heavy handlers go through admission control; a newer photo replaces a pending upload
+        self.app.add_handler(MessageHandler(
+            filters.PHOTO,
+            self.admission.wrap(self.profiler.wrap(self.handle_photo, "photo"), "upload", supersede=True)
+        ))
+        self.app.add_handler(MessageHandler(
+            filters.Document.PDF | filters.Document.IMAGE,
+            self.admission.wrap(self.profiler.wrap(self.handle_document, "document"), "upload", supersede=True)
+        ))
         
         # Text message handler
-        self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text_message))
+        self.app.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND,
+            self.admission.wrap(self.profiler.wrap(self.handle_text_message, "query"), "query")
+        ))
         
         # Error handler
         self.app.add_error_handler(self.error_handler)
         
+        return self.app
+    
+    def run(self) -> None:
+        """Start the bot."""
+        self.build_application()
+        
         # Start scheduler in separate thread
         scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
         scheduler_thread.start()
@@ -536,8 +1219,92 @@ Use /upload to add a new timetable.
         print(f" Current time: {self.get_current_time().strftime('%Y-%m-%d %I:%M:%S %p IST')}")
         print("Send /start to begin using the bot")
         
+        if self.config.bot_mode == "webhook":
+            if self.config.webhook_url and asyncio.run(self.run_webhook()):
+                return
+            logger.warning("Webhook mode unavailable (set WEBHOOK_URL), falling back to polling")
+            # asyncio.run() closed its loop and left none current; run_polling needs one
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            self.build_application()
+        
         # Start polling
         self.app.run_polling(drop_pending_updates=True)
+    
+    async def run_worker(self, updates) -> None:
+        """Process updates routed by the cluster supervisor until it sends None."""
+        self.build_application()
+        
+        self.leader = LeaderElector(self.state_store, REMINDER_LEASE, ttl=self.config.lease_ttl)
+        self.leader.start()
+        scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
+        scheduler_thread.start()
+        
+        await self.app.initialize()
+        await self.post_init(self.app)
+        await self.app.start()
+        
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, updates.get)
+                if data is None:
+                    break
+                await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+        finally:
+            self.leader.stop()
+            await self.app.stop()
+            await self.post_shutdown(self.app)
+            await self.app.shutdown()
+    
+    async def run_webhook(self) -> bool:
+        """Serve updates over a webhook until interrupted; returns False if it could not be set up."""
+        secret = resolve_secret(self.config.webhook_secret)
+        server = WebhookServer(
+            self.app,
+            self.config.webhook_listen,
+            self.config.webhook_port,
+            self.config.webhook_path,
+            secret
+        )
+        url = webhook_url(self.config.webhook_url, self.config.webhook_path)
+        
+        await self.app.initialize()
+        try:
+            await server.start()
+            await self.app.bot.set_webhook(
+                url=url,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+                max_connections=max(1, min(100, self.config.max_concurrent_updates))
+            )
+        except Exception as e:
+            logger.error(f"Could not set up webhook at {url}: {str(e)}")
+            await server.stop()
+            await self.app.shutdown()
+            return False
+        
+        await self.post_init(self.app)
+        await self.app.start()
+        logger.info(f"Receiving updates via webhook at {url} (listening on {self.config.webhook_listen}:{server.port})")
+        
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass  # Windows: rely on KeyboardInterrupt
+        
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await self.app.stop()
+            await self.post_shutdown(self.app)
+            await self.app.shutdown()
+        
+        return True
 
 import os
 
@@ -596,24 +1363,30 @@ def main():
         
     except Exception as e:
         print(f"Component test failed: {str(e)}")
-        print("Run 'python test_components.py' for detailed diagnostics")
+        print("Run 'python loadtest.py --users 1 --duration 5' to exercise the full pipeline against local stand-ins")
         return
     
     # Create and run bot
     print(" Starting Timetable Bot...")
     
     try:
+        config = BotConfig.from_env()
+        if config.workers > 1:
+            ClusterSupervisor(TELEGRAM_TOKEN, LLAMA_API_KEY, GROQ_API_KEY, config).run()
+            return
+        
         bot = TimetableBot(
             telegram_token=TELEGRAM_TOKEN,
             llama_api_key=LLAMA_API_KEY,
-            groq_api_key=GROQ_API_KEY
+            groq_api_key=GROQ_API_KEY,
+            config=config
         )
         bot.run()
     except KeyboardInterrupt:
         print("\n Bot stopped by user")
     except Exception as e:
         print(f"Error running bot: {str(e)}")
-        print("Try running 'python test_components.py' to diagnose issues")
+        print("Try running 'python loadtest.py --users 1 --duration 5' to diagnose issues")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,234 @@
+from langchain_groq import ChatGroq
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from config import BotConfig
+from metrics import LLM_ERRORS, LLM_ESCALATIONS, LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, LLM_TOKENS
+
+SMALL_TIER = "small"
+LARGE_TIER = "large"
+
+# Words that usually mean the user wants reasoning over the week, not a lookup
+COMPLEX_QUERY_HINTS = (
+    "free", "gap", "compare", "between", "how many", "total", "most", "least",
+    "overlap", "clash", "plan", "why", "should", "earliest", "latest", "longest",
+    "whole week", "every day", "each day", "except",
+)
+
+TIME_PATTERN = re.compile(r"\d{1,2}[:.]\d{2}")
+
+
+class ModelRouter:
+    def __init__(self, groq_api_key: str, config: Optional[BotConfig] = None, temperature: float = 0.1):
+        """
+        Route LLM calls between a small fast model and a large model
+
+        Args:
+            groq_api_key (str): Groq API key
+            config (BotConfig): Model names and routing thresholds
+            temperature (float): Sampling temperature for every tier
+        """
+        self.config = config or BotConfig()
+        self.models = self.config.models
+
+        extra = {"base_url": self.config.groq_base_url} if self.config.groq_base_url else {}
+        self.llms = {
+            tier: ChatGroq(
+                groq_api_key=groq_api_key,
+                model_name=model_name,
+                temperature=temperature,
+                **extra
+            )
+            for tier, model_name in self.models.items()
+        }
+
+        self._lock = threading.Lock()
+        self.tier_stats = {
+            tier: {
+                "model": model_name,
+                "calls": 0,
+                "errors": 0,
+                "escalations": 0,
+                "latency_seconds_total": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+            }
+            for tier, model_name in self.models.items()
+        }
+
+    def choose_query_tier(self, query: str, context: str = "") -> str:
+        """
+        Pick a tier for a natural language query
+
+        Args:
+            query (str): User query
+            context (str): Retrieved timetable context sent with the query
+
+        Returns:
+            str: SMALL_TIER for simple lookups, LARGE_TIER otherwise
+        """
+        normalized = query.lower()
+
+        if len(query) > self.config.simple_query_max_chars:
+            return LARGE_TIER
+        if len(context) > self.config.simple_context_max_chars:
+            return LARGE_TIER
+        if any(hint in normalized for hint in COMPLEX_QUERY_HINTS):
+            return LARGE_TIER
+
+        return SMALL_TIER
+
+    def choose_structuring_tier(self, extracted_text: str) -> str:
+        """
+        Pick a tier for structuring OCR text, escalating messy or large inputs
+
+        Args:
+            extracted_text (str): Raw extracted text from image
+
+        Returns:
+            str: SMALL_TIER for short clean text, LARGE_TIER otherwise
+        """
+        if len(extracted_text) > self.config.simple_ocr_max_chars:
+            return LARGE_TIER
+
+        stripped = extracted_text.replace("\n", "").replace(" ", "")
+        if not stripped:
+            return LARGE_TIER
+
+        # OCR noise shows up as a high share of symbols and few readable time slots
+        symbols = sum(1 for ch in stripped if not ch.isalnum() and ch not in ":-.,/()")
+        if symbols / len(stripped) > 0.2:
+            return LARGE_TIER
+        if len(TIME_PATTERN.findall(extracted_text)) < 2:
+            return LARGE_TIER
+
+        return SMALL_TIER
+
+    def invoke(self, messages: List, tier: str) -> str:
+        """
+        Call the model for a tier and record latency and token usage
+
+        Args:
+            messages (List): LangChain messages
+            tier (str): Tier to call
+
+        Returns:
+            str: Response content
+        """
+        start = time.perf_counter()
+        try:
+            response = self.llms[tier].invoke(messages)
+        except Exception:
+            self._record(tier, time.perf_counter() - start, error=True)
+            raise
+
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        self._record(
+            tier,
+            time.perf_counter() - start,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+        return response.content
+
+    def stream(self, messages: List, tier: str, json_mode: bool = False) -> Iterator[str]:
+        """
+        Stream the model's response for a tier, recording latency like invoke()
+
+        Args:
+            messages (List): LangChain messages
+            tier (str): Tier to call
+            json_mode (bool): Ask the model for a single JSON object
+
+        Yields:
+            str: Response content pieces as they arrive
+        """
+        llm = self.llms[tier]
+        if json_mode:
+            llm = llm.bind(response_format={"type": "json_object"})
+
+        start = time.perf_counter()
+        first_token = True
+        usage = {}
+        try:
+            for chunk in llm.stream(messages):
+                if first_token:
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, tier=tier, model=self.models[tier])
+                    first_token = False
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if chunk.content:
+                    yield chunk.content
+        except Exception:
+            self._record(tier, time.perf_counter() - start, error=True)
+            raise
+
+        self._record(
+            tier,
+            time.perf_counter() - start,
+            prompt_tokens=usage.get("input_tokens", 0),
+            completion_tokens=usage.get("output_tokens", 0),
+        )
+
+    def invoke_validated(self, messages: List, tier: str, is_valid: Callable[[str], bool]) -> str:
+        """
+        Call the model for a tier, retrying once on the large model when the
+        small model errors or its output fails validation
+
+        Args:
+            messages (List): LangChain messages
+            tier (str): Initial tier
+            is_valid (Callable): Returns True when the response is usable
+
+        Returns:
+            str: Response content
+        """
+        if tier != SMALL_TIER:
+            return self.invoke(messages, tier)
+
+        try:
+            content = self.invoke(messages, SMALL_TIER)
+            if is_valid(content):
+                return content
+        except Exception as e:
+            print(f"Small model failed, escalating: {str(e)}")
+
+        self.record_escalation(SMALL_TIER)
+        return self.invoke(messages, LARGE_TIER)
+
+    def _record(self, tier: str, elapsed: float, error: bool = False,
+                prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        model = self.models[tier]
+        LLM_SECONDS.observe(elapsed, tier=tier, model=model)
+        if error:
+            LLM_ERRORS.inc(tier=tier, model=model)
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, tier=tier, model=model, kind="prompt")
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, tier=tier, model=model, kind="completion")
+
+        with self._lock:
+            stats = self.tier_stats[tier]
+            stats["calls"] += 1
+            stats["latency_seconds_total"] += elapsed
+            stats["prompt_tokens"] += prompt_tokens or 0
+            stats["completion_tokens"] += completion_tokens or 0
+            if error:
+                stats["errors"] += 1
+
+    def record_escalation(self, tier: str) -> None:
+        """Count a call that gave up on a tier, for callers escalating on their own"""
+        LLM_ESCALATIONS.inc(tier=tier, model=self.models[tier])
+        with self._lock:
+            self.tier_stats[tier]["escalations"] += 1
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Snapshot of per-tier call counts, latency and token usage
+
+        Returns:
+            Dict[str, Dict]: Stats keyed by tier
+        """
+        with self._lock:
+            return {tier: dict(stats) for tier, stats in self.tier_stats.items()}
@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PROFILES_WRITTEN = REGISTRY.counter(
+    "timetable_profiles_written_total",
+    "Request traces written to disk, by reason (slow, requested)"
+)
+
+REQUEST_ID: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+_CURRENT: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("request_profile", default=None)
+
+Handler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]
+
+MAX_STACK_DEPTH = 64
+
+
+def current_request_id() -> str:
+    return REQUEST_ID.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current correlation ID to log records as %(request_id)s."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = REQUEST_ID.get()
+        return True
+
+
+def install_log_filter() -> None:
+    """Attach the request ID filter to every root handler."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, RequestIdFilter) for f in handler.filters):
+            handler.addFilter(RequestIdFilter())
+
+
+class RequestProfile:
+    def __init__(self, request_id: str, handler: str, user_id: Optional[int], requested: bool):
+        self.request_id = request_id
+        self.handler = handler
+        self.user_id = user_id
+        self.requested = requested
+        self.started = time.time()
+        self.started_perf = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.samples: Counter = Counter()
+        self._threads: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def enter_thread(self) -> None:
+        with self._lock:
+            self._threads[threading.get_ident()] += 1
+
+    def exit_thread(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def threads(self) -> Set[int]:
+        with self._lock:
+            return set(self._threads)
+
+    def to_dict(self, duration: float) -> Dict:
+        total = sum(self.samples.values())
+        return {
+            "request_id": self.request_id,
+            "handler": self.handler,
+            "user_id": self.user_id,
+            "requested": self.requested,
+            "started_at": self.started,
+            "duration_seconds": duration,
+            "spans": self.spans,
+            "sample_count": total,
+            # Folded stacks ("root;...;leaf" -> count), the input format of most flame graph tools
+            "stacks": [{"stack": stack, "count": count} for stack, count in self.samples.most_common()],
+        }
+
+
+@contextmanager
+def trace_span(name: str):
+    """
+    Record a timed span on the current request's trace, if there is one, and let
+    the sampler see this thread while the span is open
+    """
+    profile = _CURRENT.get()
+    if profile is None:
+        yield
+        return
+
+    profile.enter_thread()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        profile.exit_thread()
+        with profile._lock:
+            profile.spans.append({
+                "name": name,
+                "offset_seconds": start - profile.started_perf,
+                "seconds": elapsed,
+                "thread": threading.current_thread().name,
+            })
+
+
+def traced(name: str):
+    """Decorator form of trace_span for pipeline methods."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _fold_stack(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class RequestProfiler:
+    def __init__(self, directory: str = "./profiles", threshold_seconds: float = 5.0,
+                 sample_interval: float = 0.01, max_traces: int = 200, profiled_users=None):
+        """
+        Sample the worker threads of every in-flight upload or query and keep the
+        trace when the request turns out slow, or when an admin asked for its user.
+
+        Only threads inside a trace_span are sampled; the event loop thread is
+        shared by every request, so time spent there shows up in the spans instead.
+
+        Args:
+            directory (str): Where trace files are written
+            threshold_seconds (float): Requests slower than this are written, 0 only writes requested users
+            sample_interval (float): Seconds between stack samples
+            max_traces (int): Oldest trace files are deleted beyond this
+            profiled_users: Container of user IDs whose every request is traced
+        """
+        self.directory = directory
+        self.threshold_seconds = threshold_seconds
+        self.sample_interval = sample_interval
+        self.max_traces = max(1, max_traces)
+        self.profiled_users = profiled_users if profiled_users is not None else set()
+
+        self._active: Dict[str, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def _sample_loop(self) -> None:
+        while True:
+            with self._lock:
+                profiles = list(self._active.values())
+            if not profiles:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            frames = sys._current_frames()
+            for profile in profiles:
+                for ident in profile.threads():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.samples[_fold_stack(frame)] += 1
+            del frames
+            time.sleep(self.sample_interval)
+
+    def wrap(self, handler: Handler, name: str) -> Handler:
+        """
+        Wrap a handler so each call gets a correlation ID and a profile
+        """
+        async def profiled(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            user_id = update.effective_user.id if update.effective_user else None
+            request_id = uuid.uuid4().hex[:12]
+            profile = RequestProfile(request_id, name, user_id, user_id in self.profiled_users)
+
+            id_token = REQUEST_ID.set(request_id)
+            profile_token = _CURRENT.set(profile)
+            with self._lock:
+                self._active[request_id] = profile
+            self._wake.set()
+
+            start = time.perf_counter()
+            try:
+                await handler(update, context)
+            finally:
+                duration = time.perf_counter() - start
+                with self._lock:
+                    self._active.pop(request_id, None)
+                _CURRENT.reset(profile_token)
+
+                try:
+                    slow = self.threshold_seconds > 0 and duration >= self.threshold_seconds
+                    if slow or profile.requested:
+                        reason = "requested" if profile.requested else "slow"
+                        await asyncio.to_thread(self.write_trace, profile, duration, reason)
+                finally:
+                    REQUEST_ID.reset(id_token)
+
+        profiled.__name__ = getattr(handler, "__name__", "profiled")
+        return profiled
+
+    def write_trace(self, profile: RequestProfile, duration: float, reason: str) -> Optional[str]:
+        """
+        Write one trace as JSON and rotate old ones out
+
+        Returns:
+            Optional[str]: Path of the trace file, None if writing failed
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(profile.started))
+            path = os.path.join(self.directory, f"{stamp}-{profile.handler}-{profile.request_id}.json")
+            data = profile.to_dict(duration)
+            data["reason"] = reason
+            with open(path, "w") as f:
+                json.dump(data, f, indent=2)
+
+            PROFILES_WRITTEN.inc(reason=reason)
+            logger.info(f"Wrote {reason} {profile.handler} trace ({duration:.2f}s) to {path}")
+            self._rotate()
+            return path
+        except Exception as e:
+            logger.error(f"Could not write trace {profile.request_id}: {str(e)}")
+            return None
+
+    def _rotate(self) -> None:
+        traces = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")),
+            key=os.path.getmtime
+        )
+        for path in traces[:-self.max_traces]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def recent_traces(self, limit: int = 5) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted(names, reverse=True)[:limit]
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from metrics import REGISTRY, record_cache
+
+RESULT_CACHE_ENTRIES = REGISTRY.gauge(
+    "timetable_result_cache_entries",
+    "Entries held in the persistent result cache, by kind"
+)
+
+
+def content_hash(*parts) -> str:
+    """sha256 over bytes or str parts, separated so ("ab", "c") != ("a", "bc")."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: str, kind: str, max_entries: int = 100000):
+        """
+        Persistent cache of pipeline results (OCR text, structured timetables)
+        keyed by a content hash, shared by live uploads, workers and bulk ingest
+
+        Args:
+            path (str): SQLite file; several kinds can share it
+            kind (str): Result kind, also the metrics cache name, e.g. "extraction"
+            max_entries (int): Least recently used entries of this kind are evicted beyond this
+        """
+        self.path = path
+        self.kind = kind
+        self.max_entries = max(1, max_entries)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (kind, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (kind, last_used)")
+        RESULT_CACHE_ENTRIES.set(self._count(), kind=kind)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM results WHERE kind = ?", (self.kind,)).fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM results WHERE kind = ? AND key = ?", (self.kind, key)).fetchone()
+        record_cache(self.kind, row is not None)
+        if row is None:
+            return None
+        conn.execute("UPDATE results SET last_used = ? WHERE kind = ? AND key = ?", (time.time(), self.kind, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (kind, key, value, last_used) VALUES (?, ?, ?, ?)",
+            (self.kind, key, json.dumps(value), time.time())
+        )
+
+        count = self._count()
+        if count > self.max_entries:
+            # Evict down to 90% so we don't pay for an eviction on every insert
+            excess = count - int(self.max_entries * 0.9)
+            conn.execute(
+                "DELETE FROM results WHERE kind = ? AND key IN ("
+                " SELECT key FROM results WHERE kind = ? ORDER BY last_used LIMIT ?)",
+                (self.kind, self.kind, excess)
+            )
+            count -= excess
+        RESULT_CACHE_ENTRIES.set(count, kind=self.kind)
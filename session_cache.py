@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Tuple
+
+from metrics import REGISTRY, record_cache
+from state_store import SQLiteStateStore
+
+SESSION_RESIDENT_ENTRIES = REGISTRY.gauge(
+    "timetable_session_resident_entries",
+    "Per-user session entries held in memory"
+)
+SESSION_RESIDENT_BYTES = REGISTRY.gauge(
+    "timetable_session_resident_bytes",
+    "Approximate JSON size of per-user session entries held in memory"
+)
+SESSION_EVICTIONS = REGISTRY.counter(
+    "timetable_session_evictions_total",
+    "Session entries spilled to disk, by reason (capacity, idle)"
+)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "last_used", "dirty")
+
+    def __init__(self, value: Any, dirty: bool):
+        self.value = value
+        self.size = len(json.dumps(value))
+        self.last_used = time.monotonic()
+        self.dirty = dirty
+
+
+class SessionCache(MutableMapping):
+    def __init__(self, store: SQLiteStateStore, namespace: str, max_entries: int = 10000,
+                 max_bytes: int = 0, idle_seconds: float = 3600):
+        """
+        Dict-like per-user state that keeps only recently active users in memory.
+
+        Entries are written back to the store when they are evicted (least
+        recently used first, or after sitting idle) and reloaded on the user's
+        next access, so memory stays flat however many users are dormant.
+
+        Args:
+            store (SQLiteStateStore): Where cold entries live
+            namespace (str): Store namespace, e.g. "timetables"
+            max_entries (int): Resident entry cap, 0 for no cap
+            max_bytes (int): Resident size cap (JSON bytes), 0 for no cap
+            idle_seconds (float): Entries unused this long are spilled, 0 keeps them
+        """
+        self.store = store
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+
+        self._lock = threading.RLock()
+        self._resident: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._resident_bytes = 0
+
+    def _spill(self, key: int, reason: str) -> None:
+        entry = self._resident.pop(key)
+        self._resident_bytes -= entry.size
+        if entry.dirty:
+            self.store.set(self.namespace, key, entry.value)
+        SESSION_EVICTIONS.inc(namespace=self.namespace, reason=reason)
+
+    def _evict(self) -> None:
+        if self.idle_seconds:
+            cutoff = time.monotonic() - self.idle_seconds
+            # Resident entries are kept in access order, so the idle ones are at the front
+            while self._resident:
+                key, entry = next(iter(self._resident.items()))
+                if entry.last_used >= cutoff:
+                    break
+                self._spill(key, "idle")
+
+        while self._resident and (
+            (self.max_entries and len(self._resident) > self.max_entries)
+            or (self.max_bytes and self._resident_bytes > self.max_bytes)
+        ):
+            self._spill(next(iter(self._resident)), "capacity")
+
+        SESSION_RESIDENT_ENTRIES.set(len(self._resident), namespace=self.namespace)
+        SESSION_RESIDENT_BYTES.set(self._resident_bytes, namespace=self.namespace)
+
+    def _put(self, key: int, value: Any, dirty: bool) -> None:
+        old = self._resident.pop(key, None)
+        if old is not None:
+            self._resident_bytes -= old.size
+        entry = _Entry(value, dirty)
+        self._resident[key] = entry
+        self._resident_bytes += entry.size
+        self._evict()
+
+    def __getitem__(self, key: int) -> Any:
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                record_cache("session", True)
+                entry.last_used = time.monotonic()
+                self._resident.move_to_end(key)
+                return entry.value
+
+            record_cache("session", False)
+            value = self.store.get(self.namespace, key)
+            if value is None and not self.store.contains(self.namespace, key):
+                raise KeyError(key)
+            self._put(key, value, dirty=False)
+            return value
+
+    def __setitem__(self, key: int, value: Any) -> None:
+        with self._lock:
+            self._put(key, value, dirty=True)
+
+    def __delitem__(self, key: int) -> None:
+        with self._lock:
+            entry = self._resident.pop(key, None)
+            if entry is not None:
+                self._resident_bytes -= entry.size
+            stored = self.store.delete(self.namespace, key)
+            if entry is None and not stored:
+                raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            if key in self._resident:
+                return True
+        return isinstance(key, int) and self.store.contains(self.namespace, key)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.keys_snapshot())
+
+    def __len__(self) -> int:
+        return len(self.keys_snapshot())
+
+    def keys_snapshot(self) -> List[int]:
+        with self._lock:
+            resident = list(self._resident)
+        return list(dict.fromkeys(resident + self.store.keys(self.namespace)))
+
+    def items(self) -> List[Tuple[int, Any]]:
+        # Reads cold entries straight from the store without making them resident
+        with self._lock:
+            resident = {key: entry.value for key, entry in self._resident.items()}
+        cold = [(key, value) for key, value in self.store.items(self.namespace) if key not in resident]
+        return list(resident.items()) + cold
+
+    def changed_since(self, since: float) -> List[Tuple[int, Any]]:
+        with self._lock:
+            dirty = {key: entry.value for key, entry in self._resident.items() if entry.dirty}
+        stored = [(key, value) for key, value in self.store.changed_since(self.namespace, since) if key not in dirty]
+        return list(dirty.items()) + stored
+
+    def flush(self) -> None:
+        """Write every modified resident entry back to the store."""
+        with self._lock:
+            for key, entry in self._resident.items():
+                if entry.dirty:
+                    self.store.set(self.namespace, key, entry.value)
+                    entry.dirty = False
+
+    def resident_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._resident), "bytes": self._resident_bytes}
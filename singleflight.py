@@ -0,0 +1,78 @@
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from metrics import REGISTRY
+
+SINGLEFLIGHT_SAVED = REGISTRY.counter(
+    "timetable_singleflight_saved_total",
+    "Calls that waited on an identical in-flight call instead of running, by kind"
+)
+
+
+class SingleFlight:
+    def __init__(self, kind: str):
+        """
+        Coalesce identical concurrent calls: the first caller for a key runs the
+        work, everyone arriving while it runs waits for the same result.
+
+        Nothing is kept once a call finishes; caching is the result caches' job,
+        this only covers the window before a cache could have been filled, e.g. a
+        class group all uploading the same photo within a minute.
+
+        Args:
+            kind (str): Metrics label, e.g. "extraction"
+        """
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+
+    def begin(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Join the call for key, or start it
+
+        Returns:
+            Tuple[Future, bool]: The shared future, and whether the caller leads
+                and so must call finish()
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                SINGLEFLIGHT_SAVED.inc(kind=self.kind)
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run func once for every concurrent caller with the same key
+
+        Followers get a copy of the leader's result, or its exception re-raised.
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            # A copy, since callers go on to store and edit their own timetable
+            return copy.deepcopy(future.result())
+
+        try:
+            result = func()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._inflight)
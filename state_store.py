@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import MutableMapping
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStateStore:
+    def __init__(self, path: str = "./bot_state.sqlite3"):
+        """
+        Shared key/value store for per-user bot state, plus leases for leader election.
+
+        SQLite stands in for a networked store here: every worker process on a host
+        opens the same file, and the schema is small enough to port to Redis or Postgres.
+
+        Args:
+            path (str): Database file shared by all workers
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " namespace TEXT NOT NULL, key INTEGER NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; handlers touch state from the loop and from worker threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: int) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def contains(self, namespace: str, key: int) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return row is not None
+
+    def set(self, namespace: str, key: int, value: Any) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time.time())
+        )
+
+    def updated_at(self, namespace: str, key: int) -> Optional[float]:
+        """When an entry was last written, None if it doesn't exist"""
+        row = self._conn().execute(
+            "SELECT updated_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, namespace: str, key: int) -> bool:
+        cursor = self._conn().execute(
+            "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        return cursor.rowcount > 0
+
+    def keys(self, namespace: str) -> List[int]:
+        rows = self._conn().execute("SELECT key FROM kv WHERE namespace = ?", (namespace,)).fetchall()
+        return [row[0] for row in rows]
+
+    def items(self, namespace: str) -> List[Tuple[int, Any]]:
+        rows = self._conn().execute("SELECT key, value FROM kv WHERE namespace = ?", (namespace,)).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def changed_since(self, namespace: str, since: float) -> List[Tuple[int, Any]]:
+        """
+        Entries written after a timestamp, for consumers that sync incrementally
+        """
+        rows = self._conn().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND updated_at > ?", (namespace, since)
+        ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def count(self, namespace: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM kv WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def try_acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """
+        Take or renew a named lease if it is free, expired, or already ours
+
+        Args:
+            name (str): Lease name, e.g. "reminder-scheduler"
+            holder (str): Unique ID of the caller
+            ttl (float): Seconds the lease stays valid without renewal
+
+        Returns:
+            bool: True if the caller holds the lease afterwards
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is None or row[0] == holder or row[1] < now:
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                    (name, holder, now + ttl)
+                )
+                acquired = True
+            else:
+                acquired = False
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def release_lease(self, name: str, holder: str) -> None:
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+
+class StoreMapping(MutableMapping):
+    def __init__(self, store: SQLiteStateStore, namespace: str):
+        """
+        Dict-like view of one namespace, so handlers can keep using
+        `self.user_timetables[user_id]` whether state is local or shared
+        """
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key: int) -> Any:
+        value = self.store.get(self.namespace, key)
+        if value is None and not self.store.contains(self.namespace, key):
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: int, value: Any) -> None:
+        self.store.set(self.namespace, key, value)
+
+    def __delitem__(self, key: int) -> None:
+        if not self.store.delete(self.namespace, key):
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, int) and self.store.contains(self.namespace, key)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.store.keys(self.namespace))
+
+    def __len__(self) -> int:
+        return self.store.count(self.namespace)
+
+    def items(self):
+        return self.store.items(self.namespace)
+
+    def changed_since(self, since: float) -> List[Tuple[int, Any]]:
+        return self.store.changed_since(self.namespace, since)
+
+    def updated_at(self, key: int) -> Optional[float]:
+        return self.store.updated_at(self.namespace, key)
+
+
+class LeaderElector:
+    def __init__(self, store: SQLiteStateStore, name: str, ttl: float = 30.0,
+                 on_change: Optional[Callable[[bool], None]] = None):
+        """
+        Keep trying to hold a lease in a background thread
+
+        Args:
+            store (SQLiteStateStore): Store holding the lease
+            name (str): Lease name
+            ttl (float): Lease lifetime; renewed every ttl / 3 seconds
+            on_change (Callable): Called with True/False when leadership changes
+        """
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.on_change = on_change
+        self.holder = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _tick(self) -> None:
+        try:
+            leader = self.store.try_acquire_lease(self.name, self.holder, self.ttl)
+        except Exception as e:
+            logger.error(f"Lease renewal failed: {str(e)}")
+            leader = False
+
+        if leader != self.is_leader:
+            self.is_leader = leader
+            logger.info(f"{self.holder} {'acquired' if leader else 'lost'} lease {self.name}")
+            if self.on_change:
+                self.on_change(leader)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._tick()
+            self._stop.wait(self.ttl / 3)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.is_leader:
+            self.store.release_lease(self.name, self.holder)
+            self.is_leader = False
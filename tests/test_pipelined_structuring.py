@@ -0,0 +1,142 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain")
+
+from llm import TimetableProcessor
+from main import TimetableBot
+from model_router import LARGE_TIER, SMALL_TIER
+
+TIMETABLE = {
+    "Monday": [{"time": "9:00-9:55", "subject": "DSA", "full_name": "Data Structures", "type": "Theory"}],
+    "Tuesday": [{"time": "10:00-10:55", "subject": "OS", "full_name": "Operating Systems", "type": "Lab"}],
+}
+
+
+class FakeRouter:
+    models = {SMALL_TIER: "small-model", LARGE_TIER: "large-model"}
+
+    def __init__(self, streamed: str, invoked: str = "{}"):
+        self.streamed = streamed
+        self.invoked = invoked
+        self.escalations = []
+        self.invoked_tiers = []
+
+    def choose_structuring_tier(self, extracted_text):
+        return SMALL_TIER
+
+    def stream(self, messages, tier, json_mode=False):
+        # A few characters at a time, so days complete across chunks
+        for start in range(0, len(self.streamed), 7):
+            yield self.streamed[start:start + 7]
+
+    def invoke_validated(self, messages, tier, is_valid):
+        self.invoked_tiers.append(tier)
+        return self.invoked
+
+    def record_escalation(self, tier):
+        self.escalations.append(tier)
+
+
+class FakeResultCache:
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+
+class FakeStore:
+    def __init__(self):
+        self.encoded = []
+        self.replaced = []
+
+    def encode_documents(self, documents, encoded=None):
+        self.encoded.extend(documents)
+        return [[float(len(doc))] for doc in documents]
+
+    def replace_timetable(self, timetable_data, user_id, encoded=None):
+        self.replaced.append((timetable_data, user_id, dict(encoded or {})))
+
+
+class FakeMessage:
+    def __init__(self):
+        self.texts = []
+
+    async def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+class FakeUpdate:
+    def __init__(self):
+        self.message = FakeMessage()
+
+
+def make_bot(router, result_cache=None):
+    # Only what _structure_pipelined touches; the rest of __init__ needs real services
+    bot = TimetableBot.__new__(TimetableBot)
+    bot.timetable_processor = TimetableProcessor("gsk-test", router, result_cache)
+    bot.embedding_store = FakeStore()
+    return bot
+
+
+def structure(bot, text="Monday DSA 9:00"):
+    update = FakeUpdate()
+    result = asyncio.run(bot._structure_pipelined(update, 42, text))
+    return result, update
+
+
+def test_streamed_timetable_is_staged_then_swapped_in():
+    bot = make_bot(FakeRouter(json.dumps(TIMETABLE)))
+    result, update = structure(bot)
+
+    assert result == TIMETABLE
+    assert update.message.texts, "no preview was sent"
+    [(stored, user_id, encoded)] = bot.embedding_store.replaced
+    assert stored == TIMETABLE and user_id == 42
+    # Every day was encoded while streaming, ahead of the swap
+    assert len(encoded) == 2 and set(encoded) == set(bot.embedding_store.encoded)
+
+
+def test_cached_timetable_is_previewed_and_stored():
+    router = FakeRouter("")
+    processor = TimetableProcessor("gsk-test", router)
+    text = "Monday DSA 9:00"
+    bot = make_bot(router, FakeResultCache({processor.cache_key(text): TIMETABLE}))
+    result, update = structure(bot, text)
+
+    assert result == TIMETABLE
+    assert update.message.texts
+    assert bot.embedding_store.replaced[0][0] == TIMETABLE
+
+
+def test_truncated_small_stream_escalates_before_storing():
+    truncated = json.dumps(TIMETABLE)[:-40]
+    large = {"Monday": TIMETABLE["Monday"]}
+    router = FakeRouter(truncated, json.dumps(large))
+    bot = make_bot(router)
+    result, _ = structure(bot)
+
+    assert router.escalations == [SMALL_TIER]
+    assert router.invoked_tiers == [LARGE_TIER]
+    assert result == large
+    assert [stored for stored, _, _ in bot.embedding_store.replaced] == [large]
+
+
+def test_invalid_result_leaves_old_rows_alone():
+    bot = make_bot(FakeRouter('{"Monday": [], "Tuesday": []}'))
+    result, _ = structure(bot)
+
+    assert result == {}
+    assert bot.embedding_store.replaced == []
@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram import Chat, Message, Update, User
+
+from admission import AdmissionController
+from update_processor import UserOrderedUpdateProcessor
+
+
+class FakeBot:
+    """Takes the "you're queued" replies admission sends while a job waits."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, *args, **kwargs):
+        self.sent.append(kwargs.get("text"))
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = User(user_id, f"User{user_id}", False)
+    message = Message(update_id, datetime.now(), Chat(user_id, "private"), from_user=user)
+    message.set_bot(FakeBot())
+    return Update(update_id, message=message)
+
+
+async def dispatch(processor, handlers):
+    """Feed (handler, update) pairs to the processor in order, like the application does."""
+    await processor.initialize()
+    tasks = []
+    for handler, update in handlers:
+        tasks.append(asyncio.create_task(processor.process_update(update, handler(update, None))))
+        await asyncio.sleep(0)  # the application creates one task per update as they arrive
+    await asyncio.gather(*tasks)
+
+
+def test_command_waits_for_queued_upload():
+    log = []
+    admission = AdmissionController(max_concurrent=4)
+
+    async def upload(update, context):
+        await asyncio.sleep(0.05)
+        log.append("upload")
+
+    async def delete(update, context):
+        log.append("delete")
+
+    asyncio.run(dispatch(UserOrderedUpdateProcessor(4), [
+        (admission.wrap(upload, "upload", supersede=True), make_update(1, 7)),
+        (admission.ordered(delete), make_update(2, 7)),
+    ]))
+
+    assert log == ["upload", "delete"]
+
+
+def test_newer_upload_still_supersedes_queued_one():
+    log = []
+    admission = AdmissionController(max_concurrent=4)
+
+    async def upload(update, context):
+        await asyncio.sleep(0.05)
+        log.append(update.update_id)
+
+    wrapped = admission.wrap(upload, "upload", supersede=True)
+    asyncio.run(dispatch(UserOrderedUpdateProcessor(4), [
+        (wrapped, make_update(1, 7)),
+        (wrapped, make_update(2, 7)),
+    ]))
+
+    assert log == [2]
+
+
+def test_other_users_do_not_wait_for_a_queued_upload():
+    log = []
+    admission = AdmissionController(max_concurrent=4)
+
+    async def upload(update, context):
+        await asyncio.sleep(0.05)
+        log.append(("upload", update.effective_user.id))
+
+    async def schedule(update, context):
+        log.append(("schedule", update.effective_user.id))
+
+    asyncio.run(dispatch(UserOrderedUpdateProcessor(4), [
+        (admission.wrap(upload, "upload", supersede=True), make_update(1, 7)),
+        (admission.ordered(schedule), make_update(2, 8)),
+        (admission.ordered(schedule), make_update(3, 7)),
+    ]))
+
+    assert log == [("schedule", 8), ("upload", 7), ("schedule", 7)]
@@ -4,15 +4,35 @@ from PIL import Image
 import requests
 from llama_parse import LlamaParse
 import os
-from typing import Optional
+import tempfile
+from typing import List, Optional
+
+from profiling import traced
+from result_cache import content_hash
+from singleflight import SingleFlight
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    # Without pypdf a PDF is sent to LlamaParse as a single document
+    PdfReader = PdfWriter = None
 
 class TextExtractor:
-    def __init__(self, llama_cloud_api_key: str):
+    def __init__(self, llama_cloud_api_key: str, base_url: Optional[str] = None, compute_pool=None,
+                 result_cache=None):
         
+        # Image decoding runs in the compute pool when one is given
+        self.compute_pool = compute_pool
+        # Extracted text keyed by a hash of the uploaded bytes, so a re-sent file skips LlamaParse
+        self.result_cache = result_cache
+        # Identical uploads arriving together (a group chat sharing one photo) share one parse
+        self.inflight = SingleFlight("extraction")
+        extra = {"base_url": base_url} if base_url else {}
         self.parser = LlamaParse(
             api_key=llama_cloud_api_key,
             result_type="text",  # "markdown" and "text" are available
             verbose=True,
+            **extra
         )
     
     def extract_from_image(self, image_path: str) -> str:
@@ -32,28 +52,127 @@ class TextExtractor:
             print(f"Error extracting text: {str(e)}")
             return ""
     
+    def _cached(self, key: str) -> Optional[str]:
+        if self.result_cache is None:
+            return None
+        try:
+            return self.result_cache.get(key)
+        except Exception as e:
+            print(f"Error reading extraction cache: {str(e)}")
+            return None
+    
+    def _remember(self, key: str, text: str) -> str:
+        # Empty text usually means LlamaParse failed, which is worth retrying next time
+        if self.result_cache is not None and text:
+            try:
+                self.result_cache.set(key, text)
+            except Exception as e:
+                print(f"Error writing extraction cache: {str(e)}")
+        return text
+    
+    @traced("ocr.photo")
     def extract_from_telegram_photo(self, photo_bytes: bytes) -> str:
         
+        key = content_hash("photo", photo_bytes)
+        return self.inflight.do(key, lambda: self._cached(key) or self._remember(key, self._extract_photo(photo_bytes)))
+    
+    def _extract_photo(self, photo_bytes: bytes) -> str:
+        
+        temp_path = None
         try:
-            # Save bytes to temporary file
-            temp_path = "temp_timetable.jpg"
+            # Save bytes to a unique temporary file so concurrent uploads don't clash
+            with tempfile.NamedTemporaryFile(prefix="timetable_", suffix=".jpg", delete=False) as temp_file:
+                temp_path = temp_file.name
             
             # Convert bytes to image and save
-            image = Image.open(BytesIO(photo_bytes))
-            image.save(temp_path)
+            if self.compute_pool is not None:
+                with open(temp_path, "wb") as f:
+                    f.write(self.compute_pool.normalize_image(photo_bytes))
+            else:
+                image = Image.open(BytesIO(photo_bytes))
+                if image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                image.save(temp_path)
             
             # Extract text
-            extracted_text = self.extract_from_image(temp_path)
-            
+            return self.extract_from_image(temp_path)
+        
+        except Exception as e:
+            print(f"Error processing Telegram photo: {str(e)}")
+            return ""
+        
+        finally:
             # Clean up temp file
-            if os.path.exists(temp_path):
+            if temp_path and os.path.exists(temp_path):
                 os.remove(temp_path)
+    
+    @traced("ocr.document")
+    def extract_from_bytes(self, data: bytes, suffix: str, cache_key: Optional[str] = None) -> str:
+        """
+        Extract text from an uploaded file (e.g. a single PDF page)
+        
+        Args:
+            data (bytes): File contents
+            suffix (str): File extension LlamaParse uses to detect the type, e.g. ".pdf"
+            cache_key (str): Stable identity of the content, defaults to a hash of data.
+                Pages split out of a PDF should pass one, since re-written page bytes can differ run to run
             
-            return extracted_text
+        Returns:
+            str: Extracted text, empty on failure
+        """
+        key = cache_key or content_hash("file", suffix, data)
+        return self.inflight.do(key, lambda: self._cached(key) or self._remember(key, self._extract_file(data, suffix)))
+    
+    def _extract_file(self, data: bytes, suffix: str) -> str:
+        
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(prefix="timetable_", suffix=suffix, delete=False) as temp_file:
+                temp_file.write(data)
+                temp_path = temp_file.name
+            
+            return self.extract_from_image(temp_path)
         
         except Exception as e:
-            print(f"Error processing Telegram photo: {str(e)}")
+            print(f"Error processing uploaded file: {str(e)}")
             return ""
+        
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def pdf_page_key(self, pdf_bytes: bytes, index: int) -> str:
+        """Extraction cache key for one page of a PDF, stable across splits."""
+        return content_hash("pdf", pdf_bytes, index)
+    
+    def split_pdf_pages(self, pdf_bytes: bytes, max_pages: int = 20) -> List[bytes]:
+        """
+        Split a PDF into single-page PDFs so pages can be extracted concurrently
+        
+        Args:
+            pdf_bytes (bytes): PDF contents
+            max_pages (int): Pages beyond this are ignored
+            
+        Returns:
+            List[bytes]: One PDF per page, or the whole PDF if it cannot be split
+        """
+        if PdfReader is None:
+            return [pdf_bytes]
+        
+        try:
+            reader = PdfReader(BytesIO(pdf_bytes))
+            pages = []
+            for page in reader.pages[:max_pages]:
+                writer = PdfWriter()
+                writer.add_page(page)
+                output = BytesIO()
+                writer.write(output)
+                pages.append(output.getvalue())
+            return pages or [pdf_bytes]
+        
+        except Exception as e:
+            print(f"Error splitting PDF: {str(e)}")
+            return [pdf_bytes]
     
     def preprocess_text(self, text: str) -> str:
         
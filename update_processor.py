@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+from typing import Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import REGISTRY
+
+UPDATES_WAITING = REGISTRY.gauge(
+    "timetable_updates_waiting",
+    "Updates waiting for an earlier update from the same user, or for a free worker"
+)
+
+# Updates waiting for their user's turn don't hold a worker, so PTB's own limit
+# only caps how many can be pending at once
+MAX_PENDING_UPDATES = 100000
+
+_HANDOFF: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar("update_handoff", default=None)
+
+
+def hand_off_update() -> None:
+    """
+    Let the current user's next update start although this one is still running.
+
+    For handlers that queue their work somewhere that keeps per-user order
+    itself (the admission controller); a no-op outside UserOrderedUpdateProcessor.
+    Handlers that don't go through that queue must wait for it instead
+    (AdmissionController.ordered), or they can overtake the queued work.
+    """
+    release = _HANDOFF.get()
+    if release is not None:
+        release()
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int):
+        """
+        Process different users' updates concurrently while each user's updates
+        run one at a time, in the order they arrived, so the per-user state
+        machine (/upload then photo, /settime then the time) never sees a reply
+        before its command.
+
+        Args:
+            max_concurrent_updates (int): Updates running at once across all users
+        """
+        # PTB's own semaphore is held from arrival, including while an update waits
+        # for its user; workers are only taken once it is that user's turn, so a
+        # burst from one user can't keep anyone else waiting
+        super().__init__(MAX_PENDING_UPDATES)
+        self.workers = max(1, max_concurrent_updates)
+        self._slots = asyncio.BoundedSemaphore(self.workers)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_pending: Dict[int, int] = {}
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        user_id = self.ordering_key(update)
+        lock = None
+        if user_id is not None:
+            lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+            self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+
+        held = {"lock": False, "slot": False}
+
+        def release() -> None:
+            if held["slot"]:
+                held["slot"] = False
+                self._slots.release()
+            if held["lock"]:
+                held["lock"] = False
+                lock.release()
+
+        started = False
+        UPDATES_WAITING.inc()
+        try:
+            # Tasks reach this point in arrival order and asyncio locks wake waiters
+            # first in, first out, so each user's updates keep their order
+            if lock is not None:
+                await lock.acquire()
+                held["lock"] = True
+            await self._slots.acquire()
+            held["slot"] = True
+            UPDATES_WAITING.dec()
+
+            token = _HANDOFF.set(release)
+            try:
+                started = True
+                await coroutine
+            finally:
+                _HANDOFF.reset(token)
+        finally:
+            if not started:
+                UPDATES_WAITING.dec()
+                coroutine.close()  # cancelled while waiting, never ran
+            release()
+            if user_id is not None:
+                self._user_pending[user_id] -= 1
+                if not self._user_pending[user_id]:
+                    del self._user_pending[user_id]
+                    del self._user_locks[user_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,95 @@
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import Callable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import AsyncHTTPServer, HTTPRequest, HTTPResponse
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_REQUESTS = REGISTRY.counter(
+    "timetable_webhook_requests_total",
+    "Webhook deliveries by result (accepted, forbidden, invalid)"
+)
+
+
+class WebhookServer:
+    def __init__(self, application: Application, host: str, port: int, path: str, secret_token: str,
+                 is_running: Optional[Callable[[], bool]] = None):
+        """
+        Receive Telegram webhook deliveries and hand them to the application's update queue
+
+        Args:
+            application (Application): Initialized PTB application
+            host (str): Listen address
+            port (int): Listen port
+            path (str): URL path Telegram posts updates to
+            secret_token (str): Expected X-Telegram-Bot-Api-Secret-Token header value
+            is_running (Callable): Health check override, defaults to application.running
+        """
+        self.application = application
+        self.path = path if path.startswith("/") else f"/{path}"
+        self.secret_token = secret_token
+        self.is_running = is_running or (lambda: self.application.running)
+        self.started_at = time.time()
+
+        self.server = AsyncHTTPServer(host, port)
+        self.server.add_route("POST", self.path, self.handle_update)
+        self.server.add_route("GET", "/healthz", self.handle_health)
+
+    @property
+    def port(self) -> int:
+        return self.server.port
+
+    async def start(self) -> None:
+        self.started_at = time.time()
+        await self.server.start()
+
+    async def stop(self) -> None:
+        await self.server.stop()
+
+    async def handle_update(self, request: HTTPRequest) -> HTTPResponse:
+        received = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(received.encode(), self.secret_token.encode()):
+            WEBHOOK_REQUESTS.inc(result="forbidden")
+            return HTTPResponse(403, b"")
+
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except Exception as e:
+            WEBHOOK_REQUESTS.inc(result="invalid")
+            logger.error(f"Invalid webhook payload: {str(e)}")
+            return HTTPResponse(400, b"")
+
+        # Acknowledge right away; the application's update processor does the work
+        await self.application.update_queue.put(update)
+        WEBHOOK_REQUESTS.inc(result="accepted")
+        return HTTPResponse(200, b"")
+
+    async def handle_health(self, request: HTTPRequest) -> HTTPResponse:
+        running = self.is_running()
+        body = {
+            "status": "ok" if running else "stopped",
+            "mode": "webhook",
+            "pending_updates": self.application.update_queue.qsize(),
+            "uptime_seconds": int(time.time() - self.started_at),
+        }
+        return HTTPResponse(200 if running else 503, json.dumps(body).encode(), content_type="application/json")
+
+
+def webhook_url(base_url: str, path: str) -> str:
+    """Join the public base URL and the webhook path."""
+    return base_url.rstrip("/") + (path if path.startswith("/") else f"/{path}")
+
+
+def resolve_secret(secret: Optional[str]) -> str:
+    """Use the configured secret, or generate one for this process."""
+    if secret:
+        return secret
+    return secrets.token_urlsafe(32)
@@ -0,0 +1,297 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+VECTOR_QUEUE_DEPTH = REGISTRY.gauge(
+    "timetable_vector_queue_depth",
+    "Vector store writes (documents added plus user deletes) waiting to be flushed"
+)
+VECTOR_FLUSH_SECONDS = REGISTRY.histogram(
+    "timetable_vector_flush_seconds",
+    "Time to write one batch of queued writes to the vector store"
+)
+VECTOR_FLUSHED = REGISTRY.counter(
+    "timetable_vector_flushed_total",
+    "Queued vector store writes flushed, by op (upsert, delete), or given up on (dropped)"
+)
+
+# A user's writes that keep failing are retried with backoff, then dropped
+MAX_FLUSH_ATTEMPTS = 5
+RETRY_BACKOFF = 1.0
+MAX_RETRY_BACKOFF = 60.0
+
+
+class PendingWrites:
+    """One user's writes that are not in the collection yet."""
+    __slots__ = ("cleared", "ids", "embeddings", "documents", "metadatas")
+
+    def __init__(self, cleared: bool = False):
+        # cleared: everything committed for the user before these adds is deleted
+        self.cleared = cleared
+        self.ids: List[str] = []
+        self.embeddings: List[List[float]] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+
+    def extend(self, other: "PendingWrites") -> None:
+        self.ids += other.ids
+        self.embeddings += other.embeddings
+        self.documents += other.documents
+        self.metadatas += other.metadatas
+
+    def depth(self) -> int:
+        return len(self.ids) + (1 if self.cleared else 0)
+
+
+def distance(a: List[float], b: List[float], space: str = "l2") -> float:
+    """Distance between two embeddings the way Chroma reports it for the collection's space."""
+    dot = sum(x * y for x, y in zip(a, b))
+    if space == "ip":
+        return 1.0 - dot
+    if space == "cosine":
+        norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+        return 1.0 - dot / norm if norm else 1.0
+    return sum((x - y) ** 2 for x, y in zip(a, b))  # squared L2, Chroma's default
+
+
+def normalize_metadata(metadata: Dict) -> Dict:
+    """
+    Metadata in the form Chroma accepts: a non-empty dict of str, int, float or
+    bool values. None becomes "" and lists or dicts (models sometimes return a
+    list of rooms) become their JSON text.
+
+    Raises:
+        ValueError: For anything else, so a bad write fails the caller instead
+            of the writer thread later on
+    """
+    if not isinstance(metadata, dict) or not metadata:
+        raise ValueError(f"Metadata must be a non-empty dict, got {metadata!r}")
+    normalized = {}
+    for key, value in metadata.items():
+        if not isinstance(key, str):
+            raise ValueError(f"Metadata key must be a string, got {key!r}")
+        if value is None:
+            value = ""
+        elif isinstance(value, (list, tuple, dict)):
+            value = json.dumps(value, ensure_ascii=False)
+        elif not isinstance(value, (str, int, float, bool)):
+            raise ValueError(f"Unsupported metadata value for {key}: {type(value).__name__}")
+        normalized[key] = value
+    return normalized
+
+
+def _then(earlier: Optional[PendingWrites], later: Optional[PendingWrites]) -> Optional[PendingWrites]:
+    """Writes equivalent to applying earlier, then later."""
+    if earlier is None or (later is not None and later.cleared):
+        return later
+    combined = PendingWrites(earlier.cleared)
+    combined.extend(earlier)
+    if later is not None:
+        combined.extend(later)
+    return combined
+
+
+class VectorWriteQueue:
+    def __init__(self, get_collection: Callable[[], Any], flush_interval: float = 0.2, max_batch: int = 500,
+                 max_attempts: int = MAX_FLUSH_ATTEMPTS):
+        """
+        Single-writer, write-behind queue for the Chroma collection.
+
+        Uploads queue their adds and deletes here and return; one thread writes
+        everything queued, across users, as one delete and a few upserts per
+        flush. A user's own queued writes stay readable through pending_for()
+        until they are committed.
+
+        If a batch fails it is written again user by user, so one bad write
+        only holds back its own user. That user's writes are then retried with
+        exponential backoff and dropped after max_attempts.
+
+        Args:
+            get_collection (Callable): Returns the current collection (the store may recreate it)
+            flush_interval (float): Seconds between flushes
+            max_batch (int): Flush early once this many documents are queued; also the upsert chunk size
+            max_attempts (int): Failed flushes of a user's writes before they are dropped
+        """
+        self.get_collection = get_collection
+        self.flush_interval = flush_interval
+        self.max_batch = max(1, max_batch)
+        self.max_attempts = max(1, max_attempts)
+        # Per user: failed flushes so far, and when the next one may be tried
+        self._attempts: Dict[Optional[int], int] = {}
+        self._retry_at: Dict[Optional[int], float] = {}
+
+        self._lock = threading.Lock()
+        self._queued: Dict[Optional[int], PendingWrites] = {}
+        # The batch being written; still pending for readers until it commits
+        self._flushing: Dict[Optional[int], PendingWrites] = {}
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="vector-writer", daemon=True)
+        self._thread.start()
+
+    def _queue(self, user_id: Optional[int], writes: PendingWrites) -> None:
+        with self._lock:
+            self._queued[user_id] = _then(self._queued.get(user_id), writes)
+            depth = self._depth()
+        if depth >= self.max_batch:
+            self._wake.set()
+
+    def _depth(self) -> int:
+        depth = sum(writes.depth() for writes in self._queued.values())
+        depth += sum(writes.depth() for writes in self._flushing.values())
+        VECTOR_QUEUE_DEPTH.set(depth)
+        return depth
+
+    def add(self, user_id: Optional[int], ids: List[str], embeddings: List[List[float]],
+            documents: List[str], metadatas: List[Dict]) -> None:
+        """
+        Queue documents for the collection
+
+        Raises:
+            ValueError: If the lists differ in length or a metadata value can't be stored
+        """
+        if not len(ids) == len(embeddings) == len(documents) == len(metadatas):
+            raise ValueError("ids, embeddings, documents and metadatas must have the same length")
+        writes = PendingWrites()
+        writes.ids, writes.embeddings, writes.documents, writes.metadatas = (
+            list(ids), list(embeddings), list(documents), [normalize_metadata(metadata) for metadata in metadatas]
+        )
+        self._queue(user_id, writes)
+
+    def delete_user(self, user_id: int) -> None:
+        # Also drops the user's queued adds, they would only be deleted again
+        self._queue(user_id, PendingWrites(cleared=True))
+
+    def pending_for(self, user_id: int) -> Optional[PendingWrites]:
+        """
+        The user's writes not yet in the collection, oldest first
+
+        Take this before reading the collection: a batch that commits in between
+        then shows up twice (callers drop duplicate IDs) instead of not at all.
+        """
+        with self._lock:
+            return _then(self._flushing.get(user_id), self._queued.get(user_id))
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Write everything queued so far
+
+        Users whose writes failed recently are skipped until their backoff has
+        passed, unless force is set.
+        """
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    user_id for user_id in self._queued
+                    if force or self._retry_at.get(user_id, 0) <= now
+                ]
+                if not due:
+                    return
+                self._flushing = {user_id: self._queued.pop(user_id) for user_id in due}
+
+            start = time.perf_counter()
+            try:
+                self._write(self._flushing)
+                failed = {}
+            except Exception as e:
+                logger.warning(f"Vector store flush failed, retrying user by user: {str(e)}")
+                failed = self._write_each(self._flushing)
+            finally:
+                VECTOR_FLUSH_SECONDS.observe(time.perf_counter() - start)
+
+            with self._lock:
+                for user_id in self._flushing:
+                    if user_id not in failed:
+                        self._attempts.pop(user_id, None)
+                        self._retry_at.pop(user_id, None)
+                for user_id, error in failed.items():
+                    self._retry_or_drop(user_id, self._flushing[user_id], error)
+                self._flushing = {}
+                self._depth()
+
+    def _write(self, batch: Dict[Optional[int], PendingWrites]) -> None:
+        collection = self.get_collection()
+
+        # Deletes first: they only cover rows committed before this batch
+        deleted = [user_id for user_id, writes in batch.items() if writes.cleared and user_id is not None]
+        if deleted:
+            where = {"user_id": deleted[0]} if len(deleted) == 1 else {"user_id": {"$in": deleted}}
+            collection.delete(where=where)
+            VECTOR_FLUSHED.inc(len(deleted), op="delete")
+
+        adds = PendingWrites()
+        for writes in batch.values():
+            adds.extend(writes)
+        # Upsert so a batch retried after a partial failure doesn't trip over its own IDs
+        for start in range(0, len(adds.ids), self.max_batch):
+            end = start + self.max_batch
+            collection.upsert(
+                ids=adds.ids[start:end],
+                embeddings=adds.embeddings[start:end],
+                documents=adds.documents[start:end],
+                metadatas=adds.metadatas[start:end]
+            )
+        if adds.ids:
+            VECTOR_FLUSHED.inc(len(adds.ids), op="upsert")
+
+    def _write_each(self, batch: Dict[Optional[int], PendingWrites]) -> Dict[Optional[int], Exception]:
+        failed = {}
+        for user_id, writes in batch.items():
+            try:
+                self._write({user_id: writes})
+            except Exception as e:
+                failed[user_id] = e
+        return failed
+
+    def _retry_or_drop(self, user_id: Optional[int], writes: PendingWrites, error: Exception) -> None:
+        # Called with _lock held
+        attempts = self._attempts.get(user_id, 0) + 1
+        if attempts >= self.max_attempts:
+            logger.error(
+                f"Dropping {len(writes.ids)} queued vector writes for user {user_id} "
+                f"after {attempts} failed flushes: {str(error)}"
+            )
+            VECTOR_FLUSHED.inc(writes.depth(), op="dropped")
+            self._attempts.pop(user_id, None)
+            self._retry_at.pop(user_id, None)
+            return
+
+        delay = min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_RETRY_BACKOFF)
+        logger.warning(f"Vector writes for user {user_id} failed, retry {attempts} in {delay:.0f}s: {str(error)}")
+        self._attempts[user_id] = attempts
+        self._retry_at[user_id] = time.monotonic() + delay
+        # Anything the user queued meanwhile goes after the failed writes
+        self._queued[user_id] = _then(writes, self._queued.get(user_id))
+
+    def discard(self) -> None:
+        """Drop everything queued, for when the whole collection is being rebuilt."""
+        with self._flush_lock:
+            with self._lock:
+                self._queued = {}
+                self._attempts = {}
+                self._retry_at = {}
+                self._depth()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        # One last try for everything, backoff or not
+        self.flush(force=True)
+        with self._lock:
+            if self._queued:
+                logger.error(f"Vector writes for {len(self._queued)} users were not flushed before shutdown")